@@ -0,0 +1,173 @@
+import os
+import socket
+
+from flask import g, request
+
+from ratelimit import RateLimiter
+
+
+def rejection(status, message, retry_after):
+    return {'message': message}, status, {'Retry-After': str(max(1, int(retry_after + 0.999)))}
+
+
+class AdmissionRule:
+    """Token-bucket limits for one route, each ``(requests, period in seconds)`` or None
+
+    ``per_route`` is one bucket shared by every caller of the route,
+    ``per_ip`` one per client address and ``per_user`` one per signed-in
+    user (anonymous requests skip it).
+    """
+
+    def __init__(self, per_route=None, per_ip=None, per_user=None):
+        self.per_route = per_route
+        self.per_ip = per_ip
+        self.per_user = per_user
+
+
+_HOST = socket.gethostname()
+
+
+def worker_id():
+    """This process, as it is known in the shared in-flight count"""
+    return f'{_HOST}:{os.getpid()}'
+
+
+def forwarded_client(remote_addr, forwarded_for, hops):
+    """The client address ``hops`` trusted proxies in front of us saw, as ProxyFix(x_for=hops) picks it
+
+    Falls back to ``remote_addr`` when there are no proxies or the header
+    has fewer entries than there are proxies (someone skipped one).
+    """
+    if not hops or not forwarded_for:
+        return remote_addr
+    addresses = [address.strip() for address in forwarded_for.split(',')]
+    return addresses[-hops] if len(addresses) >= hops else remote_addr
+
+
+class ConcurrencyLimiter:
+    """Caps the requests in progress across every worker sharing ``counter``
+
+    ``counter`` is the buckets backend, which keeps the in-flight count
+    (per process in memory, shared across workers with SQLite or Redis).
+    Past ``limit - reserved`` requests in flight only signed-in users get
+    in, so an anonymous flood can't take the last slots from customers.
+    A worker's count stops counting ``lease`` seconds after it last
+    admitted or finished a request.
+    """
+
+    def __init__(self, counter, limit, reserved=0, lease=60):
+        self.counter = counter
+        self.limit = limit
+        self.open_limit = max(0, limit - reserved)
+        self.lease = lease
+
+    def acquire(self, is_authenticated):
+        """Take a slot; ``is_authenticated()`` is only asked once the open share is in use"""
+        if self.counter.enter(worker_id(), self.open_limit, self.lease):
+            return True
+        if self.open_limit >= self.limit or not is_authenticated():
+            return False
+        return self.counter.enter(worker_id(), self.limit, self.lease)
+
+    def release(self):
+        self.counter.leave(worker_id(), self.lease)
+
+
+class AdmissionControl:
+    """Turns requests away before they reach a route, while it is still cheap to
+
+    Past ``max_concurrency`` requests in flight the pool answers 503, and
+    a request past one of its route's token buckets answers 429, both with
+    ``Retry-After``. Buckets and the in-flight count live in ``buckets``:
+    the storage backend's (per process in memory, shared across workers
+    with SQLite) or Redis, shared across nodes. Routes without a rule use ``default_rule``;
+    ``exempt`` routes (health checks, long-lived streams) skip all of it.
+    ``identify`` returns the signed-in user id for the current request,
+    or None; it is only called when a decision needs it.
+    """
+
+    def __init__(self, app=None, buckets=None, rules=None, default_rule=None, max_concurrency=0,
+                 reserved_for_users=0, exempt=(), identify=None, shed_retry_after=1):
+        self.buckets = buckets
+        self.blocking = getattr(buckets, 'blocking', False)
+        self.rules = {route: self._limiters(route, rule) for route, rule in (rules or {}).items()}
+        self.default = self._limiters('*', default_rule) if default_rule else []
+        self.concurrency = (ConcurrencyLimiter(buckets, max_concurrency, reserved_for_users)
+                            if max_concurrency else None)
+        self.exempt = frozenset(exempt)
+        self.identify = identify
+        self.shed_retry_after = shed_retry_after
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    def _limiters(self, route, rule):
+        # Narrowest first, so one noisy client runs out before the shared route bucket does
+        limiters = []
+        for scope, spec in (('ip', rule.per_ip), ('user', rule.per_user), ('route', rule.per_route)):
+            if spec:
+                limit, period = spec
+                limiters.append((scope, RateLimiter(self.buckets, f'admit:{scope}:{route}', limit, period)))
+        return limiters
+
+    # =============== DECISIONS ===============
+
+    def acquire(self, user_id):
+        """Take a concurrency slot; ``user_id()`` is called only if it matters. False when shedding"""
+        if self.concurrency is None:
+            return True
+        return self.concurrency.acquire(lambda: user_id() is not None)
+
+    def release(self):
+        if self.concurrency is not None:
+            self.concurrency.release()
+
+    def overloaded(self):
+        return rejection(503, 'Server is busy, please try again shortly', self.shed_retry_after)
+
+    def check(self, route, client_ip, user_id):
+        """None if the route's buckets let the request through, else a 429 response"""
+        for scope, limiter in self.rules.get(route, self.default):
+            if scope == 'ip':
+                key = client_ip or 'unknown'
+            elif scope == 'user':
+                key = user_id()
+                if key is None:
+                    continue
+            else:
+                key = ''
+            wait = limiter.hit(key)
+            if wait:
+                return rejection(429, 'Too many requests, please try again later', wait)
+        return None
+
+    def lazy_user_id(self, identify=None):
+        """``identify`` (default: the configured one) called at most once"""
+        identify = identify or self.identify
+        found = []
+
+        def user_id():
+            if not found:
+                found.append(identify() if identify is not None else None)
+            return found[0]
+        return user_id
+
+    # =============== FLASK ===============
+
+    def _before_request(self):
+        route = request.url_rule.rule if request.url_rule else None
+        if route is None or route in self.exempt:
+            return None
+
+        user_id = self.lazy_user_id()
+        if not self.acquire(user_id):
+            return self.overloaded()
+        g._admission_slot = True
+        return self.check(route, request.remote_addr, user_id)
+
+    def _teardown_request(self, exc):
+        if g.pop('_admission_slot', False):
+            self.release()
@@ -0,0 +1,245 @@
+from datetime import date, datetime, time
+
+from models import epoch_us, from_paise, local_datetime
+
+# Counters are kept per local calendar day for this long, then dropped
+RETENTION_DAYS = 400
+
+# Every counter is (day, dimension, key) -> [orders, items, revenue in paise]:
+# one per day overall, one per day and status, one per day and catalog option
+TOTAL, STATUS, OPTION = 'total', 'status', 'option'
+
+
+def day_of(us):
+    """Local calendar day of an epoch-microsecond time, as a date ordinal"""
+    return local_datetime(us).toordinal()
+
+
+def oldest_day(retention_days=RETENTION_DAYS):
+    """The first day still inside the retention window"""
+    return datetime.now().toordinal() - retention_days + 1
+
+
+def day_start(day):
+    """Epoch microseconds at local midnight starting a day ordinal"""
+    return epoch_us(datetime.combine(date.fromordinal(day), time()))
+
+
+def order_rows(order):
+    """(day, dimension, key, orders, items, revenue) counter changes for a new order"""
+    day = day_of(order.created)
+    items = sum(line.qty for line in order.items)
+    rows = [(day, TOTAL, '', 1, items, order.total),
+            (day, STATUS, order.status, 1, items, order.total)]
+    for line in order.items:
+        rows.append((day, OPTION, line.id, 1, line.qty, line.price * line.qty))
+    return rows
+
+
+def status_rows(order, old_status):
+    """Counter changes for an order that moved from old_status to its current status"""
+    if old_status == order.status:
+        return []
+    day = day_of(order.created)
+    items = sum(line.qty for line in order.items)
+    return [(day, STATUS, old_status, -1, -items, -order.total),
+            (day, STATUS, order.status, 1, items, order.total)]
+
+
+class OrderStats:
+    """Per-day order counters for the in-memory backends
+
+    Updated as orders are added and change status, so a dashboard query
+    reads one bucket per day in its range instead of scanning orders.
+    Not thread-safe: storage calls it under its orders lock.
+    """
+
+    def __init__(self, retention_days=RETENTION_DAYS):
+        self.retention_days = retention_days
+        self._days = {}  # day -> {(dimension, key): [orders, items, revenue]}
+
+    def __len__(self):
+        return sum(len(counters) for counters in self._days.values())
+
+    def apply(self, rows):
+        oldest = oldest_day(self.retention_days)
+        for day, dimension, key, orders, items, revenue in rows:
+            if day < oldest:
+                continue
+            counters = self._days.get(day)
+            if counters is None:
+                counters = self._days[day] = {}
+            counter = counters.get((dimension, key))
+            if counter is None:
+                counters[dimension, key] = [orders, items, revenue]
+            else:
+                counter[0] += orders
+                counter[1] += items
+                counter[2] += revenue
+
+    def add(self, order):
+        self.apply(order_rows(order))
+
+    def move(self, order, old_status):
+        self.apply(status_rows(order, old_status))
+
+    def replace(self, rows):
+        self._days = {}
+        self.apply(rows)
+
+    def query(self, first_day, last_day):
+        """(day, dimension, key, orders, items, revenue) for every counter in the range"""
+        if last_day - first_day + 1 <= len(self._days):
+            days = [day for day in range(first_day, last_day + 1) if day in self._days]
+        else:
+            days = [day for day in self._days if first_day <= day <= last_day]
+        return [(day, dimension, key, *counter)
+                for day in days for (dimension, key), counter in self._days[day].items()]
+
+    def purge(self):
+        oldest = oldest_day(self.retention_days)
+        for day in [day for day in self._days if day < oldest]:
+            del self._days[day]
+
+
+# =============== BACKFILL ===============
+
+QUARTER_HOUR = 900 * 1_000_000
+
+# NumPy takes longer to import than the rest of the app, and only backfills
+# use it, so it is imported on the first one rather than at worker start
+numpy = False
+
+def load_numpy():
+    """The numpy module, or None when it is not installed (backfills fall back to a plain loop)"""
+    global numpy
+    if numpy is False:
+        try:
+            import numpy as module
+        except ImportError:
+            module = None
+        numpy = module
+    return numpy
+
+def recompute(orders):
+    """Counters for a set of orders from scratch, as (day, dimension, key, orders, items, revenue)
+
+    Vectorized with NumPy when it is installed; the result is the same
+    either way.
+    """
+    orders = list(orders)
+    if orders and load_numpy() is not None:
+        return _recompute_numpy(orders)
+
+    totals = {}
+    for order in orders:
+        for day, dimension, key, count, items, revenue in order_rows(order):
+            counter = totals.get((day, dimension, key))
+            if counter is None:
+                totals[day, dimension, key] = [count, items, revenue]
+            else:
+                counter[0] += count
+                counter[1] += items
+                counter[2] += revenue
+    return [(*group, *counter) for group, counter in totals.items()]
+
+
+def _recompute_numpy(orders):
+    # One pass in Python to pull the columns out, then every group-by is a bincount.
+    # UTC offsets and DST switches fall on quarter hours, so every time in
+    # a quarter hour is on the same local day and day_of runs once per quarter
+    quarters, where = numpy.unique(
+        numpy.fromiter((order.created for order in orders), numpy.int64, len(orders)) // QUARTER_HOUR,
+        return_inverse=True)
+    days = numpy.array([day_of(int(quarter) * QUARTER_HOUR) for quarter in quarters],
+                       dtype=numpy.int64)[where.reshape(-1)]
+    first = int(days.min())
+    span = int(days.max()) - first + 1
+    days -= first
+
+    statuses = {}
+    status_codes = numpy.fromiter((statuses.setdefault(order.status, len(statuses)) for order in orders),
+                                  numpy.int64, len(orders))
+    totals = numpy.fromiter((order.total for order in orders), numpy.int64, len(orders))
+
+    options, line_orders, line_options, line_qty, line_revenue = {}, [], [], [], []
+    for index, order in enumerate(orders):
+        for line in order.items:
+            line_orders.append(index)
+            line_options.append(options.setdefault(line.id, len(options)))
+            line_qty.append(line.qty)
+            line_revenue.append(line.price * line.qty)
+    line_orders = numpy.array(line_orders, dtype=numpy.int64)
+    line_qty = numpy.array(line_qty, dtype=numpy.int64)
+    items = numpy.bincount(line_orders, weights=line_qty, minlength=len(orders)).astype(numpy.int64)
+
+    def grouped(dimension, keys, codes, weights):
+        size = span * len(keys)
+        count = numpy.bincount(codes, minlength=size)
+        sums = [numpy.rint(numpy.bincount(codes, weights=w, minlength=size)).astype(numpy.int64)
+                for w in weights]
+        names = list(keys)
+        return [(first + int(code) // len(keys), dimension, names[int(code) % len(keys)],
+                 int(count[code]), int(sums[0][code]), int(sums[1][code]))
+                for code in numpy.nonzero(count)[0]]
+
+    rows = grouped(TOTAL, {'': 0}, days, (items, totals))
+    rows += grouped(STATUS, statuses, days * len(statuses) + status_codes, (items, totals))
+    if len(options):
+        rows += grouped(OPTION, options, days[line_orders] * len(options) + numpy.array(line_options),
+                        (line_qty, numpy.array(line_revenue, dtype=numpy.int64)))
+    return rows
+
+
+# =============== REPORTS ===============
+
+def _totals(orders, items, revenue):
+    return {'orders': orders, 'items': items, 'revenue': from_paise(revenue)}
+
+
+def summarize(rows, first_day, last_day, catalog=None):
+    """The admin dashboard report for counters from ``query``
+
+    ``catalog`` adds option names and rolls options up into their
+    services; options no longer in the catalog are kept under their id.
+    """
+    daily = {}
+    statuses, options = {}, {}
+    for day, dimension, key, orders, items, revenue in rows:
+        if dimension == TOTAL:
+            target = daily
+            key = day
+        else:
+            target = statuses if dimension == STATUS else options
+        counter = target.setdefault(key, [0, 0, 0])
+        counter[0] += orders
+        counter[1] += items
+        counter[2] += revenue
+
+    overall = [sum(counter[i] for counter in daily.values()) for i in range(3)]
+    by_option, services = [], {}
+    for option_id, (orders, items, revenue) in options.items():
+        option, service = catalog.get_option(option_id) if catalog is not None else (None, None)
+        entry = {'id': option_id, 'name': option['label'] if option else option_id,
+                 'service': service['id'] if service else None, **_totals(orders, items, revenue)}
+        by_option.append(entry)
+        if service is not None:
+            counter = services.setdefault(service['id'], [service['name'], 0, 0])
+            counter[1] += items
+            counter[2] += revenue
+
+    return {
+        'since': date.fromordinal(first_day).isoformat(),
+        'until': date.fromordinal(last_day).isoformat(),
+        'totals': _totals(*overall),
+        'by_status': sorted(({'status': status, **_totals(*counter)}
+                             for status, counter in statuses.items() if counter[0]),
+                            key=lambda entry: (-entry['orders'], entry['status'])),
+        'by_service': sorted(({'id': service_id, 'name': name, 'items': items,
+                               'revenue': from_paise(revenue)}
+                              for service_id, (name, items, revenue) in services.items()),
+                             key=lambda entry: (-entry['items'], entry['id'])),
+        'by_option': sorted(by_option, key=lambda entry: (-entry['items'], entry['id'])),
+        'daily': [{'date': date.fromordinal(day).isoformat(), **_totals(*daily.get(day, (0, 0, 0)))}
+                  for day in range(first_day, last_day + 1)],
+    }
@@ -1,335 +1,336 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Response, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager, jwt_required, create_access_token, get_jwt_identity
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from flask_jwt_extended import JWTManager, create_access_token
+from werkzeug.middleware.proxy_fix import ProxyFix
 import random
+import re
+import threading
 import time
 import os
-from datetime import datetime, timedelta
-import json
+from datetime import date, datetime, timedelta
+import hashlib
+import csv
+import io
 
-app = Flask(__name__)
-app.config['JWT_SECRET_KEY'] = 'your-secret-key-change-in-production'  # Change this!
-app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=1)
+from admission import AdmissionControl, AdmissionRule
+from analytics import RETENTION_DAYS, load_numpy, summarize
+from auth import Authenticator, current_user_id
+from cart import Cart, CartChanged
+from checkout import MAX_LINE_QTY, CheckoutError, build_order, price_items, valid_qty
+from contact import EMAIL_RE, EXPORT_FIELDS, ContactError, ContactIntake, export_record, parse_submission
+from content import ContentLoader
+from localization import LANGUAGES, load_translations, negotiate
+from search import SearchIndex, catalog_documents
+from events import create_broker, format_sse
+from mailer import MailConfig, MailQueue
+from metrics import Metrics
+from models import User, dumps, epoch_us, from_paise
+from periodic import PeriodicTask
+from ratelimit import RateLimiter, create_buckets
+from response_cache import ResponseCache
+from scheduling import Scheduler, SlotError, SlotUnavailable, service_turnaround
+from storage import create_storage
 
-jwt = JWTManager(app)
-CORS(app, origins=["http://localhost:5173", "http://localhost:3000"])  # Add your production domain
+class ModelJSONProvider(DefaultJSONProvider):
+    """Flask's JSON, with the models serialized and compact output written by models.dumps"""
 
-# In-memory storage (replace with database in production)
-users = {}
-carts = {}  # user_id: {items: [], total: 0}
-orders = []
-otp_storage = {}  # email: {otp: 123456, expires: timestamp}
+    @staticmethod
+    def default(o):
+        if hasattr(o, 'to_dict'):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
+
+    def dumps(self, obj, **kwargs):
+        if kwargs == {'separators': (',', ':')} and self.ensure_ascii:
+            return dumps(obj, sort_keys=self.sort_keys, default=self.default)
+        return super().dumps(obj, **kwargs)
+
+# Every route is registered on this blueprint; create_app (at the bottom)
+# builds the Flask app around it and the subsystems declared below
+api = Blueprint('api', __name__)
+
+JWT_CONFIG = {
+    'JWT_SECRET_KEY': 'your-secret-key-change-in-production',  # Change this!
+    'JWT_ACCESS_TOKEN_EXPIRES': timedelta(days=1),
+}
+
+# Only issues tokens (create_access_token); auth.py verifies them
+jwt = JWTManager()
+CORS_ORIGINS = ["http://localhost:5173", "http://localhost:3000"]  # Add your production domain
+CORS_EXPOSE_HEADERS = ['X-Next-Cursor', 'X-Total-Count']
+
+# The subsystems below are module globals, built by init_subsystems() the
+# first time create_app() runs in a process (see the bottom of this module),
+# so importing it opens no storage, threads or connections. Until then they
+# are None.
+
+# Users, carts, orders and OTPs. The default in-memory backend is per-process;
+# STORAGE_URL=memory+wal:///path/to/dir keeps it across restarts (one worker),
+# and STORAGE_URL=sqlite:///path/to/laundry.db shares state across workers.
+storage = None
+
+# Order events for /api/orders/stream. In-process with the memory backend;
+# with SQLite they go through the shared database so every worker sees them.
+order_events = None
+
+# Outbound email, delivered by background workers. Disabled unless SMTP_HOST is set.
+mailer = None
+
+# Token checks and role lookups for @auth.required / @auth.admin_required,
+# cached so hot routes skip JWT decoding and the user lookup. Users are
+# looked up in whatever storage init_subsystems() opened.
+auth = Authenticator.from_config(JWT_CONFIG, lambda user_id: storage.get_user(user_id))
+
+def current_user_is_admin():
+    """True if the request carries a valid token for an admin user"""
+    return auth.is_admin(auth.optional_user_id())
+
+# Per-route latency/size metrics on /metrics, summed across workers when
+# METRICS_DIR is set. Admins can profile one request with ?__profile=1.
+metrics = Metrics(multiprocess_dir=os.environ.get('METRICS_DIR'), is_admin=current_user_is_admin)
+
+# Expired OTPs are also dropped in the background, not just on the next login
+otp_sweeper = None
+
+# Contact-form messages are queued in memory and written to storage in batches
+# by a background thread; new ones are mailed to CONTACT_DIGEST_TO (comma
+# separated) every CONTACT_DIGEST_INTERVAL seconds. Stored batches are also
+# appended to CONTACT_ARCHIVE, which defaults to a local file when storage
+# doesn't survive restarts
+contact_intake = None
+contact_digest = None
+
+# Token buckets for every rate limit: the storage backend's (shared across
+# workers with SQLite), or Redis when RATE_LIMIT_URL is set, shared across nodes
+rate_buckets = None
+
+# OTP sends allowed per email/phone and per client IP, every 10 minutes
+OTP_LIMIT_PER_ADDRESS = int(os.environ.get('OTP_LIMIT_PER_ADDRESS', 3))
+OTP_LIMIT_PER_IP = int(os.environ.get('OTP_LIMIT_PER_IP', 20))
+otp_address_limiter = None
+otp_ip_limiter = None
+
+# Admission control, ahead of every route: 503 once MAX_CONCURRENT_REQUESTS
+# are in flight (the last RESERVED_FOR_SIGNED_IN of them only for signed-in
+# users), counted in rate_buckets, so across the pool with SQLite or Redis;
+# 429 past a route's buckets below. Limits are (requests, seconds), scaled by
+# RATE_LIMIT_SCALE. Per-IP buckets key on the client address, which behind
+# TRUSTED_PROXY_HOPS proxies is read from X-Forwarded-For.
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', 0))
+RATE_LIMIT_SCALE = float(os.environ.get('RATE_LIMIT_SCALE', 1))
+
+def admission_limit(limit, period):
+    return max(1, round(limit * RATE_LIMIT_SCALE)), period
+
+ADMISSION_RULES = {
+    '/api/auth/send-otp': AdmissionRule(per_ip=admission_limit(10, 60), per_route=admission_limit(600, 60)),
+    '/api/auth/login': AdmissionRule(per_ip=admission_limit(20, 60), per_route=admission_limit(1200, 60)),
+    '/api/contact': AdmissionRule(per_ip=admission_limit(5, 600), per_route=admission_limit(120, 60)),
+    '/api/checkout': AdmissionRule(per_ip=admission_limit(30, 60), per_user=admission_limit(10, 60)),
+}
+RATE_LIMIT_PER_IP = int(os.environ.get('RATE_LIMIT_PER_IP', 0))
+admission = None
 
 # =============== HELPER FUNCTIONS ===============
 
 def send_otp_email(email, otp):
-    """Send OTP via email (configure with your SMTP settings)"""
-    try:
-        # Configure with your email provider
-        smtp_server = "smtp.gmail.com"
-        smtp_port = 587
-        sender_email = "your-email@gmail.com"  # Change this
-        sender_password = "your-app-password"   # Change this
-        
-        message = MIMEMultipart()
-        message["From"] = sender_email
-        message["To"] = email
-        message["Subject"] = "Smart Laundry - Your OTP Code"
-        
-        body = f"""
-        <h2>Smart Laundry - Login OTP</h2>
-        <p>Your OTP code is: <strong>{otp}</strong></p>
-        <p>This code will expire in 5 minutes.</p>
-        <p>If you didn't request this, please ignore this email.</p>
-        """
-        
-        message.attach(MIMEText(body, "html"))
-        
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(sender_email, sender_password)
-        server.sendmail(sender_email, email, message.as_string())
-        server.quit()
-        return True
-    except Exception as e:
-        print(f"Email error: {e}")
+    """Queue the OTP email for background delivery; False if it can't be queued"""
+    if mailer is None:
         return False
+    return mailer.send_otp(email, otp)
+
+MAX_PAGE_SIZE = 500
+
+def parse_page_args():
+    """Read ?limit=&after= cursor pagination args (limit is None when absent)"""
+    limit = request.args.get('limit', type=int)
+    if limit is not None:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+    return limit, request.args.get('after')
+
+def paginated_response(items, next_cursor):
+    """List response, with the next page cursor in X-Next-Cursor"""
+    headers = {'X-Next-Cursor': next_cursor} if next_cursor else {}
+    return items, 200, headers
+
+def too_many_requests(retry_after):
+    headers = {'Retry-After': str(max(1, int(retry_after + 0.999)))}
+    return {'message': 'Too many requests, please try again later'}, 429, headers
 
 def generate_otp():
     return random.randint(100000, 999999)
 
+PHONE_RE = re.compile(r'^\d{10}$')
+
 def is_valid_email_or_phone(value):
-    import re
-    email_pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    phone_pattern = r'^\d{10}$'
-    return re.match(email_pattern, value) or re.match(phone_pattern, value)
-
-# =============== MOCK DATA ===============
-
-SERVICES_DATA = [
-    {
-        "id": "wash-fold",
-        "name": "Wash & Fold",
-        "nameKey": "services.wash_fold.name",
-        "category": "Laundry",
-        "icon": "👔",
-        "emoji": "👔",
-        "description": "Regular clothes washing and folding",
-        "descKey": "services.wash_fold.desc",
-        "tagline": "Fresh & Clean Every Time",
-        "taglineKey": "services.wash_fold.tagline",
-        "before": "2 days",
-        "after": "Same day",
-        "steps": [
-            {"key": "pickup", "text": "Free Pickup"},
-            {"key": "wash", "text": "Professional Wash"},
-            {"key": "dry", "text": "Gentle Drying"},
-            {"key": "deliver", "text": "Doorstep Delivery"}
-        ],
-        "options": [
-            {"id": "shirt", "label": "Shirt", "labelKey": "items.shirt", "price": 25, "emoji": "👔"},
-            {"id": "tshirt", "label": "T-Shirt", "labelKey": "items.tshirt", "price": 20, "emoji": "👕"},
-            {"id": "jeans", "label": "Jeans", "labelKey": "items.jeans", "price": 40, "emoji": "👖"},
-            {"id": "dress", "label": "Dress", "labelKey": "items.dress", "price": 60, "emoji": "👗"}
-        ],
-        "perks": [
-            {"key": "Free pickup & delivery", "text": "Free pickup & delivery"},
-            {"key": "24-hour service", "text": "24-hour service"},
-            {"key": "Eco-friendly detergents", "text": "Eco-friendly detergents"}
-        ]
-    },
-    {
-        "id": "dry-clean",
-        "name": "Dry Cleaning",
-        "nameKey": "services.dry_clean.name",
-        "category": "Laundry",
-        "icon": "🧥",
-        "emoji": "🧥",
-        "description": "Professional dry cleaning for delicate items",
-        "descKey": "services.dry_clean.desc",
-        "tagline": "Premium Care for Premium Clothes",
-        "taglineKey": "services.dry_clean.tagline",
-        "before": "5 days",
-        "after": "2 days",
-        "steps": [
-            {"key": "inspect", "text": "Quality Inspection"},
-            {"key": "clean", "text": "Dry Clean Process"},
-            {"key": "press", "text": "Professional Pressing"},
-            {"key": "package", "text": "Careful Packaging"}
-        ],
-        "options": [
-            {"id": "suit", "label": "Suit", "labelKey": "items.suit", "price": 200, "emoji": "🤵"},
-            {"id": "blazer", "label": "Blazer", "labelKey": "items.blazer", "price": 150, "emoji": "🧥"},
-            {"id": "coat", "label": "Coat", "labelKey": "items.coat", "price": 180, "emoji": "🧥"},
-            {"id": "saree", "label": "Saree", "labelKey": "items.saree", "price": 100, "emoji": "🥻"}
-        ],
-        "perks": [
-            {"key": "Expert stain removal", "text": "Expert stain removal"},
-            {"key": "Fabric protection", "text": "Fabric protection"},
-            {"key": "Premium packaging", "text": "Premium packaging"}
-        ]
-    },
-    {
-        "id": "shoe-care",
-        "name": "Shoe Care",
-        "nameKey": "services.shoe_care.name",
-        "category": "Accessories",
-        "icon": "👞",
-        "emoji": "👞",
-        "description": "Complete shoe cleaning and care",
-        "descKey": "services.shoe_care.desc",
-        "tagline": "Step Out in Style",
-        "taglineKey": "services.shoe_care.tagline",
-        "before": "3 days",
-        "after": "1 day",
-        "steps": [
-            {"key": "clean", "text": "Deep Cleaning"},
-            {"key": "polish", "text": "Premium Polish"},
-            {"key": "protect", "text": "Weather Protection"},
-            {"key": "shine", "text": "Final Shine"}
-        ],
-        "options": [
-            {"id": "leather-shoes", "label": "Leather Shoes", "labelKey": "items.leather_shoes", "price": 80, "emoji": "👞"},
-            {"id": "sports-shoes", "label": "Sports Shoes", "labelKey": "items.sports_shoes", "price": 60, "emoji": "👟"},
-            {"id": "boots", "label": "Boots", "labelKey": "items.boots", "price": 100, "emoji": "👢"},
-            {"id": "sandals", "label": "Sandals", "labelKey": "items.sandals", "price": 40, "emoji": "👡"}
-        ],
-        "perks": [
-            {"key": "Professional cleaning", "text": "Professional cleaning"},
-            {"key": "Leather conditioning", "text": "Leather conditioning"},
-            {"key": "Waterproof treatment", "text": "Waterproof treatment"}
-        ]
-    },
-    {
-        "id": "home-care",
-        "name": "Home Care",
-        "nameKey": "services.home_care.name",
-        "category": "Home Care",
-        "icon": "🏠",
-        "emoji": "🏠",
-        "description": "Curtains, carpets, and home textiles",
-        "descKey": "services.home_care.desc",
-        "tagline": "Clean Home, Happy Life",
-        "taglineKey": "services.home_care.tagline",
-        "before": "7 days",
-        "after": "3 days",
-        "steps": [
-            {"key": "pickup", "text": "Home Pickup"},
-            {"key": "clean", "text": "Specialized Cleaning"},
-            {"key": "sanitize", "text": "Deep Sanitization"},
-            {"key": "deliver", "text": "Safe Delivery"}
-        ],
-        "options": [
-            {"id": "curtains", "label": "Curtains", "labelKey": "items.curtains", "price": 120, "emoji": "🪟"},
-            {"id": "carpet", "label": "Carpet", "labelKey": "items.carpet", "price": 200, "emoji": "🧸"},
-            {"id": "sofa-cover", "label": "Sofa Cover", "labelKey": "items.sofa_cover", "price": 150, "emoji": "🛋️"},
-            {"id": "bedsheets", "label": "Bed Sheets", "labelKey": "items.bedsheets", "price": 80, "emoji": "🛏️"}
-        ],
-        "perks": [
-            {"key": "Home pickup available", "text": "Home pickup available"},
-            {"key": "Dust mite removal", "text": "Dust mite removal"},
-            {"key": "Anti-bacterial treatment", "text": "Anti-bacterial treatment"}
-        ]
-    }
-]
+    return EMAIL_RE.match(value) or PHONE_RE.match(value)
 
-STATS_DATA = {
-    "customers": 5000,
-    "clothes": 50000,
-    "years": 10
-}
+# =============== SITE CONTENT ===============
 
-ABOUTUS_DATA = {
-    "stats": [
-        {"icon": "Users", "value": 5000, "suffix": "+", "label": "Happy Customers"},
-        {"icon": "Shirt", "value": 50000, "suffix": "+", "label": "Clothes Cleaned"},
-        {"icon": "Clock", "value": 10, "suffix": "+", "label": "Years Experience"}
-    ],
-    "values": [
-        {"icon": "ShieldCheck", "title": "Quality First", "desc": "We ensure top-notch quality in every wash"},
-        {"icon": "Truck", "title": "Fast Delivery", "desc": "Quick pickup and delivery at your doorstep"},
-        {"icon": "Recycle", "title": "Eco-Friendly", "desc": "Using environmentally safe cleaning products"},
-        {"icon": "HeartHandshake", "title": "Customer Care", "desc": "24/7 support for all your laundry needs"}
-    ],
-    "timeline": [
-        {"year": "2014", "title": "Founded", "text": "Started as a small neighborhood laundry service"},
-        {"year": "2018", "title": "Expansion", "text": "Expanded to serve multiple areas with advanced technology"},
-        {"year": "2022", "title": "Digital", "text": "Launched mobile app and online booking system"},
-        {"year": "2024", "title": "Premium", "text": "Introduced premium services and eco-friendly solutions"}
-    ],
-    "team": [
-        {"name": "Raj Patel", "role": "Founder & CEO", "emoji": "👨‍💼"},
-        {"name": "Priya Sharma", "role": "Operations Head", "emoji": "👩‍💻"},
-        {"name": "Amit Kumar", "role": "Quality Manager", "emoji": "👨‍🔬"},
-        {"name": "Sneha Singh", "role": "Customer Support", "emoji": "👩‍💬"}
-    ],
-    "testimonials": [
-        {"name": "Rakesh Gupta", "text": "Best laundry service in the city! Always on time.", "rating": 5},
-        {"name": "Anjali Mehta", "text": "My expensive sarees are handled with great care.", "rating": 5},
-        {"name": "Suresh Yadav", "text": "Very professional and reliable service.", "rating": 4}
-    ]
-}
+# Services, prices and page copy live in a versioned JSON (or .msgpack) file.
+# Every worker picks up a new version within CONTENT_RELOAD_INTERVAL seconds,
+# so price changes need no redeploy or restart.
+CONTENT_PATH = os.environ.get('CONTENT_PATH',
+                              os.path.join(os.path.dirname(os.path.abspath(__file__)), 'content', 'site.json'))
 
-HOME_DATA = {
-    "why_choose": [
-        {"title": "Quick Service", "desc": "Same-day pickup and delivery", "border": "border-blue-500"},
-        {"title": "Expert Care", "desc": "Professional handling of all fabrics", "border": "border-green-500"},
-        {"title": "Affordable Rates", "desc": "Best prices in the neighborhood", "border": "border-yellow-500"}
-    ],
-    "how_it_works": [
-        {"step": "Book Online", "desc": "Schedule pickup via app or website", "animKey": "booking"},
-        {"step": "We Pickup", "desc": "Free pickup from your doorstep", "animKey": "pickup"},
-        {"step": "We Clean", "desc": "Professional washing & care", "animKey": "washing"},
-        {"step": "We Deliver", "desc": "Fresh clothes delivered back", "animKey": "delivery"}
-    ],
-    "final_cta": {
-        "title": "Ready for Fresh & Clean Clothes?",
-        "desc": "Book your first order now and get 20% off!",
-        "ctaText": "Book Now - 20% Off!"
-    }
-}
+# Server-side translations for the content, one table per language. Every
+# content version is rendered once per language when it loads.
+LOCALES_DIR = os.environ.get('LOCALES_DIR', os.path.join(os.path.dirname(CONTENT_PATH), 'locales'))
+translations = None
+
+def search_documents(current, lang):
+    return catalog_documents(current.localized[lang]['services'], current.services)
+
+def on_content_change(new, old):
+    """Swap in the new catalog, re-serialize the cached responses and re-index changed items"""
+    global catalog
+    catalog = new.catalog
+    with app.app_context():
+        response_cache.rebuild()
+    for lang, index in search_indexes.items():
+        index.sync(search_documents(new, lang))
+    print(f"Content version {new.version} loaded (was {old.version})")
+
+content = None
+
+# Lookup indexes over the services, rebuilt with every content version
+catalog = None
+
+# Full-text search over items, one index per language (English words match
+# in all of them); a content change re-indexes only the items that changed
+search_indexes = None
+
+# Pre-serialized bodies for the static content endpoints; translated ones
+# are cached per language under '<key>:<lang>'
+response_cache = ResponseCache(max_age=300)
+response_cache.register('categories', lambda: ['All'] + list(content.current.catalog.categories))
+response_cache.register('languages', lambda: list(LANGUAGES))
+response_cache.register('stats', lambda: content.current.stats)
+
+def register_localized(key, select):
+    for lang in LANGUAGES:
+        response_cache.register(f'{key}:{lang}', lambda lang=lang: select(content.current.localized[lang]))
+
+register_localized('services', lambda localized: localized['services'])
+register_localized('why_choose', lambda localized: localized['home']['why_choose'])
+register_localized('how_it_works', lambda localized: localized['home']['how_it_works'])
+register_localized('final_cta', lambda localized: localized['home']['final_cta'])
+register_localized('aboutus', lambda localized: localized['aboutus'])
+
+def request_language():
+    return negotiate(request.args.get('lang'), request.accept_languages)
+
+def respond_localized(key):
+    """Cached response for key in the request's language"""
+    response = response_cache.respond(f'{key}:{request_language()}')
+    response.vary.add('Accept-Language')
+    return response
+
+@api.before_app_request
+def start_content_watcher():
+    content.ensure_started()
 
 # =============== AUTH ROUTES ===============
+#
+# Route logic lives in plain functions returning (body, status[, headers]),
+# shared by the Flask views below and the async handlers in asgi.py.
 
-@app.route('/api/auth/send-otp', methods=['POST'])
-def send_otp():
-    data = request.get_json()
+def request_otp(data, client_ip):
     email = data.get('email', '').strip()
     
     if not email or not is_valid_email_or_phone(email):
-        return jsonify({'message': 'Invalid email or phone number'}), 400
+        return {'message': 'Invalid email or phone number'}, 400
+    
+    otp_sweeper.ensure_started()
+    
+    wait = otp_ip_limiter.hit(client_ip) or otp_address_limiter.hit(email.lower())
+    if wait:
+        return too_many_requests(wait)
     
     otp = generate_otp()
     expires = time.time() + 300  # 5 minutes
     
-    otp_storage[email] = {'otp': otp, 'expires': expires}
+    storage.set_otp(email, {'otp': otp, 'expires': expires})
     
     # For development, print OTP to console
     print(f"OTP for {email}: {otp}")
     
-    # In production, uncomment this to send real emails
-    # if not send_otp_email(email, otp):
-    #     return jsonify({'message': 'Failed to send OTP'}), 500
+    # Only queued here, so the request never waits on SMTP
+    if mailer is not None and '@' in email and not send_otp_email(email, otp):
+        return {'message': 'Failed to send OTP'}, 503
     
-    return jsonify({'message': 'OTP sent successfully'}), 200
+    return {'message': 'OTP sent successfully'}, 200
 
-@app.route('/api/auth/login', methods=['POST'])
-def login():
-    data = request.get_json()
+def verify_otp_login(data):
     email = data.get('email', '').strip()
     otp = data.get('otp', '')
     
     if not email or not otp:
-        return jsonify({'message': 'Email and OTP are required'}), 400
+        return {'message': 'Email and OTP are required'}, 400
     
     # Verify OTP
-    if email not in otp_storage:
-        return jsonify({'message': 'OTP not found or expired'}), 400
+    stored_data = storage.get_otp(email)
+    if not stored_data:
+        return {'message': 'OTP not found or expired'}, 400
     
-    stored_data = otp_storage[email]
     if time.time() > stored_data['expires']:
-        del otp_storage[email]
-        return jsonify({'message': 'OTP expired'}), 400
+        storage.delete_otp(email)
+        return {'message': 'OTP expired'}, 400
     
     if str(stored_data['otp']) != str(otp):
-        return jsonify({'message': 'Invalid OTP'}), 400
+        return {'message': 'Invalid OTP'}, 400
     
     # OTP verified, create/login user
-    if email not in users:
-        users[email] = {
-            'id': email,
-            'email': email,
-            'name': email.split('@')[0] if '@' in email else email,
-            'phone': email if email.isdigit() else '',
-            'role': 'admin' if email in ['admin@laundry.com', 'admin'] else 'user',
-            'created_at': datetime.now().isoformat()
-        }
+    user = storage.get_user(email)
+    if not user:
+        user = User(
+            id=email,
+            email=email,
+            name=email.split('@')[0] if '@' in email else email,
+            phone=email if email.isdigit() else '',
+            role='admin' if email in ['admin@laundry.com', 'admin'] else 'user',
+            created=epoch_us(datetime.now())
+        )
+        save_user(user)
     
-    user = users[email]
     token = create_access_token(identity=email)
     
     # Clear OTP
-    del otp_storage[email]
+    storage.delete_otp(email)
     
-    return jsonify({
+    return {
         'token': token,
         'user': user,
         'message': 'Login successful'
-    }), 200
+    }, 200
 
-@app.route('/api/auth/me', methods=['GET'])
-@jwt_required()
-def get_profile():
-    user_id = get_jwt_identity()
-    if user_id not in users:
-        return jsonify({'message': 'User not found'}), 404
+def save_user(user):
+    storage.save_user(user)
+    # Role checks must see the new record, not the cached one
+    auth.invalidate(user.id)
+
+def get_user_profile(user_id):
+    user = storage.get_user(user_id)
+    if not user:
+        return {'message': 'User not found'}, 404
     
-    return jsonify(users[user_id]), 200
+    return user.to_dict(), 200
+
+@api.route('/api/auth/send-otp', methods=['POST'])
+def send_otp():
+    return request_otp(request.get_json(), request.remote_addr)
+
+@api.route('/api/auth/login', methods=['POST'])
+def login():
+    return verify_otp_login(request.get_json())
+
+@api.route('/api/auth/me', methods=['GET'])
+@auth.required
+def get_profile():
+    return get_user_profile(current_user_id())
 
-@app.route('/api/auth/google', methods=['GET'])
+@api.route('/api/auth/google', methods=['GET'])
 def google_auth():
     # Mock Google auth for development
     # In production, implement proper Google OAuth
@@ -337,270 +338,763 @@ def google_auth():
 
 # =============== SERVICES ROUTES ===============
 
-@app.route('/api/services/', methods=['GET'])
+@api.route('/api/services/', methods=['GET'])
 def get_services():
-    return jsonify(SERVICES_DATA), 200
+    return respond_localized('services')
 
-@app.route('/api/services/<service_id>', methods=['GET'])
+@api.route('/api/services/<service_id>', methods=['GET'])
 def get_service_detail(service_id):
-    service = next((s for s in SERVICES_DATA if s['id'] == service_id), None)
+    service = content.current.localized[request_language()]['services_by_id'].get(service_id)
     if not service:
         return jsonify({'message': 'Service not found'}), 404
     
-    return jsonify(service), 200
+    response = jsonify(service)
+    response.vary.add('Accept-Language')
+    return response, 200
+
+MAX_SEARCH_QUERY = 100
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
+
+def search_catalog(args, lang):
+    """Ranked items for ?q=, filtered by ?category=&min_price=&max_price=
+
+    Pages with ?limit=&after=, where the cursor is the offset of the next
+    page; the match count is sent in X-Total-Count.
+    """
+    query = (args.get('q') or '').strip()
+    if len(query) > MAX_SEARCH_QUERY:
+        return {'message': f'Search query is limited to {MAX_SEARCH_QUERY} characters'}, 400
+
+    category = args.get('category') or None
+    if category == 'All':
+        category = None
+
+    try:
+        min_price = float(args['min_price']) if args.get('min_price') else None
+        max_price = float(args['max_price']) if args.get('max_price') else None
+        limit = int(args['limit']) if args.get('limit') else DEFAULT_SEARCH_LIMIT
+        offset = int(args['after']) if args.get('after') else 0
+    except ValueError:
+        return {'message': 'Invalid search parameters'}, 400
+    limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+    offset = max(0, offset)
 
-@app.route('/api/categories', methods=['GET'])
+    hits, total = search_indexes[lang].search(query, category, min_price, max_price, limit, offset)
+    headers = {'X-Total-Count': str(total), 'Vary': 'Accept-Language'}
+    if offset + len(hits) < total:
+        headers['X-Next-Cursor'] = str(offset + len(hits))
+    return hits, 200, headers
+
+@api.route('/api/search', methods=['GET'])
+def search_services():
+    return search_catalog(request.args, request_language())
+
+@api.route('/api/categories', methods=['GET'])
 def get_categories():
-    categories = list(set(s['category'] for s in SERVICES_DATA))
-    return jsonify(['All'] + categories), 200
+    return response_cache.respond('categories')
 
-@app.route('/api/languages', methods=['GET'])
+@api.route('/api/languages', methods=['GET'])
 def get_languages():
-    return jsonify(['en', 'hi', 'mr']), 200
+    return response_cache.respond('languages')
 
 # =============== CART ROUTES ===============
 
-@app.route('/api/cart', methods=['GET'])
-@jwt_required()
-def get_cart():
-    user_id = get_jwt_identity()
-    cart = carts.get(user_id, {'items': [], 'total': 0, 'totalQty': 0})
-    return jsonify(cart), 200
+EMPTY_CART = {'items': [], 'total': 0, 'totalQty': 0}
 
-@app.route('/api/cart/add', methods=['POST'])
-@jwt_required()
-def add_to_cart():
-    user_id = get_jwt_identity()
-    data = request.get_json()
+MAX_CART_BATCH = 500
+
+def view_cart(user_id):
+    cart = storage.get_cart(user_id)
+    return (cart.to_dict() if cart else EMPTY_CART), 200
+
+def add_error(cart, item_id, qty):
+    """Why qty more of an item can't go in the cart, or None; same limits as checkout"""
+    if not valid_qty(qty):
+        return f'Quantity must be a whole number from 1 to {MAX_LINE_QTY}'
+    line = cart.items.get(item_id)
+    if line and line.qty + qty > MAX_LINE_QTY:
+        return f'At most {MAX_LINE_QTY} of one item per order'
+    return None
+
+def cart_add(user_id, data):
     item_id = data.get('id')
     qty = data.get('qty', 1)
     
-    if user_id not in carts:
-        carts[user_id] = {'items': [], 'total': 0, 'totalQty': 0}
-    
-    cart = carts[user_id]
-    
-    # Find item in all services
-    item_data = None
-    for service in SERVICES_DATA:
-        for option in service['options']:
-            if option['id'] == item_id:
-                item_data = option
-                break
-        if item_data:
-            break
+    item_data, _ = catalog.get_option(item_id)
     
     if not item_data:
-        return jsonify({'message': 'Item not found'}), 404
+        return {'message': 'Item not found'}, 404
     
-    # Check if item already exists in cart
-    existing_item = next((item for item in cart['items'] if item['id'] == item_id), None)
+    def add(cart):
+        message = add_error(cart, item_id, qty)
+        if message:
+            return {'message': message}, 400
+        cart.add(item_id, item_data, qty)
     
-    if existing_item:
-        existing_item['qty'] += qty
-    else:
-        cart['items'].append({
-            'id': item_id,
-            'name': item_data['label'],
-            'price': item_data['price'],
-            'emoji': item_data['emoji'],
-            'qty': qty
-        })
-    
-    # Recalculate totals
-    cart['total'] = sum(item['price'] * item['qty'] for item in cart['items'])
-    cart['totalQty'] = sum(item['qty'] for item in cart['items'])
-    
-    return jsonify({'message': 'Item added to cart', 'cart': cart}), 200
-
-@app.route('/api/cart/decrease', methods=['POST'])
-@jwt_required()
-def decrease_cart_qty():
-    user_id = get_jwt_identity()
-    data = request.get_json()
-    item_id = data.get('id')
+    cart, error = storage.update_cart(user_id, add)
+    if error:
+        return error
     
-    if user_id not in carts:
-        return jsonify({'message': 'Cart not found'}), 404
+    return {'message': 'Item added to cart', 'cart': cart.to_dict()}, 200
+
+def cart_decrease(user_id, data):
+    item_id = data.get('id')
     
-    cart = carts[user_id]
-    item = next((item for item in cart['items'] if item['id'] == item_id), None)
+    def decrease(cart):
+        if cart is None:
+            return {'message': 'Cart not found'}, 404
+        if not cart.decrease(item_id):
+            return {'message': 'Item not found in cart'}, 404
     
-    if not item:
-        return jsonify({'message': 'Item not found in cart'}), 404
+    cart, error = storage.update_cart(user_id, decrease, create=False)
+    if error:
+        return error
     
-    item['qty'] -= 1
-    if item['qty'] <= 0:
-        cart['items'] = [i for i in cart['items'] if i['id'] != item_id]
+    return {'message': 'Item quantity decreased', 'cart': cart.to_dict()}, 200
+
+def cart_remove(user_id, item_id):
+    def remove(cart):
+        if cart is None:
+            return {'message': 'Cart not found'}, 404
+        cart.remove(item_id)
     
-    # Recalculate totals
-    cart['total'] = sum(item['price'] * item['qty'] for item in cart['items'])
-    cart['totalQty'] = sum(item['qty'] for item in cart['items'])
+    cart, error = storage.update_cart(user_id, remove, create=False)
+    if error:
+        return error
     
-    return jsonify({'message': 'Item quantity decreased', 'cart': cart}), 200
+    return {'message': 'Item removed from cart', 'cart': cart.to_dict()}, 200
 
-@app.route('/api/cart/<item_id>', methods=['DELETE'])
-@jwt_required()
-def remove_from_cart(item_id):
-    user_id = get_jwt_identity()
+def cart_apply_operations(user_id, data):
+    """Apply many add/decrease/remove operations in one request
+
+    Body: {"operations": [{"op": "add", "id": "shirt", "qty": 2},
+                          {"op": "decrease", "id": "suit"},
+                          {"op": "remove", "id": "boots"}]}
+    Operations run in order against a copy of the cart, which replaces the
+    stored cart only if every operation succeeds.
+    """
+    operations = data.get('operations')
     
-    if user_id not in carts:
-        return jsonify({'message': 'Cart not found'}), 404
+    if not isinstance(operations, list) or not operations:
+        return {'message': 'Operations are required'}, 400
+    if len(operations) > MAX_CART_BATCH:
+        return {'message': f'At most {MAX_CART_BATCH} operations per request'}, 400
     
-    cart = carts[user_id]
-    cart['items'] = [item for item in cart['items'] if item['id'] != item_id]
+    def apply(cart):
+        for index, operation in enumerate(operations):
+            if not isinstance(operation, dict):
+                return {'message': 'Invalid operation', 'index': index}, 400
+            
+            op = operation.get('op')
+            item_id = operation.get('id')
+            
+            if op == 'add':
+                item_data, _ = catalog.get_option(item_id)
+                if not item_data:
+                    return {'message': 'Item not found', 'index': index}, 404
+                qty = operation.get('qty', 1)
+                message = add_error(cart, item_id, qty)
+                if message:
+                    return {'message': message, 'index': index}, 400
+                cart.add(item_id, item_data, qty)
+            elif op == 'decrease':
+                if not cart.decrease(item_id):
+                    return {'message': 'Item not found in cart', 'index': index}, 404
+            elif op == 'remove':
+                cart.remove(item_id)
+            else:
+                return {'message': f'Unknown operation: {op}', 'index': index}, 400
     
-    # Recalculate totals
-    cart['total'] = sum(item['price'] * item['qty'] for item in cart['items'])
-    cart['totalQty'] = sum(item['qty'] for item in cart['items'])
+    cart, error = storage.update_cart(user_id, apply)
+    if error:
+        return error
     
-    return jsonify({'message': 'Item removed from cart', 'cart': cart}), 200
+    return {'message': 'Cart updated', 'cart': cart.to_dict()}, 200
+
+def cart_clear(user_id):
+    storage.save_cart(user_id, Cart())
+    return {'message': 'Cart cleared'}, 200
+
+@api.route('/api/cart', methods=['GET'])
+@auth.required
+def get_cart():
+    return view_cart(current_user_id())
+
+@api.route('/api/cart/add', methods=['POST'])
+@auth.required
+def add_to_cart():
+    return cart_add(current_user_id(), request.get_json())
+
+@api.route('/api/cart/decrease', methods=['POST'])
+@auth.required
+def decrease_cart_qty():
+    return cart_decrease(current_user_id(), request.get_json())
+
+@api.route('/api/cart/<item_id>', methods=['DELETE'])
+@auth.required
+def remove_from_cart(item_id):
+    return cart_remove(current_user_id(), item_id)
+
+@api.route('/api/cart/items', methods=['POST'])
+@auth.required
+def update_cart_items():
+    return cart_apply_operations(current_user_id(), request.get_json())
 
-@app.route('/api/cart', methods=['DELETE'])
-@jwt_required()
+@api.route('/api/cart', methods=['DELETE'])
+@auth.required
 def clear_cart():
-    user_id = get_jwt_identity()
-    carts[user_id] = {'items': [], 'total': 0, 'totalQty': 0}
-    return jsonify({'message': 'Cart cleared'}), 200
+    return cart_clear(current_user_id())
+
+# =============== DELIVERY SLOTS ===============
+
+# Pickup and delivery windows with a van capacity each; checkout takes a
+# place in both, so a busy day fills up instead of being overbooked
+scheduler = None
+
+# Tries at auto-picking slots when the chosen ones fill up under us
+SLOT_RETRIES = 5
+
+def order_turnaround(item_ids):
+    """Hours the slowest service among the items needs between pickup and delivery"""
+    return max(service_turnaround(catalog.get_option(item_id)[1]) for item_id in item_ids)
+
+def list_slots(args):
+    """Open pickup windows, and delivery windows for ?items= picked up at ?pickup= (or the first pickup)"""
+    item_ids = [item_id for item_id in (args.get('items') or '').split(',') if item_id]
+    for item_id in item_ids:
+        if catalog.get_option(item_id)[0] is None:
+            return {'message': f'Item not found: {item_id}'}, 404
+    
+    pickups = scheduler.available('pickup', *scheduler.pickup_window(datetime.now()))
+    body = {'pickup': [scheduler.describe(*slot) for slot in pickups], 'delivery': []}
+    if not item_ids:
+        return body, 200
+    
+    turnaround = order_turnaround(item_ids)
+    body['turnaround_hours'] = turnaround
+    if args.get('pickup'):
+        try:
+            pickup = scheduler.parse(args['pickup'])
+        except ValueError:
+            return {'message': 'Invalid pickup slot'}, 400
+    elif pickups:
+        pickup = pickups[0][0]
+    else:
+        return body, 200
+    
+    deliveries = scheduler.available('delivery', *scheduler.delivery_window(pickup, turnaround))
+    body['delivery'] = [scheduler.describe(*slot) for slot in deliveries]
+    return body, 200
+
+@api.route('/api/slots', methods=['GET'])
+def get_slots():
+    return list_slots(request.args)
 
 # =============== CHECKOUT ROUTES ===============
 
-@app.route('/api/checkout', methods=['POST'])
-@jwt_required()
-def checkout():
-    user_id = get_jwt_identity()
-    data = request.get_json()
-    cart_items = data.get('cart', [])
-    total = data.get('total', 0)
-    
-    if not cart_items:
-        return jsonify({'message': 'Cart is empty'}), 400
-    
-    # Create order
-    order = {
-        'id': f"ORD_{int(time.time())}",
-        'user_id': user_id,
-        'items': cart_items,
-        'total': total,
-        'status': 'Pending',
-        'created_at': datetime.now().isoformat(),
-        'pickup_time': (datetime.now() + timedelta(hours=2)).strftime('%Y-%m-%d %H:%M'),
-        'delivery_time': (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d %H:%M')
-    }
+def place_order(user_id, data):
+    """Price the submitted cart from the catalog, book its slots and store the order; returns (body, status)
+
+    ``pickup_slot``/``delivery_slot`` pick windows from /api/slots; any
+    left out get the earliest open ones.
+    """
+    cart_items = data.get('cart')
+    cart = None
+    if cart_items is None:
+        # Fall back to the cart we hold for the user; storage only empties
+        # it if it still holds what was priced here
+        cart = storage.get_cart(user_id)
+        cart_items = cart.to_dict()['items'] if cart else []
+    
+    if not cart_items or not isinstance(cart_items, list):
+        return {'message': 'Cart is empty'}, 400
+    
+    try:
+        lines, total = price_items(catalog, cart_items)
+    except CheckoutError as e:
+        return {'message': e.message}, e.status
+    
+    turnaround = order_turnaround(line.id for line in lines)
+    pickup_slot, delivery_slot = data.get('pickup_slot'), data.get('delivery_slot')
+    for attempt in range(SLOT_RETRIES):
+        try:
+            pickup, delivery = scheduler.plan(turnaround, pickup_slot, delivery_slot)
+        except SlotError as e:
+            return {'message': e.message}, e.status
+        
+        order = build_order(user_id, lines, total, pickup=pickup, delivery=delivery)
+        try:
+            storage.place_order(order, scheduler.reservations(pickup, delivery), cart)
+            break
+        except SlotUnavailable as e:
+            chosen = pickup_slot if e.kind == 'pickup' else delivery_slot
+            if chosen or attempt == SLOT_RETRIES - 1:
+                return {'message': f'The {e.kind} slot is full, please pick another'}, 409
+        except ValueError:
+            return {'message': 'Order already exists, please retry'}, 409
+        except CartChanged:
+            return {'message': 'Your cart changed during checkout, please review it and try again'}, 409
+    
+    publish_order_event('created', order)
+    
+    return {'success': True, 'order_id': order.id, 'total': from_paise(total), 'message': 'Order placed successfully'}, 200
+
+def checkout_order(user_id, data, raw_body, idempotency_key=None):
+    if not idempotency_key:
+        return place_order(user_id, data)
     
-    orders.append(order)
+    # Replays of the same key get the first response instead of a second order
+    key = f'checkout:{user_id}:{idempotency_key}'
+    fingerprint = hashlib.sha256(raw_body).hexdigest()
+    previous = storage.claim_idempotency_key(key, fingerprint)
+    if previous:
+        if previous['fingerprint'] != fingerprint:
+            return {'message': 'Idempotency-Key was already used with a different request'}, 422
+        if previous['body'] is None:
+            return {'message': 'A request with this Idempotency-Key is in progress'}, 409
+        return previous['body'], previous['status_code']
     
-    # Clear user cart
-    carts[user_id] = {'items': [], 'total': 0, 'totalQty': 0}
+    try:
+        body, status = place_order(user_id, data)
+    except Exception:
+        storage.release_idempotency_key(key)
+        raise
+    
+    if status == 200:
+        storage.complete_idempotency_key(key, status, body)
+    else:
+        # Let the client fix the request and retry with the same key
+        storage.release_idempotency_key(key)
     
-    return jsonify({'success': True, 'order_id': order['id'], 'message': 'Order placed successfully'}), 200
+    return body, status
+
+@api.route('/api/checkout', methods=['POST'])
+@auth.required
+def checkout():
+    return checkout_order(current_user_id(), request.get_json(), request.get_data(),
+                          request.headers.get('Idempotency-Key'))
 
 # =============== ORDERS ROUTES ===============
 
-@app.route('/api/orders/my', methods=['GET'])
-@jwt_required()
+def list_my_orders(user_id, limit=None, after=None):
+    try:
+        user_orders, next_cursor = storage.page_user_orders(user_id, limit, after)
+    except KeyError:
+        return {'message': 'Invalid cursor'}, 400
+    
+    return paginated_response([order.summary() for order in user_orders], next_cursor)
+
+@api.route('/api/orders/my', methods=['GET'])
+@auth.required
 def get_my_orders():
-    user_id = get_jwt_identity()
-    user_orders = [order for order in orders if order['user_id'] == user_id]
-    
-    # Convert to expected format
-    formatted_orders = []
-    for order in user_orders:
-        formatted_orders.append({
-            '_id': order['id'],
-            'serviceName': 'Laundry Service',
-            'status': order['status'],
-            'total': order['total'],
-            'createdAt': order['created_at'],
-            'pickupTime': order['pickup_time'],
-            'deliveryTime': order['delivery_time']
-        })
-    
-    return jsonify(formatted_orders), 200
+    return list_my_orders(current_user_id(), *parse_page_args())
+
+# =============== ORDER EVENTS ===============
+
+SSE_HEARTBEAT = 15
+SSE_MAX_SECONDS = int(os.environ.get('SSE_MAX_SECONDS', 300))
+
+# Each stream holds a request thread for up to SSE_MAX_SECONDS, and the
+# route is exempt from admission control, so streams have their own cap
+# per worker; keep it below gunicorn's --threads. ASGI mode holds no
+# thread per stream and is not capped.
+SSE_MAX_STREAMS = int(os.environ.get('SSE_MAX_STREAMS', 8))
+stream_slots = threading.BoundedSemaphore(SSE_MAX_STREAMS)
+
+# EventSource can't send headers, so streams are opened with ?ticket=: a
+# stream-only token that is good for SSE_TICKET_SECONDS, fetched with the
+# access token just before connecting. The access token never goes in a URL.
+SSE_TICKET_SECONDS = 60
+
+def issue_stream_ticket(user_id):
+    return {'ticket': auth.issue_ticket(user_id, 'stream', SSE_TICKET_SECONDS),
+            'expires_in': SSE_TICKET_SECONDS}, 200
+
+def publish_order_event(kind, order):
+    """Push an order change to its owner and to admins"""
+    publish_order_events(kind, [order])
+
+def publish_order_events(kind, orders):
+    messages = []
+    for order in orders:
+        event = {
+            'type': kind,
+            'order_id': order.id,
+            'status': order.status,
+            'total': from_paise(order.total),
+            'createdAt': order.created_at
+        }
+        messages.append((f"user:{order.user_id}", event))
+        messages.append(('admin', {**event, 'user_id': order.user_id}))
+    try:
+        order_events.publish_many(messages)
+    except Exception as e:
+        # Clients still get the change on their next refetch
+        print(f"Order event publish error: {e}")
+
+def order_stream_channels(user_id):
+    """Admins follow every order, everyone else only their own"""
+    return ['admin'] if auth.is_admin(user_id) else [f'user:{user_id}']
+
+def order_event_stream(subscription, heartbeat=SSE_HEARTBEAT, max_seconds=SSE_MAX_SECONDS):
+    """SSE frames for a subscription, closed after max_seconds
+
+    The browser's EventSource reconnects by itself, so ending the stream
+    now and then keeps a sync worker from being held by one client forever.
+    """
+    deadline = time.monotonic() + max_seconds
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            events = subscription.get(timeout=min(heartbeat, remaining))
+            if not events:
+                yield ': keep-alive\n\n'
+            for event_id, event in events:
+                yield format_sse(event_id, event)
+    finally:
+        subscription.close()
+
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+@api.route('/api/orders/stream/ticket', methods=['POST'])
+@auth.required
+def stream_ticket():
+    return issue_stream_ticket(current_user_id())
+
+@api.route('/api/orders/stream', methods=['GET'])
+@auth.required(ticket='stream')
+def stream_orders():
+    # A sync worker serves one request at a time, so a stream would stop it
+    # answering anything else until the stream ends
+    if not request.environ.get('wsgi.multithread'):
+        return {'message': 'Live order updates need threaded workers (gunicorn --threads N) '
+                           'or the ASGI app (uvicorn asgi:application)'}, 503
+    if not stream_slots.acquire(blocking=False):
+        return ({'message': 'Too many live order streams open, please try again later'}, 503,
+                {'Retry-After': str(SSE_HEARTBEAT)})
+    
+    try:
+        subscription = order_events.subscribe(order_stream_channels(current_user_id()))
+    except Exception:
+        stream_slots.release()
+        raise
+    response = Response(order_event_stream(subscription), mimetype='text/event-stream',
+                        headers=SSE_HEADERS)
+    # Called by the server once the stream ends or the client goes away
+    response.call_on_close(stream_slots.release)
+    return response
 
 # =============== HOME PAGE DATA ===============
 
-@app.route('/api/stats', methods=['GET'])
+@api.route('/api/stats', methods=['GET'])
 def get_stats():
-    return jsonify(STATS_DATA), 200
+    return response_cache.respond('stats')
 
-@app.route('/api/why-choose', methods=['GET'])
+@api.route('/api/why-choose', methods=['GET'])
 def get_why_choose():
-    return jsonify(HOME_DATA['why_choose']), 200
+    return respond_localized('why_choose')
 
-@app.route('/api/how-it-works', methods=['GET'])
+@api.route('/api/how-it-works', methods=['GET'])
 def get_how_it_works():
-    return jsonify(HOME_DATA['how_it_works']), 200
+    return respond_localized('how_it_works')
 
-@app.route('/api/final-cta', methods=['GET'])
+@api.route('/api/final-cta', methods=['GET'])
 def get_final_cta():
-    return jsonify(HOME_DATA['final_cta']), 200
+    return respond_localized('final_cta')
 
 # =============== ABOUT US ROUTES ===============
 
-@app.route('/api/aboutus', methods=['GET'])
+@api.route('/api/aboutus', methods=['GET'])
 def get_aboutus():
-    return jsonify(ABOUTUS_DATA), 200
+    return respond_localized('aboutus')
 
 # =============== CONTACT ROUTES ===============
 
-@app.route('/api/contact', methods=['POST'])
+def submit_contact(data, client_ip):
+    try:
+        message = parse_submission(data, client_ip)
+    except ContactError as e:
+        return {'message': e.message}, e.status
+
+    contact_digest.ensure_started()
+    # Only queued here; storage writes happen in batches in the background
+    if not contact_intake.submit(message):
+        return {'message': 'Too many messages right now, please try again shortly'}, 503, {'Retry-After': '5'}
+    return {'message': 'Message sent successfully'}, 200
+
+@api.route('/api/contact', methods=['POST'])
 def contact_form():
-    data = request.get_json()
-    name = data.get('name', '')
-    email = data.get('email', '')
-    message = data.get('message', '')
+    return submit_contact(request.get_json(), request.remote_addr)
+
+# =============== ADMIN ROUTES (Basic) ===============
+
+# Callers check the admin role (@auth.admin_required, or the ASGI route table)
+
+def list_all_orders(limit=None, after=None):
+    try:
+        page, next_cursor = storage.page_orders(limit, after)
+    except KeyError:
+        return {'message': 'Invalid cursor'}, 400
     
-    if not name or not email or not message:
-        return jsonify({'message': 'All fields are required'}), 400
+    return paginated_response(page, next_cursor)
+
+def update_order_status(order_id, data):
+    new_status = data.get('status')
+    if not isinstance(new_status, str) or not new_status:
+        return {'message': 'Status is required'}, 400
+    
+    order = storage.set_order_status(order_id, new_status)
+    if not order:
+        return {'message': 'Order not found'}, 404
     
-    # In production, save to database or send email
-    print(f"Contact form submission:")
-    print(f"Name: {name}")
-    print(f"Email: {email}")
-    print(f"Message: {message}")
+    publish_order_event('status', order)
     
-    return jsonify({'message': 'Message sent successfully'}), 200
+    return {'message': 'Order status updated', 'order': order}, 200
 
-# =============== ADMIN ROUTES (Basic) ===============
+MAX_BULK_IDS = 5000
 
-@app.route('/api/admin/orders', methods=['GET'])
-@jwt_required()
-def admin_get_orders():
-    user_id = get_jwt_identity()
-    if user_id not in users or users[user_id]['role'] != 'admin':
-        return jsonify({'message': 'Access denied'}), 403
+def parse_order_filters(values):
+    """status/user_id/since/until filters from query args or a JSON object
+
+    Dates may be plain days (until is then inclusive) or ISO timestamps.
+    Raises ValueError on bad input.
+    """
+    filters = {}
+    for name in ('status', 'user_id'):
+        value = values.get(name)
+        if value is not None:
+            if not isinstance(value, str) or not value:
+                raise ValueError(f'Invalid {name}')
+            filters[name] = value
     
-    return jsonify(orders), 200
+    for name in ('since', 'until'):
+        value = values.get(name)
+        if value is None:
+            continue
+        try:
+            moment = datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'Invalid {name} date')
+        if name == 'until' and len(value) == 10:
+            moment += timedelta(days=1)
+        filters[name] = moment.isoformat()
+    return filters
 
-@app.route('/api/admin/orders/<order_id>/status', methods=['PUT'])
-@jwt_required()
+def bulk_update_order_status(data):
+    """Move every order in order_ids and/or matching filters to a new status"""
+    new_status = data.get('status')
+    if not isinstance(new_status, str) or not new_status:
+        return {'message': 'Status is required'}, 400
+    
+    order_ids = data.get('order_ids')
+    if order_ids is not None:
+        if not isinstance(order_ids, list) or not all(isinstance(i, str) for i in order_ids):
+            return {'message': 'order_ids must be a list of order ids'}, 400
+        if len(order_ids) > MAX_BULK_IDS:
+            return {'message': f'At most {MAX_BULK_IDS} order ids per request'}, 400
+    
+    filters = data.get('filters') or {}
+    if not isinstance(filters, dict):
+        return {'message': 'filters must be an object'}, 400
+    try:
+        filters = parse_order_filters(filters)
+    except ValueError as e:
+        return {'message': str(e)}, 400
+    
+    if order_ids is None and not filters:
+        # Never touch every order by accident
+        return {'message': 'Give order_ids or at least one filter'}, 400
+    
+    orders = storage.set_orders_status(new_status, order_ids, **filters)
+    publish_order_events('status', orders)
+    
+    body = {'message': 'Order statuses updated', 'updated': len(orders),
+            'order_ids': [order.id for order in orders]}
+    if order_ids is not None:
+        updated = set(body['order_ids'])
+        body['skipped'] = [i for i in dict.fromkeys(order_ids) if i not in updated]
+    return body, 200
+
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv; charset=utf-8'}
+EXPORT_CSV_FIELDS = ['id', 'user_id', 'status', 'total', 'created_at', 'pickup_time', 'delivery_time', 'items']
+
+def order_export_chunks(orders, fmt, batch_size=200):
+    """Encode orders as NDJSON or CSV, a batch of rows per chunk"""
+    out = io.StringIO()
+    writer = None
+    if fmt == 'csv':
+        writer = csv.writer(out)
+        writer.writerow(EXPORT_CSV_FIELDS)
+    
+    rows = 0
+    for order in orders:
+        if writer is None:
+            out.write(dumps(order))
+            out.write('\n')
+        else:
+            row = order.to_dict()
+            items = '; '.join(f"{item.name} x{item.qty}" for item in order.items)
+            writer.writerow([row[field] for field in EXPORT_CSV_FIELDS[:-1]] + [items])
+        rows += 1
+        if rows % batch_size == 0:
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+    
+    if out.tell():
+        yield out.getvalue()
+
+def export_orders(args):
+    """Streaming export of the orders matching the filters in args"""
+    fmt = args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return {'message': 'format must be ndjson or csv'}, 400
+    try:
+        filters = parse_order_filters(args)
+    except ValueError as e:
+        return {'message': str(e)}, 400
+    
+    headers = {
+        'Content-Type': EXPORT_FORMATS[fmt],
+        'Content-Disposition': f'attachment; filename=orders.{fmt}'
+    }
+    return order_export_chunks(storage.iter_orders(**filters), fmt), 200, headers
+
+@api.route('/api/admin/orders', methods=['GET'])
+@auth.admin_required
+def admin_get_orders():
+    return list_all_orders(*parse_page_args())
+
+@api.route('/api/admin/orders/<order_id>/status', methods=['PUT'])
+@auth.admin_required
 def admin_update_order_status(order_id):
-    user_id = get_jwt_identity()
-    if user_id not in users or users[user_id]['role'] != 'admin':
-        return jsonify({'message': 'Access denied'}), 403
+    return update_order_status(order_id, request.get_json())
+
+@api.route('/api/admin/orders/status', methods=['POST'])
+@auth.admin_required
+def admin_bulk_update_order_status():
+    return bulk_update_order_status(request.get_json())
+
+@api.route('/api/admin/orders/export', methods=['GET'])
+@auth.admin_required
+def admin_export_orders():
+    return export_orders(request.args)
+
+@api.route('/api/admin/mail/stats', methods=['GET'])
+@auth.admin_required
+def admin_mail_stats():
+    if mailer is None:
+        return jsonify({'enabled': False}), 200
     
-    data = request.get_json()
-    new_status = data.get('status')
+    return jsonify({'enabled': True, **mailer.stats()}), 200
+
+@api.route('/api/admin/contact/stats', methods=['GET'])
+@auth.admin_required
+def admin_contact_stats():
+    return jsonify(contact_intake.stats()), 200
+
+def contact_export_chunks(messages, fmt, batch_size=200):
+    """Encode contact messages as NDJSON or CSV, a batch of rows per chunk"""
+    out = io.StringIO()
+    writer = None
+    if fmt == 'csv':
+        writer = csv.writer(out)
+        writer.writerow(EXPORT_FIELDS)
     
-    order = next((o for o in orders if o['id'] == order_id), None)
-    if not order:
-        return jsonify({'message': 'Order not found'}), 404
+    rows = 0
+    for message in messages:
+        record = export_record(message)
+        if writer is None:
+            out.write(dumps(record))
+            out.write('\n')
+        else:
+            writer.writerow([record[field] for field in EXPORT_FIELDS])
+        rows += 1
+        if rows % batch_size == 0:
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
     
-    order['status'] = new_status
-    return jsonify({'message': 'Order status updated', 'order': order}), 200
+    if out.tell():
+        yield out.getvalue()
+
+def export_contact_messages(args):
+    """Streaming export of the stored contact messages, oldest first"""
+    fmt = args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return {'message': 'format must be ndjson or csv'}, 400
+    
+    headers = {
+        'Content-Type': EXPORT_FORMATS[fmt],
+        'Content-Disposition': f'attachment; filename=contact-messages.{fmt}'
+    }
+    return contact_export_chunks(storage.iter_contact_messages(), fmt), 200, headers
+
+@api.route('/api/admin/contact/messages', methods=['GET'])
+@auth.admin_required
+def admin_export_contact_messages():
+    return export_contact_messages(request.args)
+
+# =============== ANALYTICS ===============
+
+# Counters are updated by storage as orders are placed and change status,
+# so a report reads one bucket per day instead of scanning orders
+
+ANALYTICS_DEFAULT_DAYS = 30
+
+def order_analytics(args):
+    """Orders, items and revenue per day, status, service and option for ?since=&until= (YYYY-MM-DD)
+
+    Defaults to the last 30 days up to today.
+    """
+    try:
+        until = date.fromisoformat(args['until']) if args.get('until') else date.today()
+        since = (date.fromisoformat(args['since']) if args.get('since')
+                 else until - timedelta(days=ANALYTICS_DEFAULT_DAYS - 1))
+    except ValueError:
+        return {'message': 'Dates must be YYYY-MM-DD'}, 400
+    
+    if since > until:
+        return {'message': 'since must not be after until'}, 400
+    if (until - since).days >= RETENTION_DAYS:
+        return {'message': f'At most {RETENTION_DAYS} days per report'}, 400
+    
+    first_day, last_day = since.toordinal(), until.toordinal()
+    return summarize(storage.query_order_stats(first_day, last_day), first_day, last_day, catalog), 200
+
+def rebuild_analytics():
+    """Recount the counters from the stored orders, e.g. after editing orders by hand"""
+    started = time.perf_counter()
+    counted = storage.rebuild_order_stats()
+    return {'message': 'Analytics rebuilt', 'orders': counted,
+            'seconds': round(time.perf_counter() - started, 3), 'vectorized': load_numpy() is not None}, 200
+
+@api.route('/api/admin/analytics', methods=['GET'])
+@auth.admin_required
+def admin_order_analytics():
+    return order_analytics(request.args)
+
+@api.route('/api/admin/analytics/rebuild', methods=['POST'])
+@auth.admin_required
+def admin_rebuild_analytics():
+    return rebuild_analytics()
 
 # =============== HEALTH CHECK ===============
 
-@app.route('/health', methods=['GET'])
+@api.route('/health', methods=['GET'])
 def health_check():
     return jsonify({
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
-        'version': '1.0.0'
+        'version': '1.0.0',
+        'content_version': content.current.version
     }), 200
 
-@app.route('/', methods=['GET'])
+@api.route('/', methods=['GET'])
 def root():
     return jsonify({
         'message': 'Smart Laundry Backend API',
@@ -611,37 +1105,127 @@ def root():
             'cart': '/api/cart/*',
             'orders': '/api/orders/*',
             'contact': '/api/contact',
-            'health': '/health'
+            'health': '/health',
+            'metrics': '/metrics'
         }
     }), 200
 
 # =============== ERROR HANDLERS ===============
 
-@app.errorhandler(404)
+@api.app_errorhandler(404)
 def not_found(error):
     return jsonify({'message': 'Endpoint not found'}), 404
 
-@app.errorhandler(500)
+@api.app_errorhandler(500)
 def internal_error(error):
     return jsonify({'message': 'Internal server error'}), 500
 
-@jwt.expired_token_loader
-def expired_token_callback(jwt_header, jwt_payload):
-    return jsonify({'message': 'Token has expired'}), 401
+# 401s for missing, invalid and expired tokens come from auth.py (AuthError)
+
+# =============== APPLICATION FACTORY ===============
+
+_init_lock = threading.Lock()
+_initialized = False
+
+def init_subsystems():
+    """Build the subsystems declared at the top of this module, once per process"""
+    global _initialized, storage, order_events, mailer, otp_sweeper, contact_intake, contact_digest
+    global rate_buckets, otp_address_limiter, otp_ip_limiter, admission
+    global translations, content, catalog, search_indexes, scheduler
+    with _init_lock:
+        if _initialized:
+            return
+
+        storage = create_storage(os.environ.get('STORAGE_URL', 'memory://'),
+                                 wal_fsync=os.environ.get('WAL_FSYNC', '1') not in ('0', 'false', 'no'),
+                                 snapshot_interval=int(os.environ.get('WAL_SNAPSHOT_INTERVAL', 300)))
+        order_events = create_broker(storage)
+
+        mail_config = MailConfig.from_env()
+        mailer = MailQueue(mail_config) if mail_config else None
+        if mailer is not None:
+            metrics.gauge('laundry_mail_queue_depth', 'Outbound emails waiting to be sent',
+                          lambda: mailer.stats()['queue_depth'])
+
+        otp_sweeper = PeriodicTask(storage.purge_expired, interval=30, name='otp-sweeper', label='OTP sweep')
+
+        contact_intake = ContactIntake(
+            storage, mailer,
+            digest_to=[a.strip() for a in os.environ.get('CONTACT_DIGEST_TO', '').split(',') if a.strip()],
+            archive=os.environ.get('CONTACT_ARCHIVE') or (None if storage.durable else 'contact-messages.ndjson'))
+        contact_digest = PeriodicTask(contact_intake.send_digest,
+                                      interval=int(os.environ.get('CONTACT_DIGEST_INTERVAL', 3600)),
+                                      name='contact-digest', label='Contact digest')
+        metrics.gauge('laundry_contact_queue_depth', 'Contact messages waiting to be stored',
+                      lambda: contact_intake.stats()['queue_depth'])
+
+        rate_buckets = create_buckets(os.environ.get('RATE_LIMIT_URL'), storage.buckets)
+        otp_address_limiter = RateLimiter(rate_buckets, 'otp-address', period=600, limit=OTP_LIMIT_PER_ADDRESS)
+        otp_ip_limiter = RateLimiter(rate_buckets, 'otp-ip', period=600, limit=OTP_LIMIT_PER_IP)
+        admission = AdmissionControl(
+            buckets=rate_buckets, rules=ADMISSION_RULES,
+            default_rule=AdmissionRule(per_ip=admission_limit(RATE_LIMIT_PER_IP, 60)) if RATE_LIMIT_PER_IP else None,
+            max_concurrency=int(os.environ.get('MAX_CONCURRENT_REQUESTS', 64)),
+            reserved_for_users=int(os.environ.get('RESERVED_FOR_SIGNED_IN', 16)),
+            exempt=('/health', '/metrics', '/api/orders/stream'),
+            identify=auth.optional_user_id)
+
+        translations = load_translations(LOCALES_DIR)
+        content = ContentLoader(CONTENT_PATH, on_change=on_content_change,
+                                interval=float(os.environ.get('CONTENT_RELOAD_INTERVAL', 2)),
+                                translations=translations)
+        catalog = content.current.catalog
+        search_indexes = {lang: SearchIndex(search_documents(content.current, lang)) for lang in LANGUAGES}
+
+        scheduler = Scheduler(storage,
+                              slot_minutes=int(os.environ.get('SLOT_MINUTES', 120)),
+                              day_start=int(os.environ.get('SLOT_DAY_START', 8)),
+                              day_end=int(os.environ.get('SLOT_DAY_END', 20)),
+                              horizon_days=int(os.environ.get('SLOT_HORIZON_DAYS', 7)),
+                              pickup_capacity=int(os.environ.get('PICKUP_SLOT_CAPACITY', 10)),
+                              delivery_capacity=int(os.environ.get('DELIVERY_SLOT_CAPACITY', 10)),
+                              lead_minutes=int(os.environ.get('PICKUP_LEAD_MINUTES', 120)))
+        _initialized = True
+
+# The app from the latest create_app(); content reloads re-render the cached
+# responses in its context
+app = None
+
+def create_app():
+    """The Flask app for the routes above, over this module's subsystems
 
-@jwt.invalid_token_loader
-def invalid_token_callback(error):
-    return jsonify({'message': 'Invalid token'}), 401
+    The first call in a process builds the subsystems; later ones share them.
+    The read-only data (content, catalog, translations, search indexes and
+    the serialized responses) is built here, and anything holding threads or
+    connections starts on first use in each process. Loaded with gunicorn
+    --preload, the master builds it all once and its workers share the
+    memory copy-on-write (gunicorn.conf.py freezes the GC there, so the
+    collector doesn't unshare it).
+    """
+    global app
+    init_subsystems()
+    app = Flask(__name__)
+    if TRUSTED_PROXY_HOPS:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS)
+    app.json = ModelJSONProvider(app)
+    app.config.update(JWT_CONFIG)
+    jwt.init_app(app)
+    CORS(app, origins=CORS_ORIGINS, expose_headers=CORS_EXPOSE_HEADERS)
+    # Hooks run in this order: metrics time everything, admission control
+    # runs ahead of every route
+    metrics.init_app(app)
+    admission.init_app(app)
+    app.register_blueprint(api)
 
-@jwt.unauthorized_loader
-def missing_token_callback(error):
-    return jsonify({'message': 'Token is required'}), 401
+    with app.app_context():
+        response_cache.rebuild()
+    return app
 
 # =============== PRODUCTION CONFIG ===============
 
 if __name__ == '__main__':
     # Development server
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    create_app().run(debug=True, host='0.0.0.0', port=5000)
 
-# For production, use gunicorn:
-# gunicorn -w 4 -b 0.0.0.0:5000 app:app
\ No newline at end of file
+# For production, use gunicorn (gunicorn.conf.py names the app):
+# gunicorn --preload -w 4 -b 0.0.0.0:5000
\ No newline at end of file
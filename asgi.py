@@ -0,0 +1,481 @@
+"""ASGI entry point: the same API, served by an event loop
+
+    uvicorn asgi:application --workers 2
+
+Auth, cart, checkout and order routes are handled natively by async
+handlers that share their logic and admission control with the Flask
+views in app.py, and the order event stream is served without holding a
+thread per client. Storage calls that can block (the SQLite backend) run
+on a bounded thread pool, so slow I/O never holds up other connections.
+Every other route is passed to the Flask app on the same thread pool.
+"""
+import asyncio
+import io
+import os
+import re
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import app as backend
+from admission import forwarded_client
+from auth import AuthError, token_from_header
+
+executor = ThreadPoolExecutor(max_workers=int(os.environ.get('ASGI_THREADS', 32)),
+                              thread_name_prefix='asgi')
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Request:
+    def __init__(self, scope, body, params):
+        self.scope = scope
+        self.body = body
+        self.params = params
+        self.headers = {k.decode('latin-1').lower(): v.decode('latin-1')
+                        for k, v in scope.get('headers', [])}
+        self.query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        self.user_id = None
+        self.admitted = False
+
+    def json(self):
+        if not self.body:
+            return {}
+        try:
+            data = backend.app.json.loads(self.body)
+        except ValueError:
+            raise HTTPError(400, 'Invalid JSON')
+        if not isinstance(data, dict):
+            raise HTTPError(400, 'Invalid JSON')
+        return data
+
+    def arg(self, name):
+        values = self.query.get(name)
+        return values[0] if values else None
+
+    def page_args(self):
+        """Same as app.parse_page_args, from the query string"""
+        limit = self.arg('limit')
+        try:
+            limit = max(1, min(int(limit), backend.MAX_PAGE_SIZE)) if limit is not None else None
+        except ValueError:
+            limit = None
+        return limit, self.arg('after')
+
+    @property
+    def client_ip(self):
+        """The client's address, past TRUSTED_PROXY_HOPS proxies, as ProxyFix gives Flask"""
+        client = self.scope.get('client')
+        return forwarded_client(client[0] if client else None, self.headers.get('x-forwarded-for'),
+                                backend.TRUSTED_PROXY_HOPS)
+
+
+# =============== AUTH ===============
+
+def authenticate(request, ticket=None):
+    """Verify the bearer token (or a ``ticket`` from ?ticket=) like @auth.required and set request.user_id"""
+    header = request.headers.get('authorization')
+    try:
+        if ticket and not header and request.arg('ticket'):
+            request.user_id = backend.auth.identity(request.arg('ticket'), ticket)
+        else:
+            request.user_id = backend.auth.identity(token_from_header(header))
+    except AuthError as e:
+        raise HTTPError(e.status, e.message)
+
+
+def optional_user_id(request):
+    """Like auth.optional_user_id, for admission decisions before the route's own auth"""
+    try:
+        return backend.auth.identity(token_from_header(request.headers.get('authorization')))
+    except AuthError:
+        return None
+
+
+async def admit(request, rule):
+    """None if admission control lets the request in (holding a slot), else its 503/429"""
+    admission = backend.admission
+    user_id = admission.lazy_user_id(lambda: optional_user_id(request))
+    if admission.blocking:
+        loop = asyncio.get_running_loop()
+        if not await loop.run_in_executor(executor, admission.acquire, user_id):
+            return admission.overloaded()
+        request.admitted = True
+        return await loop.run_in_executor(executor, admission.check, rule, request.client_ip, user_id)
+    if not admission.acquire(user_id):
+        return admission.overloaded()
+    request.admitted = True
+    return admission.check(rule, request.client_ip, user_id)
+
+
+async def release(request):
+    if not request.admitted:
+        return
+    if backend.admission.blocking:
+        await asyncio.get_running_loop().run_in_executor(executor, backend.admission.release)
+    else:
+        backend.admission.release()
+
+
+async def require_admin(request):
+    if not await call(backend.auth.is_admin, request.user_id):
+        raise HTTPError(403, 'Access denied')
+
+
+async def call(fn, *args):
+    """Run route logic inside the Flask app context, off the loop if it may block"""
+    def run():
+        with backend.app.app_context():
+            return fn(*args)
+
+    if backend.storage.blocking:
+        return await asyncio.get_running_loop().run_in_executor(executor, run)
+    return run()
+
+
+# =============== HANDLERS ===============
+
+async def send_otp(request):
+    return await call(backend.request_otp, request.json(), request.client_ip)
+
+
+async def login(request):
+    return await call(backend.verify_otp_login, request.json())
+
+
+async def get_profile(request):
+    return await call(backend.get_user_profile, request.user_id)
+
+
+async def get_cart(request):
+    return await call(backend.view_cart, request.user_id)
+
+
+async def add_to_cart(request):
+    return await call(backend.cart_add, request.user_id, request.json())
+
+
+async def decrease_cart_qty(request):
+    return await call(backend.cart_decrease, request.user_id, request.json())
+
+
+async def remove_from_cart(request):
+    return await call(backend.cart_remove, request.user_id, request.params['item_id'])
+
+
+async def update_cart_items(request):
+    return await call(backend.cart_apply_operations, request.user_id, request.json())
+
+
+async def clear_cart(request):
+    return await call(backend.cart_clear, request.user_id)
+
+
+async def stream_ticket(request):
+    return await call(backend.issue_stream_ticket, request.user_id)
+
+
+async def checkout(request):
+    return await call(backend.checkout_order, request.user_id, request.json(), request.body,
+                      request.headers.get('idempotency-key'))
+
+
+async def get_my_orders(request):
+    return await call(backend.list_my_orders, request.user_id, *request.page_args())
+
+
+async def admin_get_orders(request):
+    return await call(backend.list_all_orders, *request.page_args())
+
+
+async def admin_bulk_update_status(request):
+    return await call(backend.bulk_update_order_status, request.json())
+
+
+def route(pattern):
+    """Compile a Flask-style rule ('/api/cart/<item_id>') to a regex"""
+    return re.compile('^' + re.sub(r'<(\w+)>', r'(?P<\1>[^/]+)', pattern) + '$')
+
+
+PUBLIC, USER, ADMIN = None, 'user', 'admin'
+
+# (method, rule, handler, who may call it)
+ROUTES = [
+    ('POST', '/api/auth/send-otp', send_otp, PUBLIC),
+    ('POST', '/api/auth/login', login, PUBLIC),
+    ('GET', '/api/auth/me', get_profile, USER),
+    ('GET', '/api/cart', get_cart, USER),
+    ('POST', '/api/cart/add', add_to_cart, USER),
+    ('POST', '/api/cart/decrease', decrease_cart_qty, USER),
+    ('POST', '/api/cart/items', update_cart_items, USER),
+    ('DELETE', '/api/cart', clear_cart, USER),
+    ('DELETE', '/api/cart/<item_id>', remove_from_cart, USER),
+    ('POST', '/api/checkout', checkout, USER),
+    ('GET', '/api/orders/my', get_my_orders, USER),
+    ('POST', '/api/orders/stream/ticket', stream_ticket, USER),
+    ('GET', '/api/admin/orders', admin_get_orders, ADMIN),
+    ('POST', '/api/admin/orders/status', admin_bulk_update_status, ADMIN),
+]
+COMPILED_ROUTES = [(method, rule, route(rule), handler, access)
+                   for method, rule, handler, access in ROUTES]
+
+
+def match(method, path):
+    for route_method, rule, regex, handler, access in COMPILED_ROUTES:
+        if route_method == method:
+            found = regex.match(path)
+            if found:
+                return rule, handler, access, found.groupdict()
+    return None
+
+
+# =============== RESPONSES ===============
+
+def cors_headers(request_headers):
+    origin = request_headers.get('origin')
+    if origin not in backend.CORS_ORIGINS:
+        return []
+    return [(b'access-control-allow-origin', origin.encode('latin-1')),
+            (b'access-control-expose-headers', ', '.join(backend.CORS_EXPOSE_HEADERS).encode('latin-1')),
+            (b'vary', b'Origin')]
+
+
+def encode_result(result):
+    """(body, status[, headers]) from the route logic to an ASGI response"""
+    body, status = result[0], result[1]
+    headers = result[2] if len(result) > 2 else {}
+    with backend.app.app_context():
+        payload = f"{backend.app.json.dumps(body, separators=(',', ':'))}\n".encode('utf-8')
+    raw_headers = [(b'content-type', b'application/json'),
+                   (b'content-length', str(len(payload)).encode())]
+    raw_headers += [(k.lower().encode('latin-1'), str(v).encode('latin-1')) for k, v in headers.items()]
+    return status, raw_headers, payload
+
+
+async def send_response(send, status, headers, body):
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+# =============== ORDER EVENTS ===============
+
+async def wait_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def stream_orders(scope, receive, send):
+    """/api/orders/stream without tying up a thread per connected client"""
+    request = Request(scope, b'', {})
+    start = time.perf_counter()
+    try:
+        authenticate(request, ticket='stream')
+        channels = await call(backend.order_stream_channels, request.user_id)
+    except HTTPError as e:
+        status, headers, payload = encode_result(({'message': e.message}, e.status))
+        headers += cors_headers(request.headers)
+        backend.metrics.observe('GET', '/api/orders/stream', status, time.perf_counter() - start, 0, len(payload))
+        return await send_response(send, status, headers, payload)
+
+    subscription = backend.order_events.subscribe(channels)
+    headers = [(b'content-type', b'text/event-stream; charset=utf-8')]
+    headers += [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in backend.SSE_HEADERS.items()]
+    headers += cors_headers(request.headers)
+    backend.metrics.observe('GET', '/api/orders/stream', 200, time.perf_counter() - start, 0, 0)
+
+    disconnected = asyncio.ensure_future(wait_disconnect(receive))
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+        while True:
+            getter = asyncio.ensure_future(subscription.get_async(backend.SSE_HEARTBEAT))
+            done, _ = await asyncio.wait({getter, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if disconnected in done:
+                getter.cancel()
+                return
+            events = getter.result()
+            chunk = ''.join(backend.format_sse(event_id, event) for event_id, event in events)
+            await send({'type': 'http.response.body', 'body': (chunk or ': keep-alive\n\n').encode('utf-8'),
+                        'more_body': True})
+    finally:
+        disconnected.cancel()
+        subscription.close()
+
+
+# =============== EXPORTS ===============
+
+async def export_orders(scope, receive, send):
+    """Send the export chunk by chunk instead of buffering it like the WSGI fallback"""
+    request = Request(scope, b'', {})
+    start = time.perf_counter()
+    try:
+        authenticate(request)
+        await require_admin(request)
+        args = {name: values[0] for name, values in request.query.items()}
+        result = await call(backend.export_orders, args)
+    except HTTPError as e:
+        result = ({'message': e.message}, e.status)
+
+    if result[1] != 200:
+        status, headers, payload = encode_result(result)
+        headers += cors_headers(request.headers)
+        backend.metrics.observe('GET', '/api/admin/orders/export', status, time.perf_counter() - start, 0, len(payload))
+        return await send_response(send, status, headers, payload)
+
+    chunks, _, extra_headers = result
+    headers = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in extra_headers.items()]
+    headers += cors_headers(request.headers)
+    await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+
+    loop = asyncio.get_running_loop()
+    size = 0
+    while True:
+        if backend.storage.blocking:
+            chunk = await loop.run_in_executor(executor, next, chunks, None)
+        else:
+            chunk = next(chunks, None)
+        if chunk is None:
+            break
+        data = chunk.encode('utf-8')
+        size += len(data)
+        await send({'type': 'http.response.body', 'body': data, 'more_body': True})
+    await send({'type': 'http.response.body', 'body': b''})
+    backend.metrics.observe('GET', '/api/admin/orders/export', 200, time.perf_counter() - start, 0, size)
+
+
+# (method, path) -> handler that writes its own streaming response
+STREAMS = {
+    ('GET', '/api/orders/stream'): stream_orders,
+    ('GET', '/api/admin/orders/export'): export_orders,
+}
+
+
+# =============== WSGI FALLBACK ===============
+
+def wsgi_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'REMOTE_ADDR': client[0],
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'CONTENT_LENGTH':
+            key = f'HTTP_{name}'
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def run_wsgi(environ):
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+
+    result = backend.app(environ, start_response)
+    try:
+        body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return started['status'], started['headers'], body
+
+
+# =============== APPLICATION ===============
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+def ensure_app():
+    """Build the Flask app and the backend's subsystems on the first lifespan event or request"""
+    if backend.app is None:
+        backend.create_app()
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            ensure_app()
+            backend.content.ensure_started()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+    ensure_app()
+
+    stream = STREAMS.get((scope['method'], scope['path']))
+    if stream is not None:
+        return await stream(scope, receive, send)
+
+    body = await read_body(receive)
+    found = match(scope['method'], scope['path'])
+
+    if found is None:
+        loop = asyncio.get_running_loop()
+        status, headers, payload = await loop.run_in_executor(executor, run_wsgi, wsgi_environ(scope, body))
+        return await send_response(send, status, headers, payload)
+
+    rule, handler, access, params = found
+    request = Request(scope, body, params)
+    start = time.perf_counter()
+    try:
+        result = await admit(request, rule)
+        if result is None:
+            if access is not PUBLIC:
+                authenticate(request)
+            if access == ADMIN:
+                await require_admin(request)
+            result = await handler(request)
+    except HTTPError as e:
+        result = ({'message': e.message}, e.status)
+    except Exception:
+        traceback.print_exc()
+        result = ({'message': 'Internal server error'}, 500)
+    finally:
+        await release(request)
+
+    status, headers, payload = encode_result(result)
+    headers += cors_headers(request.headers)
+    backend.metrics.observe(scope['method'], rule, status, time.perf_counter() - start,
+                            len(body), len(payload))
+    await send_response(send, status, headers, payload)
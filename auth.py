@@ -0,0 +1,210 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+import jwt
+from flask import g, jsonify, request
+
+
+class AuthError(Exception):
+    def __init__(self, message, status=401):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def token_from_header(header):
+    """The JWT from an Authorization header, parsed like flask-jwt-extended does"""
+    header = (header or '').strip().strip(',')
+    if not header:
+        raise AuthError('Token is required')
+
+    bearer = [value for value in re.split(r',\s*', header) if value.split()[:1] == ['Bearer']]
+    if len(bearer) != 1:
+        raise AuthError('Token is required')
+
+    parts = bearer[0].split()
+    if len(parts) != 2:
+        raise AuthError('Invalid token')
+    return parts[1]
+
+
+class TTLCache:
+    """A thread-safe LRU map whose entries also expire"""
+
+    def __init__(self, max_entries=10000, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, expires)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            if entry[1] <= time.time():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, expires=None):
+        """Cache ``value`` for the TTL, or until ``expires`` if that comes sooner"""
+        expires_at = time.time() + self.ttl
+        if expires is not None:
+            expires_at = min(expires_at, expires)
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class Authenticator:
+    """Access-token checks and role lookups, with both results cached
+
+    Verified claims are kept per token (keyed by its SHA-256, never the raw
+    token) until the token expires or ``token_ttl`` passes, so repeat
+    requests skip decoding and the signature check. Roles are cached per
+    user for ``role_ttl`` seconds; ``invalidate`` drops one right away in
+    this worker, and the TTL bounds how long other workers can lag.
+    """
+
+    def __init__(self, secret, load_user, algorithm='HS256', leeway=0, identity_claim='sub',
+                 token_ttl=300, role_ttl=60, max_entries=10000):
+        self.secret = secret
+        self.load_user = load_user
+        self.algorithm = algorithm
+        self.leeway = leeway
+        self.identity_claim = identity_claim
+        self.tokens = TTLCache(max_entries, token_ttl)
+        self.roles = TTLCache(max_entries, role_ttl)
+
+    @classmethod
+    def from_config(cls, config, load_user, **kwargs):
+        """Use the same JWT settings as flask-jwt-extended, from a Flask-style config mapping"""
+        return cls(config['JWT_SECRET_KEY'], load_user,
+                   algorithm=config.get('JWT_ALGORITHM', 'HS256'),
+                   leeway=config.get('JWT_DECODE_LEEWAY', 0),
+                   identity_claim=config.get('JWT_IDENTITY_CLAIM', 'sub'), **kwargs)
+
+    @classmethod
+    def from_app(cls, app, load_user, **kwargs):
+        return cls.from_config(app.config, load_user, **kwargs)
+
+    # =============== TOKENS ===============
+
+    def verify(self, token, token_type='access'):
+        """The claims of a valid token of ``token_type``; raises AuthError otherwise"""
+        key = hashlib.sha256(token.encode('utf-8')).digest()
+        claims = self.tokens.get(key)
+        if claims is None:
+            try:
+                claims = jwt.decode(token, self.secret, algorithms=[self.algorithm], leeway=self.leeway)
+            except jwt.ExpiredSignatureError:
+                raise AuthError('Token has expired')
+            except jwt.PyJWTError:
+                raise AuthError('Invalid token')
+
+            if claims.get(self.identity_claim) is None:
+                raise AuthError('Invalid token')
+            exp = claims.get('exp')
+            self.tokens.set(key, claims, None if exp is None else exp + self.leeway)
+
+        # Checked on cache hits too, so a ticket never passes as an access token
+        if claims.get('type') != token_type:
+            raise AuthError('Invalid token')
+        return claims
+
+    def identity(self, token, token_type='access'):
+        return self.verify(token, token_type)[self.identity_claim]
+
+    def issue_ticket(self, user_id, token_type, ttl):
+        """A token of ``token_type`` for one user, valid for ``ttl`` seconds
+
+        Tickets can't stand in for access tokens, so a short-lived one is
+        safe to put in a URL where an access token would end up in logs.
+        """
+        now = int(time.time())
+        return jwt.encode({self.identity_claim: user_id, 'type': token_type, 'iat': now, 'exp': now + ttl},
+                          self.secret, algorithm=self.algorithm)
+
+    # =============== ROLES ===============
+
+    def role(self, user_id):
+        """The user's role, or None for an unknown user"""
+        role = self.roles.get(user_id, False)
+        if role is False:
+            user = self.load_user(user_id)
+            role = user.role if user else None
+            self.roles.set(user_id, role)
+        return role
+
+    def is_admin(self, user_id):
+        return bool(user_id) and self.role(user_id) == 'admin'
+
+    def invalidate(self, user_id):
+        """Forget the cached role after the user record changes"""
+        self.roles.delete(user_id)
+
+    # =============== FLASK ===============
+
+    def request_token(self):
+        return token_from_header(request.headers.get('Authorization'))
+
+    def required(self, fn=None, ticket=None):
+        """Require an access token and set ``g.user_id``
+
+        ``ticket`` is a token type also accepted from the ``?ticket=`` query
+        argument (see ``issue_ticket``), for clients like EventSource that
+        can't send headers. Access tokens are never read from the URL.
+        """
+        if fn is None:
+            return lambda fn: self.required(fn, ticket)
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            try:
+                if ticket and not request.headers.get('Authorization') and request.args.get('ticket'):
+                    g.user_id = self.identity(request.args['ticket'], ticket)
+                else:
+                    g.user_id = self.identity(self.request_token())
+            except AuthError as e:
+                return jsonify({'message': e.message}), e.status
+            return fn(*args, **kwargs)
+        return wrapper
+
+    def admin_required(self, fn):
+        """Like ``required``, and answer 403 unless the user is an admin"""
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not self.is_admin(g.user_id):
+                return jsonify({'message': 'Access denied'}), 403
+            return fn(*args, **kwargs)
+        return self.required(wrapper)
+
+    def optional_user_id(self):
+        """The user id if the request has a valid token, else None"""
+        try:
+            return self.identity(self.request_token())
+        except AuthError:
+            return None
+
+
+def current_user_id():
+    return g.user_id
@@ -0,0 +1,184 @@
+"""Write-ahead log benchmarks for the memory+wal storage backend
+
+Drives DurableMemoryStorage directly with a checkout-shaped workload from
+several threads, then measures how long a restart takes to recover from
+the log alone, from a snapshot alone and from a snapshot plus a log tail.
+Write amplification is the bytes written to disk (log frames plus
+snapshots) per byte of logged change.
+
+    python benchmarks/durability.py                     # 20000 sessions, 8 threads
+    python benchmarks/durability.py -n 100000 -c 32
+    python benchmarks/durability.py --no-fsync          # page cache only, as WAL_FSYNC=0
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from models import Order, User, epoch_us  # noqa: E402
+from run import RESULTS_DIR, git_revision  # noqa: E402
+from scheduling import DELIVERY, PICKUP  # noqa: E402
+from storage import DurableMemoryStorage  # noqa: E402
+
+OPTIONS = [('shirt', {'label': 'Shirt', 'price': 25, 'emoji': '👔'}),
+           ('suit', {'label': 'Suit', 'price': 200, 'emoji': '🤵'}),
+           ('saree', {'label': 'Silk Saree', 'price': 150.5, 'emoji': '🥻'})]
+
+
+def session(storage, n, now):
+    """One customer: login, three cart taps, checkout, then two status changes"""
+    user_id = f'user{n}@example.com'
+    storage.save_user(User(user_id, user_id, '', '', 'customer', now + n))
+    for item_id, option in OPTIONS:
+        cart, _ = storage.update_cart(user_id, lambda cart: cart.add(item_id, option) and None)
+
+    pickup = now + 3_600_000_000 * (n % 50)
+    order = Order(f'ORD{n:08d}', user_id, [line.copy() for line in cart.items.values()],
+                  cart.total, 'Pending', now + n, pickup, pickup + 86_400_000_000)
+    storage.place_order(order, [(PICKUP, pickup, 10**9), (DELIVERY, order.delivery, 10**9)])
+    storage.set_order_status(order.id, 'Picked Up')
+    storage.set_orders_status('Washing', [order.id])
+
+
+def write_workload(directory, start, count, concurrency, fsync):
+    """Run ``count`` sessions; returns (seconds, storage) with the storage still open"""
+    storage = DurableMemoryStorage(directory, fsync=fsync, snapshot_interval=10**9,
+                                   snapshot_records=10**12)
+    now = epoch_us(datetime.now())
+    numbers = iter(range(start, start + count))
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                n = next(numbers, None)
+            if n is None:
+                return
+            session(storage, n, now)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    began = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    storage.wal.flush()
+    return time.perf_counter() - began, storage
+
+
+def recover(directory):
+    """(seconds, orders) to open the directory"""
+    began = time.perf_counter()
+    storage = DurableMemoryStorage(directory)
+    elapsed = time.perf_counter() - began
+    orders = len(storage.orders)
+    storage.close()
+    return elapsed, orders
+
+
+def directory_bytes(directory):
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--sessions', type=int, default=20000)
+    parser.add_argument('-c', '--concurrency', type=int, default=8, help='writer threads')
+    parser.add_argument('--tail', type=float, default=0.1,
+                        help='sessions logged after the snapshot, as a fraction of -n')
+    parser.add_argument('--no-fsync', action='store_true', help='skip fsync, as WAL_FSYNC=0')
+    parser.add_argument('-o', '--output', help='result file (default: benchmarks/results/)')
+    args = parser.parse_args(argv)
+
+    tmpdir = tempfile.mkdtemp(prefix='laundry-wal-bench-')
+    directory = os.path.join(tmpdir, 'wal')
+    fsync = not args.no_fsync
+    try:
+        elapsed, storage = write_workload(directory, 0, args.sessions, args.concurrency, fsync)
+        stats = dict(storage.wal.stats)
+        storage.close()
+        payload = stats['bytes'] - stats['records'] * 8
+        log_only, orders = recover(directory)
+
+        storage = DurableMemoryStorage(directory, fsync=fsync)
+        snapshot_bytes = storage.snapshot()
+        storage.close()
+        snapshot_only, _ = recover(directory)
+
+        tail = int(args.sessions * args.tail)
+        tail_elapsed, storage = write_workload(directory, args.sessions, tail, args.concurrency, fsync)
+        tail_stats = storage.wal.stats
+        storage.close()
+        with_tail, tail_orders = recover(directory)
+
+        result = {
+            'revision': git_revision(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'sessions': args.sessions,
+            'concurrency': args.concurrency,
+            'fsync': fsync,
+            'write': {
+                'records': stats['records'],
+                'records_per_s': round(stats['records'] / elapsed),
+                'sessions_per_s': round(args.sessions / elapsed),
+                'fsyncs': stats['batches'] if fsync else 0,
+                'records_per_batch': round(stats['records'] / stats['batches'], 2),
+                'payload_bytes': payload,
+                'log_bytes': stats['bytes'],
+                'log_amplification': round(stats['bytes'] / payload, 3),
+            },
+            'snapshot': {
+                'bytes': snapshot_bytes,
+                'bytes_per_order': round(snapshot_bytes / orders, 1),
+                'vs_log': round(snapshot_bytes / stats['bytes'], 3),
+            },
+            'recovery': {
+                'log_only_s': round(log_only, 3),
+                'snapshot_only_s': round(snapshot_only, 3),
+                'snapshot_plus_tail_s': round(with_tail, 3),
+                'tail_records': tail_stats['records'],
+                'orders': tail_orders,
+            },
+            # Everything written to disk over the run, per byte of logged change
+            'write_amplification': round(
+                (stats['bytes'] + snapshot_bytes + tail_stats['bytes'])
+                / (payload + tail_stats['bytes'] - tail_stats['records'] * 8), 3),
+            'disk_bytes_after': directory_bytes(directory),
+        }
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    write = result['write']
+    print(f"write      {write['records']} records  {write['records_per_s']} records/s  "
+          f"{write['sessions_per_s']} sessions/s  {write['records_per_batch']} records/fsync  "
+          f"log x{write['log_amplification']}")
+    print(f"snapshot   {result['snapshot']['bytes']} bytes  "
+          f"{result['snapshot']['bytes_per_order']} bytes/order  x{result['snapshot']['vs_log']} of the log")
+    recovery = result['recovery']
+    print(f"recovery   log only {recovery['log_only_s']} s  snapshot {recovery['snapshot_only_s']} s  "
+          f"snapshot + {recovery['tail_records']} records {recovery['snapshot_plus_tail_s']} s  "
+          f"({recovery['orders']} orders)")
+    print(f"write amplification x{result['write_amplification']}")
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{result['revision']}-durability.json")
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"\nResults written to {output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
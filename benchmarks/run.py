@@ -0,0 +1,414 @@
+"""Latency and throughput benchmarks for the Flask API
+
+Runs realistic scenarios either in-process through Flask's test client or
+over HTTP against a local gunicorn, and writes the results as JSON so runs
+from different commits can be compared.
+
+    python benchmarks/run.py                          # test client, all scenarios
+    python benchmarks/run.py -s cart -s checkout -n 2000
+    python benchmarks/run.py --gunicorn -w 4 -c 16    # local gunicorn, 16 client threads
+    python benchmarks/run.py --asgi -w 4 -c 16        # same scenarios against uvicorn asgi:application
+    python benchmarks/run.py --compare benchmarks/results/<older>.json
+"""
+import argparse
+import contextlib
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+# Benchmarks log in thousands of times from one address
+os.environ.setdefault('OTP_LIMIT_PER_ADDRESS', '1000000')
+os.environ.setdefault('OTP_LIMIT_PER_IP', '1000000')
+os.environ.setdefault('RATE_LIMIT_SCALE', '1000000')
+# ...and checks out far more orders than a week of van slots would take
+os.environ.setdefault('PICKUP_SLOT_CAPACITY', '1000000')
+os.environ.setdefault('DELIVERY_SLOT_CAPACITY', '1000000')
+
+
+# =============== CLIENTS ===============
+
+class Recorder:
+    """Collects (latency, status) samples from any number of threads"""
+
+    def __init__(self):
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def add(self, latency, status):
+        with self._lock:
+            self.samples.append((latency, status))
+
+
+class TestClient:
+    """Drives the app in-process through Flask's test client"""
+
+    def __init__(self, app_module):
+        self.app_module = app_module
+        self.client = app_module.app.test_client()
+
+    def request(self, method, path, body=None, headers=None):
+        response = self.client.open(path, method=method, json=body, headers=headers)
+        return response.status_code, response.get_data()
+
+
+class HTTPClient:
+    """One keep-alive connection per thread to a running server"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        return conn
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request(method, path, body=payload, headers=headers)
+                response = conn.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, ConnectionError):
+                # Sync gunicorn workers close idle connections; reconnect once
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+
+
+# =============== SCENARIOS ===============
+
+class Context:
+    """Shared state for a run: the app module, client and pre-issued tokens"""
+
+    def __init__(self, app_module, client):
+        self.app = app_module
+        self.client = client
+        self.option_ids = list(app_module.catalog.options_by_id)
+        self.service_ids = [s['id'] for s in app_module.catalog.services]
+        self.local = threading.local()
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def auth(self, user_id):
+        with self._lock:
+            token = self._tokens.get(user_id)
+            if token is None:
+                with self.app.app.app_context():
+                    token = self.app.create_access_token(identity=user_id)
+                self._tokens[user_id] = token
+        return {'Authorization': f'Bearer {token}'}
+
+
+def timed(ctx, recorder, method, path, body=None, headers=None):
+    start = time.perf_counter()
+    status, data = ctx.client.request(method, path, body, headers)
+    recorder.add(time.perf_counter() - start, status)
+    return status, data
+
+
+def browse(ctx, recorder, i):
+    timed(ctx, recorder, 'GET', '/api/services/')
+    timed(ctx, recorder, 'GET', '/api/categories')
+    timed(ctx, recorder, 'GET', f'/api/services/{ctx.service_ids[i % len(ctx.service_ids)]}')
+
+
+def login(ctx, recorder, i):
+    email = f'bench-login-{os.getpid()}-{threading.get_ident()}-{i}@example.com'
+    timed(ctx, recorder, 'POST', '/api/auth/send-otp', {'email': email})
+    record = ctx.app.storage.get_otp(email)
+    otp = record['otp'] if record else 0
+    timed(ctx, recorder, 'POST', '/api/auth/login', {'email': email, 'otp': otp})
+
+
+def cart(ctx, recorder, i):
+    # Every thread hammers its own large cart
+    headers = ctx.auth(f'bench-cart-{threading.get_ident()}@example.com')
+    # Each item goes through add, add, decrease, remove; counted per thread
+    # since every thread owns its cart
+    n = ctx.local.cart_ops = getattr(ctx.local, 'cart_ops', -1) + 1
+    item_id = ctx.option_ids[(n // 4) % len(ctx.option_ids)]
+    op = n % 4
+    if op < 2:
+        timed(ctx, recorder, 'POST', '/api/cart/add', {'id': item_id, 'qty': 2}, headers)
+    elif op == 2:
+        timed(ctx, recorder, 'POST', '/api/cart/decrease', {'id': item_id}, headers)
+    else:
+        timed(ctx, recorder, 'DELETE', f'/api/cart/{item_id}', None, headers)
+
+
+def checkout(ctx, recorder, i):
+    headers = ctx.auth(f'bench-checkout-{i % 50}@example.com')
+    items = []
+    for item_id in random.sample(ctx.option_ids, 3):
+        status, data = timed(ctx, recorder, 'POST', '/api/cart/add', {'id': item_id}, headers)
+        if status == 200:
+            items = json.loads(data)['cart']['items']
+    total = sum(item['price'] * item['qty'] for item in items)
+    timed(ctx, recorder, 'POST', '/api/checkout', {'cart': items, 'total': total}, headers)
+
+
+def orders_my(ctx, recorder, i):
+    headers = ctx.auth('bench-history@example.com')
+    timed(ctx, recorder, 'GET', '/api/orders/my?limit=50', None, headers)
+
+
+SCENARIOS = {
+    'browse': browse,
+    'login': login,
+    'cart': cart,
+    'checkout': checkout,
+    'orders_my': orders_my,
+}
+
+
+def seed_order_history(storage, count):
+    """Bulk-load a long order history for the orders_my scenario"""
+    from models import Order
+
+    start = datetime(2024, 1, 1)
+    storage.add_orders(Order.from_dict({
+        'id': f'BENCH_{n:08d}',
+        'user_id': 'bench-history@example.com',
+        'items': [{'id': 'shirt', 'name': 'Shirt', 'price': 25, 'emoji': '👔', 'qty': 2}],
+        'total': 50,
+        'status': 'Delivered',
+        'created_at': (start + timedelta(minutes=n)).isoformat(),
+        'pickup_time': (start + timedelta(minutes=n, hours=2)).strftime('%Y-%m-%d %H:%M'),
+        'delivery_time': (start + timedelta(minutes=n, days=1)).strftime('%Y-%m-%d %H:%M')
+    }) for n in range(count))
+
+
+# =============== RUNNER ===============
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(int(q * len(sorted_values)), len(sorted_values) - 1)]
+
+
+def run_scenario(ctx, step, iterations, concurrency, warmup):
+    for i in range(warmup):
+        step(ctx, Recorder(), i)
+
+    recorder = Recorder()
+    counter = iter(range(iterations))
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            step(ctx, recorder, i)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, _ in recorder.samples)
+    ms = lambda value: round(value * 1000, 3) if value is not None else None
+    return {
+        'requests': len(latencies),
+        'errors': sum(1 for _, status in recorder.samples if status >= 400),
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'mean_ms': ms(sum(latencies) / len(latencies)) if latencies else None,
+        'p50_ms': ms(percentile(latencies, 0.50)),
+        'p95_ms': ms(percentile(latencies, 0.95)),
+        'p99_ms': ms(percentile(latencies, 0.99)),
+        'max_ms': ms(latencies[-1] if latencies else None),
+    }
+
+
+def measure_allocations(ctx, step, iterations):
+    """Peak traced bytes and retained blocks per scenario step (in-process only)"""
+    recorder = Recorder()
+    peaks = []
+    blocks_before = sys.getallocatedblocks()
+    tracemalloc.start()
+    try:
+        for i in range(iterations):
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            step(ctx, recorder, i)
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+    finally:
+        tracemalloc.stop()
+    requests = max(len(recorder.samples), 1)
+    return {
+        'alloc_peak_kb_per_request': round(sum(peaks) / requests / 1024, 2),
+        'retained_blocks_per_request': round((sys.getallocatedblocks() - blocks_before) / requests, 2),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def server_command(asgi, workers, port):
+    if asgi:
+        return [sys.executable, '-m', 'uvicorn', 'asgi:application', '--workers', str(workers),
+                '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning']
+    return [sys.executable, '-m', 'gunicorn', '-w', str(workers), '-b', f'127.0.0.1:{port}',
+            '--log-level', 'warning', 'app:create_app()']
+
+
+def start_server(command, port, env):
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/health')
+            if conn.getresponse().status == 200:
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f'{command[2]} did not start')
+
+
+def compare(current, baseline_path, threshold):
+    """Print per-scenario deltas against an earlier result; True if any regressed"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    regressed = False
+    print(f"\nvs {baseline['revision']} ({baseline_path})")
+    for name, result in current['scenarios'].items():
+        old = baseline['scenarios'].get(name)
+        if not old:
+            continue
+        cells = []
+        for key in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps'):
+            if not old.get(key) or result.get(key) is None:
+                continue
+            change = (result[key] - old[key]) / old[key]
+            worse = change < -threshold if key == 'throughput_rps' else change > threshold
+            regressed |= worse
+            cells.append(f"{key} {change:+.1%}{' !' if worse else ''}")
+        print(f"  {name:<10} " + '  '.join(cells))
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-s', '--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='scenario to run (repeatable, default: all)')
+    parser.add_argument('-n', '--iterations', type=int, default=1000)
+    parser.add_argument('-c', '--concurrency', type=int, default=1, help='client threads')
+    parser.add_argument('--warmup', type=int, default=50)
+    parser.add_argument('--order-history', type=int, default=10000,
+                        help='orders seeded for the orders_my user')
+    parser.add_argument('--gunicorn', action='store_true', help='benchmark a local gunicorn')
+    parser.add_argument('--asgi', action='store_true', help='benchmark a local uvicorn (ASGI mode)')
+    parser.add_argument('-w', '--workers', type=int, default=4, help='server worker processes')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--no-alloc', action='store_true', help='skip allocation tracing')
+    parser.add_argument('-o', '--output', help='result file (default: benchmarks/results/)')
+    parser.add_argument('--compare', help='earlier result file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='relative change counted as a regression')
+    args = parser.parse_args(argv)
+
+    scenarios = args.scenario or list(SCENARIOS)
+    remote = args.gunicorn or args.asgi
+    server = None
+    tmpdir = tempfile.mkdtemp(prefix='laundry-bench-')
+
+    if remote:
+        # Workers and this process share state through one SQLite file
+        os.environ['STORAGE_URL'] = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+
+    sys.path.insert(0, ROOT)
+    import app as app_module
+    app_module.create_app()
+
+    if 'orders_my' in scenarios:
+        seed_order_history(app_module.storage, args.order_history)
+
+    if remote:
+        server = start_server(server_command(args.asgi, args.workers, args.port),
+                              args.port, dict(os.environ))
+        client = HTTPClient('127.0.0.1', args.port)
+    else:
+        client = TestClient(app_module)
+
+    ctx = Context(app_module, client)
+    result = {
+        'revision': git_revision(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'mode': (f"{'uvicorn' if args.asgi else 'gunicorn'} -w {args.workers}"
+                 if remote else 'test-client'),
+        'python': sys.version.split()[0],
+        'iterations': args.iterations,
+        'concurrency': args.concurrency,
+        'order_history': args.order_history,
+        'scenarios': {},
+    }
+
+    try:
+        for name in scenarios:
+            # Keep the app's development prints (OTPs) out of the report
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                stats = run_scenario(ctx, SCENARIOS[name], args.iterations, args.concurrency, args.warmup)
+                if not remote and not args.no_alloc:
+                    stats.update(measure_allocations(ctx, SCENARIOS[name], min(args.iterations, 200)))
+            result['scenarios'][name] = stats
+            print(f"{name:<10} {stats['requests']:>7} req  {stats['throughput_rps']:>9} req/s  "
+                  f"p50 {stats['p50_ms']} ms  p95 {stats['p95_ms']} ms  p99 {stats['p99_ms']} ms  "
+                  f"errors {stats['errors']}")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{result['revision']}.json")
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare and compare(result, args.compare, args.threshold):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,214 @@
+"""Worker startup time and per-worker memory
+
+Measures how long a fresh interpreter takes to import the app and then
+build it with create_app() (and which optional modules it pulls in along
+the way), then starts a local gunicorn
+with and without --preload and reads each worker's memory after a short
+warmup from /proc/<pid>/smaps_rollup (Linux only):
+
+- rss: resident pages, counting shared ones in full in every worker
+- pss: resident pages with each shared page split between its sharers;
+  summed over the pool this is what the workers really cost
+- uss: pages only this worker has, what a new worker would add
+
+    python benchmarks/startup.py                      # 4 workers, 10 imports
+    python benchmarks/startup.py -w 8 -n 20
+    python benchmarks/startup.py --storage sqlite:////tmp/startup.db
+"""
+import argparse
+import http.client
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from run import RESULTS_DIR, git_revision  # noqa: E402
+
+# Only needed for mail, profiling and backfills, so they should not load at startup
+DEFERRED_MODULES = ('smtplib', 'email.mime.text', 'cProfile', 'pstats', 'numpy')
+
+IMPORT_PROBE = f"""
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+created = time.perf_counter()
+print(json.dumps({{'seconds': imported - started, 'create_seconds': created - imported,
+                  'modules': len(sys.modules),
+                  'loaded': [name for name in {DEFERRED_MODULES!r} if name in sys.modules]}}))
+"""
+
+WARMUP_PATHS = ('/health', '/api/services/', '/api/categories', '/api/search?q=shirt',
+                '/api/stats', '/api/aboutus', '/api/slots?items=shirt')
+
+
+# =============== IMPORT TIME ===============
+
+def measure_import(runs, env):
+    """Import and build the app in `runs` fresh interpreters"""
+    # Bytecode is compiled once up front, so no run pays for it
+    subprocess.check_call([sys.executable, '-m', 'compileall', '-q', ROOT, '-x', 'node_modules'],
+                          cwd=ROOT, env=env)
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        output = subprocess.check_output([sys.executable, '-c', IMPORT_PROBE], cwd=ROOT, env=env, text=True)
+        wall = time.perf_counter() - started
+        probe = json.loads(output.strip().splitlines()[-1])
+        samples.append((probe['seconds'], wall, probe))
+    imports = sorted(seconds for seconds, _, _ in samples)
+    creates = sorted(probe['create_seconds'] for _, _, probe in samples)
+    return {
+        'runs': runs,
+        'import_ms_median': round(statistics.median(imports) * 1000, 1),
+        'import_ms_min': round(imports[0] * 1000, 1),
+        'create_app_ms_median': round(statistics.median(creates) * 1000, 1),
+        'process_ms_median': round(statistics.median(wall for _, wall, _ in samples) * 1000, 1),
+        'modules': samples[-1][2]['modules'],
+        'deferred_loaded': samples[-1][2]['loaded'],
+    }
+
+
+# =============== WORKER MEMORY ===============
+
+def smaps_rollup(pid):
+    """kB counters from /proc/<pid>/smaps_rollup"""
+    values = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                values[parts[0].rstrip(':')] = int(parts[1])
+    return values
+
+
+def children(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(child) for child in f.read().split()]
+
+
+def get(port, path):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    try:
+        conn.request('GET', path)
+        response = conn.getresponse()
+        response.read()
+        return response.status
+    finally:
+        conn.close()
+
+
+def measure_pool(preload, workers, port, requests, env):
+    """Start gunicorn, time it to the first answer from every worker, warm it up and read its memory"""
+    command = [sys.executable, '-m', 'gunicorn', '-w', str(workers), '-b', f'127.0.0.1:{port}',
+               '--log-level', 'warning', 'app:create_app()']
+    if preload:
+        command.insert(3, '--preload')
+
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+    try:
+        deadline = time.time() + 60
+        while True:
+            if time.time() > deadline or process.poll() is not None:
+                raise RuntimeError('gunicorn did not start')
+            try:
+                if get(port, '/health') == 200 and len(children(process.pid)) == workers:
+                    break
+            except OSError:
+                time.sleep(0.05)
+        ready = time.perf_counter() - started
+
+        # Sync workers take turns on the listening socket, so enough
+        # requests touch every worker's request path
+        for i in range(requests):
+            get(port, WARMUP_PATHS[i % len(WARMUP_PATHS)])
+        time.sleep(0.5)
+
+        pids = children(process.pid)
+        rollups = [smaps_rollup(pid) for pid in pids]
+        master = smaps_rollup(process.pid)
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=30)
+
+    def mb(kb):
+        return round(kb / 1024, 1)
+
+    uss = [r.get('Private_Clean', 0) + r.get('Private_Dirty', 0) for r in rollups]
+    return {
+        'preload': preload,
+        'workers': len(pids),
+        'ready_s': round(ready, 3),
+        'rss_mb_per_worker': mb(statistics.mean(r['Rss'] for r in rollups)),
+        'pss_mb_per_worker': mb(statistics.mean(r['Pss'] for r in rollups)),
+        'uss_mb_per_worker': mb(statistics.mean(uss)),
+        'shared_mb_per_worker': mb(statistics.mean(r.get('Shared_Clean', 0) + r.get('Shared_Dirty', 0)
+                                                   for r in rollups)),
+        'pss_mb_total': mb(sum(r['Pss'] for r in rollups) + master['Pss']),
+    }
+
+
+# =============== RUNNER ===============
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--imports', type=int, default=10, help='fresh-interpreter imports to time')
+    parser.add_argument('-w', '--workers', type=int, default=4)
+    parser.add_argument('-r', '--requests', type=int, default=400, help='warmup requests per pool')
+    parser.add_argument('--port', type=int, default=8702)
+    parser.add_argument('--storage', default='memory://', help='STORAGE_URL for the app (default: memory://)')
+    parser.add_argument('-o', '--output', help='result file (default: benchmarks/results/)')
+    args = parser.parse_args(argv)
+
+    if not os.path.exists('/proc/self/smaps_rollup'):
+        print('Worker memory needs /proc/<pid>/smaps_rollup (Linux 4.14+)')
+        return 1
+
+    env = dict(os.environ, STORAGE_URL=args.storage)
+
+    startup = measure_import(args.imports, env)
+    print(f"import     {startup['import_ms_median']} ms median  {startup['import_ms_min']} ms min  "
+          f"({startup['process_ms_median']} ms with interpreter start, {startup['modules']} modules)")
+    print(f"create_app {startup['create_app_ms_median']} ms median")
+    if startup['deferred_loaded']:
+        print(f"           loaded at startup: {', '.join(startup['deferred_loaded'])}")
+
+    pools = []
+    for preload in (False, True):
+        pool = measure_pool(preload, args.workers, args.port, args.requests, env)
+        pools.append(pool)
+        print(f"{'preload' if preload else 'fork':<10} ready {pool['ready_s']} s  per worker: "
+              f"rss {pool['rss_mb_per_worker']} MB  pss {pool['pss_mb_per_worker']} MB  "
+              f"uss {pool['uss_mb_per_worker']} MB  |  pool pss {pool['pss_mb_total']} MB")
+
+    result = {
+        'revision': git_revision(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'storage': args.storage,
+        'startup': startup,
+        'pools': pools,
+    }
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{result['revision']}-startup.json")
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"\nResults written to {output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
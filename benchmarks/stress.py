@@ -0,0 +1,362 @@
+"""Concurrency stress tests for the storage backends
+
+Drives the cart, checkout and OTP code paths from many threads at once,
+the way a gunicorn gthread worker does, then checks invariants that a
+lost update or a torn read would break:
+
+- every cart's total and item count match its lines, in every read taken
+  while other threads were writing to it
+- each cart line's quantity equals the adds minus the decreases that were
+  acknowledged for it
+- every acknowledged checkout is stored exactly once, with its user's cart
+  emptied, a place taken in its pickup and delivery slots and one count in
+  the analytics counters
+- with checkouts racing cart taps for the same users, every acknowledged
+  tap ends up either in an order or still in the cart
+- every OTP key reads back the last value its thread wrote
+- with the write-ahead log, a restart recovers exactly the live state
+
+Exits non-zero if any invariant fails.
+
+    python benchmarks/stress.py                         # every backend, 16 threads
+    python benchmarks/stress.py -t 64 -n 5000
+    python benchmarks/stress.py --storage sqlite:////tmp/stress.db
+"""
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Thousands of checkouts all land in the first open slots
+os.environ.setdefault('PICKUP_SLOT_CAPACITY', '1000000')
+os.environ.setdefault('DELIVERY_SLOT_CAPACITY', '1000000')
+
+HOT_USERS = 4
+HOT_ITEMS = 6
+OTP_KEYS = 8
+
+
+class Violations:
+    """Invariant failures from any number of threads"""
+
+    def __init__(self):
+        self.messages = []
+        self._lock = threading.Lock()
+
+    def add(self, message):
+        with self._lock:
+            self.messages.append(message)
+
+
+def run_threads(count, target):
+    """Run target(thread index) on count threads; returns the elapsed seconds"""
+    threads = [threading.Thread(target=target, args=(n,)) for n in range(count)]
+    began = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - began
+
+
+def check_cart(cart, where, violations):
+    lines = list(cart.items.values())
+    if cart.total != sum(line.price * line.qty for line in lines):
+        violations.add(f'{where}: total {cart.total} != sum of its lines')
+    if cart.total_qty != sum(line.qty for line in lines):
+        violations.add(f'{where}: totalQty {cart.total_qty} != sum of its lines')
+    if any(line.qty <= 0 for line in lines):
+        violations.add(f'{where}: a line with no quantity left')
+
+
+# =============== PHASES ===============
+
+def stress_carts(app, threads, ops, violations):
+    """Adds, decreases and batches against a few shared carts, with readers alongside"""
+    users = [f'stress-cart-{n}@example.com' for n in range(HOT_USERS)]
+    items = list(app.catalog.options_by_id)[:HOT_ITEMS]
+    expected = [Counter() for _ in range(threads)]
+
+    def worker(n):
+        rng = random.Random(n)
+        delta = expected[n]
+        for _ in range(ops):
+            user_id = rng.choice(users)
+            roll = rng.random()
+            if roll < 0.45:
+                item_id, qty = rng.choice(items), rng.randint(1, 3)
+                _, status = app.cart_add(user_id, {'id': item_id, 'qty': qty})
+                if status == 200:
+                    delta[user_id, item_id] += qty
+            elif roll < 0.75:
+                item_id = rng.choice(items)
+                _, status = app.cart_decrease(user_id, {'id': item_id})
+                if status == 200:
+                    delta[user_id, item_id] -= 1
+            elif roll < 0.9:
+                first, second = rng.sample(items, 2)
+                _, status = app.cart_apply_operations(user_id, {'operations': [
+                    {'op': 'add', 'id': first, 'qty': 1}, {'op': 'add', 'id': second, 'qty': 2}]})
+                if status == 200:
+                    delta[user_id, first] += 1
+                    delta[user_id, second] += 2
+            else:
+                cart = app.storage.get_cart(user_id)
+                if cart is not None:
+                    check_cart(cart, f'read of {user_id}', violations)
+
+    elapsed = run_threads(threads, worker)
+
+    total = Counter()
+    for delta in expected:
+        total.update(delta)
+    for user_id in users:
+        cart = app.storage.get_cart(user_id)
+        if cart is None:
+            violations.add(f'{user_id}: cart missing')
+            continue
+        check_cart(cart, user_id, violations)
+        for item_id in items:
+            want = total[user_id, item_id]
+            line = cart.items.get(item_id)
+            have = line.qty if line else 0
+            if have != want:
+                violations.add(f'{user_id} {item_id}: qty {have}, acknowledged {want} (lost updates)')
+    return elapsed, threads * ops
+
+
+def stress_checkout(app, threads, ops, violations):
+    """Concurrent add-then-checkout sessions, with a thread paging orders throughout"""
+    items = list(app.catalog.options_by_id)[:HOT_ITEMS]
+    placed = [[] for _ in range(threads)]
+    done = threading.Event()
+
+    def reader():
+        while not done.is_set():
+            orders, _ = app.storage.page_orders(limit=200)
+            keys = [(order.created, order.id) for order in orders]
+            if keys != sorted(keys):
+                violations.add('page of orders out of creation order')
+
+    def worker(n):
+        rng = random.Random(1000 + n)
+        for i in range(ops):
+            user_id = f'stress-order-{n}-{i % 5}@example.com'
+            app.cart_add(user_id, {'id': rng.choice(items), 'qty': rng.randint(1, 4)})
+            body, status = app.place_order(user_id, {})
+            if status == 200:
+                placed[n].append((user_id, body['order_id']))
+            else:
+                violations.add(f'checkout for {user_id} answered {status}: {body}')
+
+    watcher = threading.Thread(target=reader)
+    watcher.start()
+    elapsed = run_threads(threads, worker)
+    done.set()
+    watcher.join()
+
+    acknowledged = [entry for entries in placed for entry in entries]
+    ids = [order_id for _, order_id in acknowledged]
+    if len(set(ids)) != len(ids):
+        violations.add(f'{len(ids) - len(set(ids))} order ids handed out twice')
+
+    pickups, deliveries, users = Counter(), Counter(), set()
+    for user_id, order_id in acknowledged:
+        order = app.storage.get_order(order_id)
+        if order is None:
+            violations.add(f'{order_id}: acknowledged but not stored')
+            continue
+        if order.user_id != user_id:
+            violations.add(f'{order_id}: stored for {order.user_id}, placed by {user_id}')
+        pickups[order.pickup] += 1
+        deliveries[order.delivery] += 1
+        users.add(user_id)
+
+    for user_id in users:
+        history = list(app.storage.iter_orders(user_id=user_id))
+        if len(history) != sum(1 for owner, _ in acknowledged if owner == user_id):
+            violations.add(f'{user_id}: {len(history)} orders stored, a different number acknowledged')
+        cart = app.storage.get_cart(user_id)
+        if cart is not None and cart.items:
+            violations.add(f'{user_id}: cart not emptied by its last checkout')
+
+    today = date.today().toordinal()
+    counted = sum(row[3] for row in app.storage.query_order_stats(today - 1, today) if row[1] == 'total')
+    if counted != len(acknowledged):
+        violations.add(f'analytics counted {counted} orders for {len(acknowledged)} checkouts')
+
+    for kind, counts in (('pickup', pickups), ('delivery', deliveries)):
+        usage = app.storage.slot_usage(kind, list(counts))
+        for start, count in counts.items():
+            if usage.get(start, 0) != count:
+                violations.add(f'{kind} slot {start}: {usage.get(start, 0)} places taken for {count} orders')
+    return elapsed, threads * ops
+
+
+def stress_checkout_races(app, threads, ops, violations):
+    """Half the threads check out a user's stored cart while the other half tap items into it"""
+    items = list(app.catalog.options_by_id)[:HOT_ITEMS]
+    users = [f'stress-race-{n}@example.com' for n in range(max(1, threads // 2))]
+    tapped = [Counter() for _ in range(threads)]
+    tappers = [threads - len(users)]
+    tappers_lock = threading.Lock()
+    done = threading.Event()
+
+    def worker(n):
+        rng = random.Random(3000 + n)
+        user_id = users[n % len(users)]
+        if n < len(users):
+            # Keeps checking out until the last tapper finishes
+            while not done.is_set():
+                body, status = app.place_order(user_id, {})
+                # 400: nothing in the cart yet; 409: a tap landed mid-checkout
+                if status not in (200, 400, 409):
+                    violations.add(f'checkout for {user_id} answered {status}: {body}')
+                if status == 400:
+                    time.sleep(0.001)  # let the tappers fill the cart again
+            return
+        for _ in range(ops):
+            _, status = app.cart_add(user_id, {'id': rng.choice(items), 'qty': 1})
+            if status == 200:
+                tapped[n][user_id] += 1
+            time.sleep(0)  # give the checkouts a turn between taps
+        with tappers_lock:
+            tappers[0] -= 1
+            if not tappers[0]:
+                done.set()
+
+    if threads < 2:
+        done.set()
+    elapsed = run_threads(threads, worker)
+
+    total = Counter()
+    for counts in tapped:
+        total.update(counts)
+    for user_id in users:
+        ordered = sum(line.qty for order in app.storage.iter_orders(user_id=user_id) for line in order.items)
+        cart = app.storage.get_cart(user_id)
+        left = cart.total_qty if cart is not None else 0
+        if ordered + left != total[user_id]:
+            violations.add(f'{user_id}: {total[user_id]} taps acknowledged, {ordered} ordered '
+                           f'and {left} still in the cart')
+    return elapsed, threads * ops
+
+
+def stress_otps(app, threads, ops, violations):
+    """Each thread writes, reads and deletes its own OTP keys, all sharing one store"""
+    final = [{} for _ in range(threads)]
+
+    def worker(n):
+        rng = random.Random(2000 + n)
+        latest = final[n]
+        for i in range(ops):
+            key = f'stress-otp-{n}-{rng.randrange(OTP_KEYS)}'
+            roll = rng.random()
+            if roll < 0.5:
+                record = {'otp': f'{n:03d}{i:06d}', 'expires': time.time() + 300}
+                app.storage.set_otp(key, record)
+                latest[key] = record['otp']
+            elif roll < 0.9:
+                record = app.storage.get_otp(key)
+                have = record['otp'] if record else None
+                if have != latest.get(key):
+                    violations.add(f'{key}: read {have}, last written {latest.get(key)}')
+            else:
+                app.storage.delete_otp(key)
+                latest[key] = None
+
+    elapsed = run_threads(threads, worker)
+    for latest in final:
+        for key, otp in latest.items():
+            record = app.storage.get_otp(key)
+            if (record['otp'] if record else None) != otp:
+                violations.add(f'{key}: final value lost')
+    return elapsed, threads * ops
+
+
+def check_recovery(app, violations):
+    """Close the write-ahead log, reopen it and compare with what was live"""
+    from storage import DurableMemoryStorage
+
+    live = app.storage
+    live.close()
+    recovered = DurableMemoryStorage(live.directory)
+    try:
+        carts = {user_id: cart.to_row() for user_id, cart in live.carts.items()}
+        if carts != {user_id: cart.to_row() for user_id, cart in recovered.carts.items()}:
+            violations.add('recovered carts differ from the live ones')
+        if [order.to_row() for order in live.orders] != [order.to_row() for order in recovered.orders]:
+            violations.add('recovered orders differ from the live ones')
+        if live.slots.counts() != recovered.slots.counts():
+            violations.add('recovered slot bookings differ from the live ones')
+    finally:
+        recovered.close()
+
+
+PHASES = [('carts', stress_carts), ('checkout', stress_checkout), ('races', stress_checkout_races),
+          ('otps', stress_otps)]
+
+
+# =============== RUNNER ===============
+
+def run_backend(url, threads, ops):
+    os.environ['STORAGE_URL'] = url
+    # Switch threads far more often than the default 5ms, so races show up quickly
+    sys.setswitchinterval(1e-6)
+    import app
+    app.create_app()
+
+    violations = Violations()
+    print(f'{url}  ({threads} threads)')
+    for name, phase in PHASES:
+        before = len(violations.messages)
+        elapsed, count = phase(app, threads, ops, violations)
+        failed = len(violations.messages) - before
+        print(f'  {name:<10} {count:>7} ops  {count / elapsed:>9.0f} ops/s  '
+              f"{'ok' if not failed else f'{failed} violations'}")
+    if url.startswith('memory+wal://'):
+        before = len(violations.messages)
+        check_recovery(app, violations)
+        print(f"  {'recovery':<10} {'ok' if len(violations.messages) == before else 'state differs'}")
+
+    for message in violations.messages[:20]:
+        print(f'    {message}')
+    if len(violations.messages) > 20:
+        print(f'    ... and {len(violations.messages) - 20} more')
+    return 1 if violations.messages else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-t', '--threads', type=int, default=16)
+    parser.add_argument('-n', '--ops', type=int, default=2000, help='operations per thread and phase')
+    parser.add_argument('--storage', help='STORAGE_URL to test (default: every backend, in turn)')
+    args = parser.parse_args(argv)
+
+    if args.storage:
+        return run_backend(args.storage, args.threads, args.ops)
+
+    # The app opens its backend once per process, so each one gets its own process
+    tmpdir = tempfile.mkdtemp(prefix='laundry-stress-')
+    try:
+        failed = 0
+        for url in ('memory://', f'sqlite:///{tmpdir}/stress.db', f'memory+wal:///{tmpdir}/wal'):
+            failed |= subprocess.call([sys.executable, os.path.abspath(__file__), '--storage', url,
+                                       '-t', str(args.threads), '-n', str(args.ops)])
+        return failed
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,177 @@
+import threading
+from contextlib import contextmanager
+
+from models import LineItem, from_paise, to_paise
+
+
+class CartChanged(Exception):
+    """The stored cart was edited after it was priced for checkout"""
+
+
+def same_cart(stored, priced):
+    """True if the stored cart (or None) still holds exactly the lines that were priced"""
+    return stored is not None and stored.to_row() == priced.to_row()
+
+
+class Cart:
+    """A user's cart: lines keyed by item id in insertion order
+
+    ``total`` (in paise) and ``total_qty`` are kept up to date on every
+    change, so no mutation needs to walk the other lines.
+    """
+
+    __slots__ = ('items', 'total', 'total_qty')
+
+    def __init__(self):
+        self.items = {}  # item_id -> LineItem
+        self.total = 0
+        self.total_qty = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, item_id, option, qty=1):
+        line = self.items.get(item_id)
+        if line:
+            line.qty += qty
+        else:
+            line = self.items[item_id] = LineItem.from_option(item_id, option, qty)
+
+        self.total += line.price * qty
+        self.total_qty += qty
+        return line
+
+    def decrease(self, item_id):
+        """Drop one unit of an item; returns False if it is not in the cart"""
+        line = self.items.get(item_id) if isinstance(item_id, str) else None
+        if not line:
+            return False
+
+        line.qty -= 1
+        self.total -= line.price
+        self.total_qty -= 1
+        if line.qty <= 0:
+            self._drop(item_id)
+        return True
+
+    def remove(self, item_id):
+        if isinstance(item_id, str) and item_id in self.items:
+            self._drop(item_id)
+
+    def _drop(self, item_id):
+        line = self.items.pop(item_id)
+        self.total -= line.price * line.qty
+        self.total_qty -= line.qty
+
+    def copy(self):
+        cart = Cart()
+        cart.items = {item_id: line.copy() for item_id, line in self.items.items()}
+        cart.total = self.total
+        cart.total_qty = self.total_qty
+        return cart
+
+    @classmethod
+    def from_row(cls, rows):
+        cart = cls()
+        for row in rows:
+            line = cart.items[row[0]] = LineItem.from_row(row)
+            cart.total += line.price * line.qty
+            cart.total_qty += line.qty
+        return cart
+
+    def to_row(self):
+        return [line.to_row() for line in self.items.values()]
+
+    @classmethod
+    def from_dict(cls, data):
+        cart = cls()
+        for line in data.get('items', []):
+            cart.items[line['id']] = LineItem.from_dict(line)
+        cart.total = to_paise(data.get('total', 0))
+        cart.total_qty = data.get('totalQty', 0)
+        return cart
+
+    def to_dict(self):
+        return {
+            'items': [line.to_dict() for line in self.items.values()],
+            'total': from_paise(self.total),
+            'totalQty': self.total_qty
+        }
+
+
+class CartTable:
+    """Carts by user id, split into shards by key hash, each with its own lock
+
+    Reads take no lock. ``update`` edits a copy of the stored cart and
+    swaps it in, so a reader sees the cart before or after an update, never
+    half of one, and updates to carts in different shards never wait on
+    each other. ``on_change(user_id, cart)`` is called with the shard lock
+    still held after every write.
+    """
+
+    def __init__(self, shards=32, on_change=None):
+        self._shards = [{} for _ in range(shards)]
+        self._locks = [threading.Lock() for _ in range(shards)]
+        self.on_change = on_change
+
+    def __len__(self):
+        return sum(len(shard) for shard in self._shards)
+
+    def _index(self, user_id):
+        return hash(user_id) % len(self._shards)
+
+    def get(self, user_id):
+        return self._shards[self._index(user_id)].get(user_id)
+
+    def set(self, user_id, cart, notify=True):
+        index = self._index(user_id)
+        with self._locks[index]:
+            self._shards[index][user_id] = cart
+            if notify and self.on_change is not None:
+                self.on_change(user_id, cart)
+
+    def update(self, user_id, mutate, create=True):
+        """Run ``mutate(cart)`` on a copy of the user's cart and store it
+
+        ``mutate`` gets None when there is no cart and ``create`` is false.
+        It returns None to keep its changes and anything else to drop them;
+        returns (cart, what mutate returned).
+        """
+        index = self._index(user_id)
+        with self._locks[index]:
+            current = self._shards[index].get(user_id)
+            cart = current.copy() if current is not None else (Cart() if create else None)
+            outcome = mutate(cart)
+            if outcome is not None or cart is None:
+                return current, outcome
+            self._shards[index][user_id] = cart
+            if self.on_change is not None:
+                self.on_change(user_id, cart)
+        return cart, None
+
+    @contextmanager
+    def holding(self, user_id):
+        """Hold one user's shard lock; ``put`` is the only way to write to it inside the block"""
+        with self._locks[self._index(user_id)]:
+            yield
+
+    def put(self, user_id, cart):
+        """Store a cart without locking or calling ``on_change``; for use inside ``holding``"""
+        self._shards[self._index(user_id)][user_id] = cart
+
+    def load(self, items):
+        """Put (user_id, cart) pairs in place without calling ``on_change``"""
+        for user_id, cart in items:
+            self._shards[self._index(user_id)][user_id] = cart
+
+    def items(self):
+        """(user_id, cart) pairs, each shard copied under its own lock
+
+        Stored carts are never edited in place, so the pairs can be read
+        after the locks are released.
+        """
+        items = []
+        for shard, lock in zip(self._shards, self._locks):
+            with lock:
+                items.extend(shard.items())
+        return items
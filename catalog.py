@@ -0,0 +1,28 @@
+from types import MappingProxyType
+
+
+class Catalog:
+    """Read-only indexes over the services catalog, built once per content version"""
+
+    def __init__(self, services):
+        self.services = tuple(services)
+
+        options_by_id = {}
+        categories = {}
+
+        for service in self.services:
+            categories.setdefault(service['category'], None)
+            for option in service['options']:
+                # First match wins, same as the old nested scan
+                options_by_id.setdefault(option['id'], (option, service))
+
+        self.options_by_id = MappingProxyType(options_by_id)
+        # In order of first appearance
+        self.categories = tuple(categories)
+
+    def get_option(self, option_id):
+        """Return (option, service) for an option id, or (None, None)"""
+        # Ids come straight from request JSON and may be lists or dicts
+        if not isinstance(option_id, str):
+            return None, None
+        return self.options_by_id.get(option_id, (None, None))
@@ -0,0 +1,68 @@
+from datetime import datetime, timedelta
+
+from ids import ulid
+from models import LineItem, Order, epoch_us
+
+MAX_LINE_QTY = 1000
+
+
+class CheckoutError(Exception):
+    """A checkout request that can't be turned into an order"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def valid_qty(qty):
+    """A whole number of units, 1 to MAX_LINE_QTY"""
+    return isinstance(qty, int) and not isinstance(qty, bool) and 0 < qty <= MAX_LINE_QTY
+
+
+def new_order_id():
+    return f"ORD_{ulid.new()}"
+
+
+def price_items(catalog, items):
+    """Re-price submitted cart lines from the catalog
+
+    Only the item ids and quantities are taken from the client; names,
+    prices and the total come from the catalog. Repeated ids are merged.
+    Returns (lines, total) with the total in paise.
+    """
+    lines = {}
+    for item in items:
+        if not isinstance(item, dict):
+            raise CheckoutError('Invalid cart item')
+
+        item_id = item.get('id')
+        qty = item.get('qty', 1)
+        if not valid_qty(qty):
+            raise CheckoutError(f'Invalid quantity for {item_id}')
+
+        option, _ = catalog.get_option(item_id)
+        if not option:
+            raise CheckoutError(f'Item not found: {item_id}', status=404)
+
+        line = lines.get(item_id)
+        if line:
+            line.qty += qty
+        else:
+            lines[item_id] = LineItem.from_option(item_id, option, qty)
+
+    lines = list(lines.values())
+    return lines, sum(line.price * line.qty for line in lines)
+
+
+def build_order(user_id, lines, total, now=None, pickup=None, delivery=None):
+    """A new Pending order; pickup/delivery are slot starts in epoch microseconds
+
+    Without slots, pickup is two hours and delivery a day from now.
+    """
+    now = now or datetime.now()
+    if pickup is None:
+        pickup = epoch_us(now + timedelta(hours=2))
+    if delivery is None:
+        delivery = epoch_us(now + timedelta(days=1))
+    return Order(new_order_id(), user_id, lines, total, 'Pending', epoch_us(now), pickup, delivery)
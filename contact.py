@@ -0,0 +1,217 @@
+import atexit
+import hashlib
+import os
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from ids import ulid
+from models import ContactMessage, dumps, epoch_us
+
+MAX_NAME = 100
+MAX_EMAIL = 254
+MAX_MESSAGE = 5000
+
+# A contact message repeating one from the same sender this recently is dropped
+CONTACT_DEDUPE_WINDOW = 86400
+
+# Columns of the admin export, in order
+EXPORT_FIELDS = ['id', 'created_at', 'name', 'email', 'message', 'ip']
+
+EMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+_WHITESPACE = re.compile(r'\s+')
+
+
+class ContactError(Exception):
+    """A contact-form submission that can't be accepted"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def fingerprint(email, message):
+    """Same sender and same text (ignoring case and spacing) -> same fingerprint"""
+    text = _WHITESPACE.sub(' ', message).strip().lower()
+    return hashlib.sha256(f'{email.lower()}\n{text}'.encode('utf-8')).hexdigest()[:32]
+
+
+def export_record(message):
+    """A stored message as the admin export and the archive file write it"""
+    return {**message.to_dict(), 'ip': message.ip}
+
+
+def parse_submission(data, client_ip):
+    """A ContactMessage from the posted form; raises ContactError"""
+    if not isinstance(data, dict):
+        raise ContactError('All fields are required')
+    name, email, message = (data.get(field) for field in ('name', 'email', 'message'))
+    if not all(isinstance(value, str) and value.strip() for value in (name, email, message)):
+        raise ContactError('All fields are required')
+
+    name, email, message = name.strip(), email.strip(), message.strip()
+    if len(name) > MAX_NAME or len(message) > MAX_MESSAGE:
+        raise ContactError(f'Name must be at most {MAX_NAME} and message at most {MAX_MESSAGE} characters')
+    if len(email) > MAX_EMAIL or not EMAIL_RE.match(email):
+        raise ContactError('Invalid email address')
+
+    return ContactMessage(f'MSG_{ulid.new()}', name, email, message, client_ip,
+                          epoch_us(datetime.now()), fingerprint(email, message))
+
+
+class ContactIntake:
+    """Contact-form submissions, queued in memory and written to storage in batches
+
+    ``submit`` only enqueues, so a burst of submissions never waits on
+    storage. A background writer flushes the queue every ``flush_interval``
+    seconds, or as soon as ``batch_size`` messages are waiting, with one
+    storage call per batch. Repeats of a message within ``window``
+    seconds are dropped twice: here, against the last few thousand
+    fingerprints, and by storage, across workers. ``send_digest`` mails everything stored since the previous
+    digest through ``mailer``. With ``archive`` set, every stored batch is
+    also appended to that file as JSON lines, which keeps the messages when
+    storage doesn't. The writer starts on the first submission in each
+    process, so the intake is safe to create before gunicorn forks.
+    """
+
+    def __init__(self, storage, mailer=None, digest_to=(), archive=None, maxsize=10000, batch_size=200,
+                 flush_interval=1.0, recent=5000, window=CONTACT_DEDUPE_WINDOW):
+        self.storage = storage
+        self.mailer = mailer
+        self.digest_to = list(digest_to)
+        self.archive = archive
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.recent = recent
+        self.window = window
+
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._recent = OrderedDict()  # fingerprint -> created of the copy last queued, newest last
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+
+        self.accepted = 0
+        self.duplicates = 0
+        self.dropped = 0
+        self.stored = 0
+        self.failed = 0
+        self.unarchived = 0
+        self.digests = 0
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            threading.Thread(target=self._run, name='contact-writer', daemon=True).start()
+            self._pid = os.getpid()
+            atexit.register(self.flush)
+
+    def submit(self, message):
+        """Queue a parsed message; False if the queue is full"""
+        self._ensure_started()
+        with self._lock:
+            seen = self._recent.get(message.fingerprint)
+            # Repeats don't refresh the entry, so the window runs from the copy that was queued
+            if seen is not None and message.created - seen < self.window * 1_000_000:
+                self.duplicates += 1
+                return True
+            try:
+                self._queue.put_nowait(message)
+            except queue.Full:
+                self.dropped += 1
+                return False
+            self._recent.pop(message.fingerprint, None)
+            self._recent[message.fingerprint] = message.created
+            if len(self._recent) > self.recent:
+                self._recent.popitem(last=False)
+            self.accepted += 1
+        if self._queue.qsize() >= self.batch_size:
+            self._wake.set()
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {'queue_depth': self._queue.qsize(), 'accepted': self.accepted,
+                    'duplicates': self.duplicates, 'dropped': self.dropped, 'stored': self.stored,
+                    'failed': self.failed, 'unarchived': self.unarchived, 'digests': self.digests,
+                    'archive': self.archive}
+
+    # =============== WRITER ===============
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Write everything queued so far, batch_size messages per storage call"""
+        with self._flush_lock:
+            while True:
+                batch = []
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if not batch:
+                    return
+                self._write(batch)
+
+    def _write(self, batch, attempts=3):
+        for attempt in range(attempts):
+            if attempt:
+                time.sleep(0.5 * 2 ** (attempt - 1))
+            try:
+                stored = self.storage.add_contact_messages(batch)
+            except Exception as e:
+                print(f"Contact message write error: {e}")
+                continue
+            with self._lock:
+                self.stored += len(stored)
+                self.duplicates += len(batch) - len(stored)
+            if stored and self.archive:
+                self._archive(stored)
+            return
+        with self._lock:
+            self.failed += len(batch)
+
+    def _archive(self, messages):
+        data = ''.join(dumps(export_record(message)) + '\n' for message in messages).encode('utf-8')
+        try:
+            # One O_APPEND write per batch, so workers sharing the file don't split each other's lines
+            fd = os.open(self.archive, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            try:
+                os.write(fd, data)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            print(f"Contact archive write error: {e}")
+            with self._lock:
+                self.unarchived += len(messages)
+
+    # =============== DIGEST ===============
+
+    def send_digest(self, limit=500):
+        """Mail the messages stored since the last digest; returns how many went out"""
+        if self.mailer is None or not self.digest_to:
+            return 0
+        sent = 0
+        while True:
+            messages = self.storage.claim_contact_digest(limit)
+            if not messages:
+                return sent
+            if not self.mailer.send_contact_digest(self.digest_to, messages):
+                print(f"Contact digest of {len(messages)} messages dropped: mail queue full")
+            with self._lock:
+                self.digests += 1
+            sent += len(messages)
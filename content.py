@@ -0,0 +1,172 @@
+import json
+import os
+import threading
+import time
+
+from catalog import Catalog
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional, JSON content files always work
+    msgpack = None
+
+
+class ContentError(ValueError):
+    """A content file that can't be loaded or fails validation"""
+
+
+def _require(condition, message):
+    if not condition:
+        raise ContentError(message)
+
+
+def _is_price(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value >= 0
+
+
+def validate(data):
+    """Check the parts of the content the API relies on; raises ContentError"""
+    _require(isinstance(data, dict), 'content must be an object')
+    _require(isinstance(data.get('version'), (int, str)), 'version must be a number or string')
+
+    services = data.get('services')
+    _require(isinstance(services, list) and services, 'services must be a non-empty list')
+    service_ids, option_ids = set(), set()
+    for i, service in enumerate(services):
+        where = f'services[{i}]'
+        _require(isinstance(service, dict), f'{where} must be an object')
+        for field in ('id', 'name', 'category'):
+            _require(isinstance(service.get(field), str) and service[field], f'{where}.{field} is required')
+        _require(service['id'] not in service_ids, f"{where}: duplicate service id {service['id']}")
+        if service.get('turnaround_hours') is not None:
+            _require(_is_price(service['turnaround_hours']), f'{where}.turnaround_hours must be a non-negative number')
+        service_ids.add(service['id'])
+
+        options = service.get('options')
+        _require(isinstance(options, list), f'{where}.options must be a list')
+        for j, option in enumerate(options):
+            where = f'services[{i}].options[{j}]'
+            _require(isinstance(option, dict), f'{where} must be an object')
+            for field in ('id', 'label', 'emoji'):
+                _require(isinstance(option.get(field), str) and option[field], f'{where}.{field} is required')
+            _require(_is_price(option.get('price')), f'{where}.price must be a non-negative number')
+            _require(option['id'] not in option_ids, f"{where}: duplicate option id {option['id']}")
+            option_ids.add(option['id'])
+
+    for section in ('stats', 'aboutus', 'home'):
+        _require(isinstance(data.get(section), dict), f'{section} must be an object')
+    for section in ('why_choose', 'how_it_works', 'final_cta'):
+        _require(section in data['home'], f'home.{section} is required')
+
+
+class Content:
+    """One validated version of the site content and the indexes built from it
+
+    Treated as immutable: a new version is a new ``Content``, so a request
+    holding the old one keeps a consistent view until it finishes.
+    ``localized[lang]`` holds the services, home and about payloads already
+    rendered in each language of ``translations``.
+    """
+
+    def __init__(self, data, source=None, translations=None):
+        validate(data)
+        self.version = data['version']
+        self.source = source
+        self.services = data['services']
+        self.stats = data['stats']
+        self.aboutus = data['aboutus']
+        self.home = data['home']
+        self.catalog = Catalog(self.services)
+
+        self.localized = {}
+        for lang, table in (translations or {}).items():
+            services = table.render(self.services)
+            self.localized[lang] = {
+                'services': services,
+                'services_by_id': {service['id']: service for service in services},
+                'home': table.render(self.home),
+                'aboutus': table.render(self.aboutus),
+            }
+
+
+def load_file(path, translations=None):
+    """Parse and validate a .json or .msgpack content file"""
+    with open(path, 'rb') as f:
+        raw = f.read()
+    try:
+        if path.endswith('.msgpack'):
+            _require(msgpack is not None, 'msgpack is not installed')
+            data = msgpack.unpackb(raw, raw=False)
+        else:
+            data = json.loads(raw)
+    except ContentError:
+        raise
+    except Exception as e:
+        raise ContentError(f'{path}: {e}')
+    return Content(data, source=path, translations=translations)
+
+
+class ContentLoader:
+    """Keeps the newest valid version of a content file
+
+    ``check`` reloads the file when its mtime, size or inode changes and
+    calls ``on_change(new, old)`` after swapping it in. A file that fails
+    to parse or validate is reported and the current version stays live.
+    Write updates to a temp file and rename it over the old one, so a
+    half-written file is never read.
+    """
+
+    def __init__(self, path, on_change=None, interval=2, translations=None):
+        self.path = path
+        self.on_change = on_change
+        self.interval = interval
+        self.translations = translations
+        self._lock = threading.Lock()
+        self._pid = None
+        self._stamp = self._file_stamp()
+        self.current = load_file(path, translations)
+
+    def _file_stamp(self):
+        st = os.stat(self.path)
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def check(self):
+        """Reload if the file changed; returns True when a new version went live"""
+        with self._lock:
+            try:
+                stamp = self._file_stamp()
+            except OSError as e:
+                print(f"Content check error: {e}")
+                return False
+            if stamp == self._stamp:
+                return False
+
+            try:
+                content = load_file(self.path, self.translations)
+            except (OSError, ContentError) as e:
+                print(f"Content reload rejected, keeping version {self.current.version}: {e}")
+                self._stamp = stamp
+                return False
+
+            old, self.current, self._stamp = self.current, content, stamp
+            if self.on_change is not None:
+                self.on_change(content, old)
+            return True
+
+    def ensure_started(self):
+        """Watch the file from a daemon thread, started once per process"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            threading.Thread(target=self._run, name='content-watcher', daemon=True).start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Content reload error: {e}")
@@ -0,0 +1,196 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# Sent instead of the dropped events when a subscriber falls behind
+RESYNC = {'type': 'resync'}
+
+
+class Subscription:
+    """A bounded inbox of events for one client
+
+    When a slow client lets the inbox fill up the oldest events are dropped
+    and the client is sent a single ``resync`` event, telling it to refetch
+    its orders rather than trust the stream.
+    """
+
+    def __init__(self, broker, channels, maxsize=100):
+        self.broker = broker
+        self.channels = tuple(channels)
+        self.maxsize = maxsize
+        self._events = deque()
+        self._overflowed = False
+        self._cond = threading.Condition()
+        self._async_waiters = []  # (loop, asyncio.Event)
+        self.closed = False
+
+    def put(self, event_id, event):
+        with self._cond:
+            if len(self._events) >= self.maxsize:
+                self._events.popleft()
+                self._overflowed = True
+            self._events.append((event_id, event))
+            self._cond.notify_all()
+            waiters = list(self._async_waiters)
+        for loop, flag in waiters:
+            loop.call_soon_threadsafe(flag.set)
+
+    def _drain(self):
+        if self._overflowed:
+            self._overflowed = False
+            self._events.clear()
+            return [(None, RESYNC)]
+        events = list(self._events)
+        self._events.clear()
+        return events
+
+    def get(self, timeout=None):
+        """Wait for events; returns a list of (id, event), empty on timeout"""
+        with self._cond:
+            if not self._events and not self._overflowed:
+                self._cond.wait(timeout)
+            return self._drain()
+
+    async def get_async(self, timeout=None):
+        import asyncio
+
+        with self._cond:
+            if self._events or self._overflowed:
+                return self._drain()
+            flag = asyncio.Event()
+            waiter = (asyncio.get_running_loop(), flag)
+            self._async_waiters.append(waiter)
+        try:
+            await asyncio.wait_for(flag.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._cond:
+                self._async_waiters.remove(waiter)
+        with self._cond:
+            return self._drain()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """In-process pub/sub: events only reach subscribers in the same worker"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # channel -> set of Subscription
+        self._next_id = 0
+
+    def subscribe(self, channels, maxsize=100):
+        subscription = Subscription(self, channels, maxsize)
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+    def publish(self, channel, event):
+        self.publish_many([(channel, event)])
+
+    def publish_many(self, messages):
+        """Publish (channel, event) pairs in order"""
+        with self._lock:
+            for channel, event in messages:
+                self._next_id += 1
+                self._deliver(self._next_id, channel, event)
+
+    def _deliver(self, event_id, channel, event):
+        for subscription in list(self._subscribers.get(channel, ())):
+            subscription.put(event_id, event)
+
+
+class SQLBroker(LocalBroker):
+    """Pub/sub across workers through an events table in the shared SQLite DB
+
+    ``publish`` appends a row; one poller thread per worker reads new rows
+    and hands them to that worker's local subscribers.
+    """
+
+    def __init__(self, pool, poll_interval=0.5, retention=3600):
+        super().__init__()
+        self.pool = pool
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._pid = None
+        self._last_id = 0
+        with self.pool.connection() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS events ('
+                         'id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, '
+                         'data TEXT NOT NULL, created REAL NOT NULL)')
+
+    def subscribe(self, channels, maxsize=100):
+        self._ensure_poller()
+        return super().subscribe(channels, maxsize)
+
+    def publish_many(self, messages):
+        now = time.time()
+        with self.pool.connection() as conn:
+            conn.executemany('INSERT INTO events (channel, data, created) VALUES (?, ?, ?)',
+                             [(channel, json.dumps(event, separators=(',', ':')), now)
+                              for channel, event in messages])
+
+    def _ensure_poller(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            with self.pool.connection() as conn:
+                self._last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM events').fetchone()[0]
+            threading.Thread(target=self._poll, name='events-poller', daemon=True).start()
+            self._pid = os.getpid()
+
+    def _poll(self):
+        last_purge = time.time()
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                with self.pool.connection() as conn:
+                    rows = conn.execute('SELECT id, channel, data FROM events WHERE id > ? '
+                                        'ORDER BY id LIMIT 1000', (self._last_id,)).fetchall()
+                    if time.time() - last_purge > 60:
+                        conn.execute('DELETE FROM events WHERE created < ?',
+                                     (time.time() - self.retention,))
+                        last_purge = time.time()
+            except Exception as e:
+                print(f"Event poll error: {e}")
+                continue
+
+            with self._lock:
+                for event_id, channel, data in rows:
+                    self._last_id = event_id
+                    if channel in self._subscribers:
+                        self._deliver(event_id, channel, json.loads(data))
+
+
+def create_broker(storage):
+    """Local broker for per-process storage, shared-table broker for SQLite"""
+    pool = getattr(storage, 'pool', None)
+    return SQLBroker(pool) if pool is not None else LocalBroker()
+
+
+def format_sse(event_id, event):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f"event: {event.get('type', 'message')}")
+    lines.append(f"data: {json.dumps(event, separators=(',', ':'))}")
+    return '\n'.join(lines) + '\n\n'
@@ -0,0 +1,17 @@
+"""Gunicorn settings, read automatically when gunicorn starts in this directory
+
+    gunicorn --preload -w 4 -b 0.0.0.0:5000
+"""
+import gc
+
+wsgi_app = 'app:create_app()'
+
+
+def when_ready(server):
+    # With --preload the master has built the app and its read-only data, and
+    # none of it is garbage. Freezing it keeps the collector from writing to
+    # those objects' headers, which would unshare the master's pages in every
+    # worker. Without --preload each worker builds its own, so there's nothing
+    # to share.
+    if server.cfg.preload_app:
+        gc.freeze()
@@ -0,0 +1,53 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class IdempotencyCache:
+    """Bounded, expiring record of Idempotency-Key results for one process
+
+    ``claim`` atomically reserves a key: it returns None to the first caller
+    and the stored record to everyone after, whose ``body`` stays None until
+    the first request calls ``complete`` (or ``release`` to allow a retry).
+    """
+
+    def __init__(self, max_entries=100000, ttl=86400):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._records = OrderedDict()
+        self._lock = threading.Lock()
+
+    def claim(self, key, fingerprint):
+        now = time.time()
+        with self._lock:
+            record = self._records.get(key)
+            if record is not None and record['created'] + self.ttl > now:
+                return record
+
+            self._records[key] = {'fingerprint': fingerprint, 'created': now,
+                                  'status_code': None, 'body': None}
+            self._records.move_to_end(key)
+            while len(self._records) > self.max_entries:
+                self._records.popitem(last=False)
+            return None
+
+    def complete(self, key, status_code, body):
+        with self._lock:
+            record = self._records.get(key)
+            if record is not None:
+                record['status_code'] = status_code
+                record['body'] = body
+
+    def release(self, key):
+        with self._lock:
+            self._records.pop(key, None)
+
+    def purge(self):
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            # Insertion order is creation order, so expired keys are at the front
+            while self._records:
+                key, record = next(iter(self._records.items()))
+                if record['created'] > cutoff:
+                    break
+                del self._records[key]
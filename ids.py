@@ -0,0 +1,52 @@
+import os
+import threading
+import time
+
+CROCKFORD = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+
+def encode_base32(value, length):
+    chars = []
+    for _ in range(length):
+        value, digit = divmod(value, 32)
+        chars.append(CROCKFORD[digit])
+    return ''.join(reversed(chars))
+
+
+class ULIDGenerator:
+    """Monotonic ULIDs: 48-bit millisecond timestamp + 80 random bits
+
+    Ids sort by creation time. Within one millisecond the random part is
+    incremented, so ids from one process are strictly increasing; across
+    processes and nodes the 80 random bits make collisions negligible. The
+    state is reset in forked children so gunicorn workers never share a
+    random sequence.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._last_ms = -1
+        self._last_random = 0
+
+    def new(self):
+        with self._lock:
+            ms = time.time_ns() // 1_000_000
+            if ms <= self._last_ms:
+                # Same millisecond (or clock went back): keep counting up
+                ms = self._last_ms
+                rand = self._last_random + 1
+                if rand >= 1 << 80:
+                    ms += 1
+                    rand = int.from_bytes(os.urandom(10), 'big')
+            else:
+                rand = int.from_bytes(os.urandom(10), 'big')
+            self._last_ms, self._last_random = ms, rand
+        return encode_base32((ms << 80) | rand, 26)
+
+
+ulid = ULIDGenerator()
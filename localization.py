@@ -0,0 +1,73 @@
+import json
+import os
+
+LANGUAGES = ('en', 'hi', 'mr')
+DEFAULT_LANGUAGE = 'en'
+
+# Display fields with a sibling key field, looked up in the ``keys`` table first
+KEYED_FIELDS = {'name': 'nameKey', 'description': 'descKey', 'tagline': 'taglineKey', 'label': 'labelKey'}
+# Fields holding display text; ids, icons, keys and numbers are never touched
+TEXT_FIELDS = frozenset(KEYED_FIELDS) | {'text', 'title', 'desc', 'step', 'ctaText', 'role', 'before', 'after'}
+
+
+class Translations:
+    """One language's strings: ``keys`` for the *Key fields, ``phrases`` by English text
+
+    Anything without a translation is left in English.
+    """
+
+    def __init__(self, keys=None, phrases=None):
+        self.keys = keys or {}
+        self.phrases = phrases or {}
+
+    def __bool__(self):
+        return bool(self.keys or self.phrases)
+
+    def render(self, value):
+        """A translated copy of a content payload (the value itself when there's nothing to do)"""
+        if not self:
+            return value
+        return self._render(value)
+
+    def _render(self, value):
+        if isinstance(value, list):
+            return [self._render(item) for item in value]
+        if not isinstance(value, dict):
+            return value
+
+        rendered = {}
+        for field, item in value.items():
+            if field in TEXT_FIELDS and isinstance(item, str):
+                key = value.get(KEYED_FIELDS.get(field))
+                text = self.keys.get(key) if key else None
+                rendered[field] = text if text is not None else self.phrases.get(item, item)
+            else:
+                rendered[field] = self._render(item)
+        return rendered
+
+
+def load_translations(directory, languages=LANGUAGES):
+    """Read ``<directory>/<lang>.json`` for each language; a missing file means English"""
+    tables = {}
+    for lang in languages:
+        path = os.path.join(directory, f'{lang}.json')
+        if not os.path.exists(path):
+            tables[lang] = Translations()
+            continue
+
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        for section in ('keys', 'phrases'):
+            table = data.get(section, {})
+            if not isinstance(table, dict) or not all(
+                    isinstance(k, str) and isinstance(v, str) for k, v in table.items()):
+                raise ValueError(f'{path}: {section} must map strings to strings')
+        tables[lang] = Translations(data.get('keys'), data.get('phrases'))
+    return tables
+
+
+def negotiate(requested, accept_languages):
+    """``?lang=`` if supported, else the best Accept-Language match, else English"""
+    if requested in LANGUAGES:
+        return requested
+    return accept_languages.best_match(LANGUAGES, default=DEFAULT_LANGUAGE)
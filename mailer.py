@@ -0,0 +1,248 @@
+import html
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+from models import us_to_minutes
+
+
+class MailConfig:
+    """SMTP settings, read from SMTP_* environment variables"""
+
+    def __init__(self, host, port=587, username='', password='', sender='',
+                 starttls=True, timeout=10):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.sender = sender or username
+        self.starttls = starttls
+        self.timeout = timeout
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        """Return None when SMTP_HOST is not set (development mode)"""
+        host = environ.get('SMTP_HOST')
+        if not host:
+            return None
+        return cls(
+            host,
+            port=int(environ.get('SMTP_PORT', 587)),
+            username=environ.get('SMTP_USERNAME', ''),
+            password=environ.get('SMTP_PASSWORD', ''),
+            sender=environ.get('SMTP_SENDER', ''),
+            starttls=environ.get('SMTP_STARTTLS', '1') not in ('0', 'false', 'no'),
+            timeout=float(environ.get('SMTP_TIMEOUT', 10))
+        )
+
+    def connect(self):
+        import smtplib
+
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            server.starttls()
+        if self.username:
+            server.login(self.username, self.password)
+        return server
+
+
+# smtplib and email.mime are imported on first use: most deployments without
+# SMTP_HOST never send mail, and they would otherwise slow every worker's start
+
+def build_otp_message(sender, email, otp):
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+
+    message = MIMEMultipart()
+    message["From"] = sender
+    message["To"] = email
+    message["Subject"] = "Smart Laundry - Your OTP Code"
+
+    body = f"""
+    <h2>Smart Laundry - Login OTP</h2>
+    <p>Your OTP code is: <strong>{otp}</strong></p>
+    <p>This code will expire in 5 minutes.</p>
+    <p>If you didn't request this, please ignore this email.</p>
+    """
+
+    message.attach(MIMEText(body, "html"))
+    return message
+
+
+def build_contact_digest(sender, recipients, messages):
+    """One email listing contact-form messages, oldest first"""
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+
+    message = MIMEMultipart()
+    message["From"] = sender
+    message["To"] = ', '.join(recipients)
+    message["Subject"] = f"Smart Laundry - {len(messages)} new contact message{'s' if len(messages) != 1 else ''}"
+
+    entries = ''.join(
+        f"""
+    <h3>{html.escape(m.name)} &lt;{html.escape(m.email)}&gt;</h3>
+    <p><small>{us_to_minutes(m.created)}</small></p>
+    <p style="white-space: pre-wrap">{html.escape(m.message)}</p>
+    <hr>"""
+        for m in messages)
+    body = f"""
+    <h2>Smart Laundry - Contact form digest</h2>{entries}
+    """
+
+    message.attach(MIMEText(body, "html"))
+    return message
+
+
+class MailQueue:
+    """Bounded outbound mail queue drained by background SMTP workers
+
+    Each worker keeps one authenticated SMTP connection open and sends
+    whatever is queued in batches over it, reconnecting when the server
+    drops it. Failed sends are retried with exponential backoff. Workers
+    start on the first enqueue in each process, so the queue is safe to
+    create before gunicorn forks.
+    """
+
+    def __init__(self, config, workers=2, maxsize=1000, batch_size=20,
+                 max_attempts=4, backoff=0.5, idle_timeout=30):
+        self.config = config
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.idle_timeout = idle_timeout
+
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._threads = []
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.retries = 0
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._threads = [
+                threading.Thread(target=self._run, name=f'mailer-{i}', daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+            self._pid = os.getpid()
+
+    def enqueue(self, message):
+        """Queue a message for delivery; False if the queue is full"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((message, time.monotonic()))
+        except queue.Full:
+            with self._stats_lock:
+                self.dropped += 1
+            return False
+        return True
+
+    def send_otp(self, email, otp):
+        return self.enqueue(build_otp_message(self.config.sender, email, otp))
+
+    def send_contact_digest(self, recipients, messages):
+        return self.enqueue(build_contact_digest(self.config.sender, recipients, messages))
+
+    def stop(self, timeout=5):
+        """Deliver what is queued, then stop the workers"""
+        for _ in self._threads:
+            self._queue.put((None, None))
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._pid = None
+
+    def stats(self):
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            stats = {
+                'queue_depth': self._queue.qsize(),
+                'sent': self.sent,
+                'failed': self.failed,
+                'dropped': self.dropped,
+                'retries': self.retries
+            }
+
+        for name, q in (('latency_p50', 0.50), ('latency_p95', 0.95), ('latency_max', 1.0)):
+            stats[name] = latencies[min(int(q * len(latencies)), len(latencies) - 1)] if latencies else None
+        return stats
+
+    # =============== WORKER ===============
+
+    def _next_batch(self):
+        """Block for one message, then take whatever else is already queued"""
+        batch = [self._queue.get(timeout=self.idle_timeout)]
+        while len(batch) < self.batch_size and batch[-1][0] is not None:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        server = None
+        while True:
+            try:
+                batch = self._next_batch()
+            except queue.Empty:
+                # Idle: let the server reclaim the connection
+                server = self._close(server)
+                continue
+
+            for message, enqueued_at in batch:
+                if message is None:
+                    self._close(server)
+                    return
+                server = self._deliver(server, message, enqueued_at)
+
+    def _deliver(self, server, message, enqueued_at):
+        import smtplib
+
+        for attempt in range(self.max_attempts):
+            if attempt:
+                with self._stats_lock:
+                    self.retries += 1
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                if server is None:
+                    server = self.config.connect()
+                server.send_message(message)
+            except (smtplib.SMTPException, OSError) as e:
+                print(f"Email error: {e}")
+                server = self._close(server)
+                continue
+
+            with self._stats_lock:
+                self.sent += 1
+                self._latencies.append(time.monotonic() - enqueued_at)
+            return server
+
+        with self._stats_lock:
+            self.failed += 1
+        return server
+
+    @staticmethod
+    def _close(server):
+        import smtplib
+
+        if server is not None:
+            try:
+                server.quit()
+            except (smtplib.SMTPException, OSError):
+                server.close()
+        return None
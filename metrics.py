@@ -0,0 +1,244 @@
+import glob
+import io
+import json
+import marshal
+import os
+import threading
+import time
+
+from flask import Response, g, request
+
+# Latency buckets in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Metrics:
+    """Per-route latency histograms, size counters and an in-flight gauge
+
+    Exposed in Prometheus text format at ``/metrics``. When
+    ``multiprocess_dir`` is set every worker also writes its counters there
+    every few seconds, and a scrape of any worker sums them all, so the
+    numbers cover the whole gunicorn pool rather than one process.
+
+    Admins can profile a single request with ``?__profile=1`` or an
+    ``X-Profile: 1`` header; the response is then replaced by the cProfile
+    stats (``pstats`` binary for snakeviz/flameprof, or ``__profile=text``).
+    """
+
+    def __init__(self, app=None, multiprocess_dir=None, flush_interval=5, is_admin=None):
+        self.multiprocess_dir = multiprocess_dir
+        self.flush_interval = flush_interval
+        self.is_admin = is_admin
+        self._lock = threading.Lock()
+        self._latency = {}         # (method, route, status) -> [bucket counts..., sum, count]
+        self._request_bytes = {}   # (method, route) -> bytes
+        self._response_bytes = {}  # (method, route) -> bytes
+        self._in_flight = 0
+        self._gauges = {}          # name -> (help, callable)
+        self._pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule('/metrics', 'metrics', self.metrics_view, methods=['GET'])
+
+    def gauge(self, name, help_text, fn):
+        """Report ``fn()`` as a per-worker gauge on every scrape"""
+        self._gauges[name] = (help_text, fn)
+
+    # =============== REQUEST HOOKS ===============
+
+    def _before_request(self):
+        self._ensure_flusher()
+        with self._lock:
+            self._in_flight += 1
+        g._metrics_start = time.perf_counter()
+        g._metrics_counted = True
+
+        if request.args.get('__profile') or request.headers.get('X-Profile'):
+            if self.is_admin is not None and self.is_admin():
+                import cProfile  # only ever needed here, so not at worker start
+                g._profiler = cProfile.Profile()
+                g._profiler.enable()
+
+    def _after_request(self, response):
+        profiler = g.pop('_profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            response = self._profile_response(profiler)
+
+        start = g.get('_metrics_start')
+        if start is not None:
+            self.observe(request.method, self._route(), response.status_code,
+                         time.perf_counter() - start,
+                         request.content_length or 0,
+                         response.content_length or 0)
+        return response
+
+    def _teardown_request(self, exc):
+        if g.pop('_metrics_counted', False):
+            with self._lock:
+                self._in_flight -= 1
+
+    @staticmethod
+    def _route():
+        # The rule pattern, not the raw path, keeps label cardinality bounded
+        return request.url_rule.rule if request.url_rule else 'unmatched'
+
+    def observe(self, method, route, status, seconds, request_size, response_size):
+        key = (method, route, str(status))
+        with self._lock:
+            entry = self._latency.get(key)
+            if entry is None:
+                entry = self._latency[key] = [0] * (len(BUCKETS) + 2)
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    entry[i] += 1
+                    break
+            entry[-2] += seconds
+            entry[-1] += 1
+
+            size_key = (method, route)
+            self._request_bytes[size_key] = self._request_bytes.get(size_key, 0) + request_size
+            self._response_bytes[size_key] = self._response_bytes.get(size_key, 0) + response_size
+
+    # =============== PROFILING ===============
+
+    @staticmethod
+    def _profile_response(profiler):
+        if request.args.get('__profile') == 'text':
+            import pstats
+
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats('cumulative').print_stats(50)
+            return Response(out.getvalue(), mimetype='text/plain')
+
+        profiler.create_stats()
+        response = Response(marshal.dumps(profiler.stats), mimetype='application/octet-stream')
+        response.headers['Content-Disposition'] = 'attachment; filename=request.prof'
+        return response
+
+    # =============== MULTI-WORKER AGGREGATION ===============
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'latency': [[list(k), list(v)] for k, v in self._latency.items()],
+                'request_bytes': [[list(k), v] for k, v in self._request_bytes.items()],
+                'response_bytes': [[list(k), v] for k, v in self._response_bytes.items()],
+                'in_flight': self._in_flight,
+            }
+
+    def _ensure_flusher(self):
+        if not self.multiprocess_dir or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        os.makedirs(self.multiprocess_dir, exist_ok=True)
+        threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Metrics flush error: {e}")
+
+    def flush(self):
+        path = os.path.join(self.multiprocess_dir, f'metrics-{os.getpid()}.json')
+        tmp = f'{path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, path)
+
+    def _collect(self):
+        """This worker's live snapshot plus the last one from every other worker"""
+        snapshots = [self.snapshot()]
+        if not self.multiprocess_dir:
+            return snapshots
+
+        for path in glob.glob(os.path.join(self.multiprocess_dir, 'metrics-*.json')):
+            try:
+                with open(path) as f:
+                    snap = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if snap['pid'] == os.getpid():
+                continue
+            if not _pid_alive(snap['pid']):
+                # Counters from dead workers still count, their gauges don't
+                snap['in_flight'] = 0
+            snapshots.append(snap)
+        return snapshots
+
+    # =============== EXPOSITION ===============
+
+    def render(self):
+        latency, request_bytes, response_bytes, in_flight = {}, {}, {}, 0
+        for snap in self._collect():
+            for key, values in snap['latency']:
+                total = latency.setdefault(tuple(key), [0] * len(values))
+                for i, value in enumerate(values):
+                    total[i] += value
+            for target, name in ((request_bytes, 'request_bytes'), (response_bytes, 'response_bytes')):
+                for key, value in snap[name]:
+                    target[tuple(key)] = target.get(tuple(key), 0) + value
+            in_flight += snap['in_flight']
+
+        lines = [
+            '# HELP laundry_http_request_duration_seconds Request latency by route',
+            '# TYPE laundry_http_request_duration_seconds histogram',
+        ]
+        for (method, route, status), values in sorted(latency.items()):
+            labels = f'method="{method}",route="{_escape(route)}",status="{status}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS, values):
+                cumulative += count
+                lines.append(f'laundry_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'laundry_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {values[-1]}')
+            lines.append(f'laundry_http_request_duration_seconds_sum{{{labels}}} {values[-2]}')
+            lines.append(f'laundry_http_request_duration_seconds_count{{{labels}}} {values[-1]}')
+
+        for name, help_text, values in (
+            ('laundry_http_request_size_bytes_total', 'Request body bytes by route', request_bytes),
+            ('laundry_http_response_size_bytes_total', 'Response body bytes by route', response_bytes),
+        ):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for (method, route), value in sorted(values.items()):
+                lines.append(f'{name}{{method="{method}",route="{_escape(route)}"}} {value}')
+
+        lines.append('# HELP laundry_http_requests_in_flight Requests being handled right now')
+        lines.append('# TYPE laundry_http_requests_in_flight gauge')
+        lines.append(f'laundry_http_requests_in_flight {in_flight}')
+
+        for name, (help_text, fn) in sorted(self._gauges.items()):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name}{{pid="{os.getpid()}"}} {fn()}')
+
+        return '\n'.join(lines) + '\n'
+
+    def metrics_view(self):
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
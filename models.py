@@ -0,0 +1,240 @@
+import json
+import re
+from datetime import datetime
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the stdlib encoder writes the same JSON
+    orjson = None
+
+# Money is held as integer paise and times as integer epoch microseconds;
+# both are turned back into the API's rupees and local date strings only
+# when serialized. Every model has __slots__, since orders are the bulk of
+# a worker's memory.
+
+# =============== MONEY ===============
+
+def to_paise(amount):
+    return round(amount * 100)
+
+
+def from_paise(paise):
+    """Rupees as the API shows them: an int when whole, else a float"""
+    rupees, rest = divmod(paise, 100)
+    return rupees if not rest else paise / 100
+
+
+# =============== TIME ===============
+
+def epoch_us(moment):
+    """A naive local datetime as epoch microseconds (exact, no float rounding)"""
+    seconds = round(moment.replace(microsecond=0).timestamp())
+    return seconds * 1_000_000 + moment.microsecond
+
+
+def local_datetime(us):
+    # A float holds today's epoch to well under half a microsecond, so this
+    # rounds back to the exact microsecond
+    return datetime.fromtimestamp(us / 1_000_000)
+
+
+def iso_to_us(value):
+    """Parses both created_at ('...T09:07:03.120000') and pickup_time ('... 11:07') strings"""
+    return epoch_us(datetime.fromisoformat(value))
+
+
+def us_to_iso(us):
+    return local_datetime(us).isoformat()
+
+
+def us_to_minutes(us):
+    """'YYYY-MM-DD HH:MM', the format of pickup and delivery times"""
+    return local_datetime(us).isoformat(' ', 'minutes')
+
+
+# =============== MODELS ===============
+
+class LineItem:
+    """One item line in a cart or an order"""
+
+    __slots__ = ('id', 'name', 'price', 'emoji', 'qty')
+
+    def __init__(self, id, name, price, emoji, qty):
+        self.id = id
+        self.name = name
+        self.price = price  # paise
+        self.emoji = emoji
+        self.qty = qty
+
+    @classmethod
+    def from_option(cls, item_id, option, qty=1):
+        return cls(item_id, option['label'], to_paise(option['price']), option['emoji'], qty)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['id'], data['name'], to_paise(data['price']), data['emoji'], data['qty'])
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*row)
+
+    def copy(self):
+        return LineItem(self.id, self.name, self.price, self.emoji, self.qty)
+
+    def to_row(self):
+        return (self.id, self.name, self.price, self.emoji, self.qty)
+
+    def to_dict(self):
+        return {'id': self.id, 'name': self.name, 'price': from_paise(self.price),
+                'emoji': self.emoji, 'qty': self.qty}
+
+
+class Order:
+    __slots__ = ('id', 'user_id', 'items', 'total', 'status', 'created', 'pickup', 'delivery')
+
+    def __init__(self, id, user_id, items, total, status, created, pickup, delivery):
+        self.id = id
+        self.user_id = user_id
+        self.items = tuple(items)  # LineItem
+        self.total = total         # paise
+        self.status = status
+        self.created = created     # epoch microseconds, like pickup and delivery
+        self.pickup = pickup
+        self.delivery = delivery
+
+    @property
+    def created_at(self):
+        return us_to_iso(self.created)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['id'], data['user_id'], map(LineItem.from_dict, data['items']),
+                   to_paise(data['total']), data['status'], iso_to_us(data['created_at']),
+                   iso_to_us(data['pickup_time']), iso_to_us(data['delivery_time']))
+
+    @classmethod
+    def from_row(cls, row):
+        id, user_id, items, *rest = row
+        return cls(id, user_id, map(LineItem.from_row, items), *rest)
+
+    def to_row(self):
+        """Every field as plain values, exactly (unlike the rounded local times of to_dict)"""
+        return (self.id, self.user_id, [item.to_row() for item in self.items], self.total,
+                self.status, self.created, self.pickup, self.delivery)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'items': [item.to_dict() for item in self.items],
+            'total': from_paise(self.total),
+            'status': self.status,
+            'created_at': self.created_at,
+            'pickup_time': us_to_minutes(self.pickup),
+            'delivery_time': us_to_minutes(self.delivery)
+        }
+
+    def summary(self):
+        """The shape of an entry in the customer's order list"""
+        return {
+            '_id': self.id,
+            'serviceName': 'Laundry Service',
+            'status': self.status,
+            'total': from_paise(self.total),
+            'createdAt': self.created_at,
+            'pickupTime': us_to_minutes(self.pickup),
+            'deliveryTime': us_to_minutes(self.delivery)
+        }
+
+
+class User:
+    __slots__ = ('id', 'email', 'name', 'phone', 'role', 'created')
+
+    def __init__(self, id, email, name, phone, role, created):
+        self.id = id
+        self.email = email
+        self.name = name
+        self.phone = phone
+        self.role = role
+        self.created = created  # epoch microseconds
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['id'], data['email'], data['name'], data['phone'], data['role'],
+                   iso_to_us(data['created_at']))
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*row)
+
+    def to_row(self):
+        return (self.id, self.email, self.name, self.phone, self.role, self.created)
+
+    def to_dict(self):
+        return {'id': self.id, 'email': self.email, 'name': self.name, 'phone': self.phone,
+                'role': self.role, 'created_at': us_to_iso(self.created)}
+
+
+class ContactMessage:
+    """A contact-form submission"""
+
+    __slots__ = ('id', 'name', 'email', 'message', 'ip', 'created', 'fingerprint')
+
+    def __init__(self, id, name, email, message, ip, created, fingerprint):
+        self.id = id
+        self.name = name
+        self.email = email
+        self.message = message
+        self.ip = ip
+        self.created = created          # epoch microseconds
+        self.fingerprint = fingerprint  # same sender and text -> same fingerprint
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*row)
+
+    def to_row(self):
+        return (self.id, self.name, self.email, self.message, self.ip, self.created, self.fingerprint)
+
+    def to_dict(self):
+        return {'id': self.id, 'name': self.name, 'email': self.email, 'message': self.message,
+                'created_at': us_to_iso(self.created)}
+
+
+# =============== SERIALIZATION ===============
+
+def to_json_default(value):
+    """``default`` hook for JSON encoders: models become their API dicts"""
+    to_dict = getattr(value, 'to_dict', None)
+    if to_dict is None:
+        raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+    return to_dict()
+
+
+# json.dumps escapes everything outside printable ASCII; orjson writes UTF-8
+_NON_ASCII = re.compile(r'[^\x00-\x7e]')
+
+
+def _escape(match):
+    code = ord(match.group())
+    if code < 0x10000:
+        return f'\\u{code:04x}'
+    code -= 0x10000
+    return f'\\u{0xd800 | (code >> 10):04x}\\u{0xdc00 | (code & 0x3ff):04x}'
+
+
+def dumps(value, sort_keys=False, default=to_json_default):
+    """Compact JSON for API payloads, models included, as json.dumps would write it"""
+    if orjson is not None:
+        try:
+            text = orjson.dumps(value, default=default,
+                                option=orjson.OPT_SORT_KEYS if sort_keys else 0).decode('utf-8')
+        except TypeError:
+            pass  # e.g. ints beyond 64 bits: let json handle (or reject) it
+        else:
+            return text if text.isascii() and '\x7f' not in text else _NON_ASCII.sub(_escape, text)
+    return json.dumps(value, default=default, separators=(',', ':'), sort_keys=sort_keys)
+
+
+def loads(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
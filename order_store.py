@@ -0,0 +1,111 @@
+from bisect import bisect_left, bisect_right, insort
+
+
+class OrderStore:
+    """In-memory orders indexed by id and by user, ordered by creation time
+
+    Orders are ``models.Order`` objects as built by checkout. Pages are
+    returned oldest first; the cursor is the id of the last order on the
+    previous page.
+    """
+
+    def __init__(self):
+        self._by_id = {}
+        self._keys = []       # (created, id) for every order, sorted
+        self._user_keys = {}  # user_id -> sorted (created, id) list
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __iter__(self):
+        for _, order_id in self._keys:
+            yield self._by_id[order_id]
+
+    @staticmethod
+    def _key(order):
+        return (order.created, order.id)
+
+    @staticmethod
+    def _insert(keys, key):
+        # Orders almost always arrive in creation order, so appending is
+        # the common case and insort only handles stragglers
+        if not keys or keys[-1] <= key:
+            keys.append(key)
+        else:
+            insort(keys, key)
+
+    def add(self, order):
+        if order.id in self._by_id:
+            raise ValueError(f"Duplicate order id {order.id}")
+
+        key = self._key(order)
+        self._by_id[order.id] = order
+        self._insert(self._keys, key)
+        self._insert(self._user_keys.setdefault(order.user_id, []), key)
+        return order
+
+    def get(self, order_id):
+        return self._by_id.get(order_id)
+
+    def set_status(self, order_id, status):
+        order = self._by_id.get(order_id)
+        if order is not None:
+            order.status = status
+        return order
+
+    @staticmethod
+    def matches(order, status=None, user_id=None, since=None, until=None):
+        """Whether an order passes the filters taken by ``scan``"""
+        return ((status is None or order.status == status)
+                and (user_id is None or order.user_id == user_id)
+                and (since is None or order.created >= since)
+                and (until is None or order.created < until))
+
+    def _page(self, keys, limit, after):
+        start = 0
+        if after is not None:
+            order = self._by_id.get(after)
+            if order is None:
+                raise KeyError(after)
+            start = bisect_right(keys, self._key(order))
+
+        end = len(keys) if limit is None else min(start + limit, len(keys))
+        page = [self._by_id[order_id] for _, order_id in keys[start:end]]
+        next_cursor = keys[end - 1][1] if page and end < len(keys) else None
+        return page, next_cursor
+
+    def page_all(self, limit=None, after=None):
+        """Return (orders, next_cursor) across all users"""
+        return self._page(self._keys, limit, after)
+
+    def page_for_user(self, user_id, limit=None, after=None):
+        """Return (orders, next_cursor) for one user's history"""
+        keys = self._user_keys.get(user_id, [])
+        if after is not None:
+            order = self._by_id.get(after)
+            if order is None or order.user_id != user_id:
+                raise KeyError(after)
+        return self._page(keys, limit, after)
+
+    def scan(self, status=None, user_id=None, since=None, until=None, after=None, limit=None):
+        """Orders matching the filters, in creation order, a bounded slice at a time
+
+        ``since``/``until`` are epoch microseconds (inclusive/exclusive) and
+        ``after`` is the last key returned by the previous call. At most
+        ``limit`` orders are looked at, so this returns (matches, last_key)
+        where last_key is None once the range is exhausted.
+        """
+        keys = self._user_keys.get(user_id, []) if user_id is not None else self._keys
+        start = bisect_left(keys, (since,)) if since is not None else 0
+        if after is not None:
+            start = max(start, bisect_right(keys, after))
+        stop = bisect_left(keys, (until,)) if until is not None else len(keys)
+        end = stop if limit is None else min(stop, start + limit)
+
+        matches = []
+        for key in keys[start:end]:
+            order = self._by_id[key[1]]
+            if status is None or order.status == status:
+                matches.append(order)
+
+        return matches, (keys[end - 1] if start < end < stop else None)
@@ -0,0 +1,105 @@
+import heapq
+import threading
+import time
+
+
+class OTPStore:
+    """OTP records with an expiry heap, bounded in size
+
+    Expired records are dropped lazily on read and in bulk by ``purge``,
+    which only looks at the front of the heap. When the store is full the
+    records closest to expiry are evicted first.
+    """
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._records = {}
+        self._heap = []  # (expires, key); may hold stale entries for re-sent OTPs
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._records)
+
+    def get(self, key, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            record = self._records.get(key)
+            if record is not None and record['expires'] <= now:
+                del self._records[key]
+                record = None
+            return record
+
+    def set(self, key, record):
+        with self._lock:
+            if key not in self._records and len(self._records) >= self.max_entries:
+                self._purge(time.time())
+                while len(self._records) >= self.max_entries:
+                    self._pop_live()
+
+            self._records[key] = record
+            heapq.heappush(self._heap, (record['expires'], key))
+
+            # Re-sends leave stale heap entries behind; compact now and then
+            if len(self._heap) > 2 * len(self._records) + 1024:
+                self._heap = [(r['expires'], k) for k, r in self._records.items()]
+                heapq.heapify(self._heap)
+
+    def delete(self, key):
+        with self._lock:
+            self._records.pop(key, None)
+
+    def purge(self, now=None):
+        """Drop every expired record; returns how many were removed"""
+        now = time.time() if now is None else now
+        with self._lock:
+            return self._purge(now)
+
+    def _purge(self, now):
+        removed = 0
+        while self._heap and self._heap[0][0] <= now:
+            expires, key = heapq.heappop(self._heap)
+            record = self._records.get(key)
+            if record is not None and record['expires'] == expires:
+                del self._records[key]
+                removed += 1
+        return removed
+
+    def _pop_live(self):
+        while self._heap:
+            expires, key = heapq.heappop(self._heap)
+            record = self._records.get(key)
+            if record is not None and record['expires'] == expires:
+                del self._records[key]
+                return
+
+
+class ShardedOTPStore:
+    """OTPStore split into shards by key hash, so threads sending and checking
+    OTPs for different users take different locks
+
+    Same interface as OTPStore; ``max_entries`` is shared out evenly.
+    """
+
+    def __init__(self, max_entries=100000, shards=16):
+        self._shards = [OTPStore(max(1, max_entries // shards)) for _ in range(shards)]
+
+    def __len__(self):
+        return sum(len(shard) for shard in self._shards)
+
+    def _shard(self, key):
+        return self._shards[hash(key) % len(self._shards)]
+
+    def get(self, key, now=None):
+        return self._shard(key).get(key, now)
+
+    def set(self, key, record):
+        self._shard(key).set(key, record)
+
+    def delete(self, key):
+        self._shard(key).delete(key)
+
+    def purge(self, now=None):
+        """Drop every expired record; returns how many were removed"""
+        now = time.time() if now is None else now
+        return sum(shard.purge(now) for shard in self._shards)
+
@@ -0,0 +1,37 @@
+import os
+import threading
+import time
+
+
+class PeriodicTask:
+    """Calls ``fn`` every ``interval`` seconds from a daemon thread named ``name``
+
+    The thread is started on first use in each process, so this is safe to
+    create before gunicorn forks its workers. Errors are printed with
+    ``label`` and the next run goes ahead as planned.
+    """
+
+    def __init__(self, fn, interval, name, label):
+        self.fn = fn
+        self.interval = interval
+        self.name = name
+        self.label = label
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            threading.Thread(target=self._run, name=self.name, daemon=True).start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.fn()
+            except Exception as e:
+                print(f"{self.label} error: {e}")
@@ -0,0 +1,186 @@
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # redis is optional, buckets default to the storage backend
+    redis = None
+
+
+def refill(tokens, updated, now, rate, capacity):
+    return min(capacity, tokens + (now - updated) * rate)
+
+
+def retry_after(tokens, cost, rate):
+    """Seconds until a bucket holding ``tokens`` can pay ``cost``"""
+    return (cost - tokens) / rate
+
+
+class MemoryBuckets:
+    """Process-local token buckets, least recently used evicted past max_keys
+
+    An evicted key simply starts again with a full bucket. The in-flight
+    count for admission control is this process's own.
+    """
+
+    blocking = False
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, updated)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, capacity, cost=1, now=None):
+        """Take ``cost`` tokens; returns 0 if allowed, else seconds to wait"""
+        now = time.time() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens = refill(tokens, updated, now, rate, capacity)
+
+            wait = 0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = retry_after(tokens, cost, rate)
+
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def enter(self, worker, limit, lease):
+        """Count one more request in flight, unless ``limit`` already are; False if full"""
+        with self._lock:
+            if self._in_flight >= limit:
+                return False
+            self._in_flight += 1
+            return True
+
+    def leave(self, worker, lease):
+        with self._lock:
+            self._in_flight -= 1
+
+
+# Refill, take and store one bucket atomically, on the Redis server's clock so
+# nodes with skewed clocks still agree. Returns the wait as a string, since
+# Lua numbers returned to Redis are truncated to integers.
+_TAKE_SCRIPT = """
+local rate, capacity, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = capacity
+if state[1] then
+    tokens = math.min(capacity, tonumber(state[1]) + (now - tonumber(state[2])) * rate)
+end
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return tostring(wait)
+"""
+
+
+# In-flight requests per worker (KEYS[1]) and when each worker's count stops
+# counting (KEYS[2]) unless the worker touches it again, so a killed worker's
+# requests don't hold slots forever. Enter admits if the live total is under
+# ARGV[2]; leave never takes a count below zero.
+_ENTER_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local counts = redis.call('HGETALL', KEYS[1])
+local total = 0
+for i = 1, #counts, 2 do
+    local expires = tonumber(redis.call('HGET', KEYS[2], counts[i]) or '0')
+    if expires > now then
+        total = total + tonumber(counts[i + 1])
+    else
+        redis.call('HDEL', KEYS[1], counts[i])
+        redis.call('HDEL', KEYS[2], counts[i])
+    end
+end
+if total >= tonumber(ARGV[2]) then
+    return 0
+end
+redis.call('HINCRBY', KEYS[1], ARGV[1], 1)
+redis.call('HSET', KEYS[2], ARGV[1], now + tonumber(ARGV[3]))
+return 1
+"""
+
+_LEAVE_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+if tonumber(redis.call('HGET', KEYS[1], ARGV[1]) or '0') > 0 then
+    redis.call('HINCRBY', KEYS[1], ARGV[1], -1)
+    redis.call('HSET', KEYS[2], ARGV[1], now + tonumber(ARGV[2]))
+end
+return 1
+"""
+
+
+class RedisBuckets:
+    """Token buckets in Redis (5+), so limits hold across workers and nodes
+
+    Each take is one script call; a bucket expires once it would have
+    refilled, so idle keys clean themselves up. The in-flight count for
+    admission control is kept per worker in two hashes.
+    """
+
+    blocking = True
+
+    def __init__(self, client, prefix='laundry:bucket:'):
+        self.prefix = prefix
+        self._take = client.register_script(_TAKE_SCRIPT)
+        self._enter = client.register_script(_ENTER_SCRIPT)
+        self._leave = client.register_script(_LEAVE_SCRIPT)
+        self._in_flight_keys = [prefix + 'in-flight', prefix + 'in-flight-leases']
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        if redis is None:
+            raise RuntimeError('RATE_LIMIT_URL needs the redis package')
+        return cls(redis.Redis.from_url(url, socket_timeout=1), **kwargs)
+
+    def take(self, key, rate, capacity, cost=1, now=None):
+        """Take ``cost`` tokens; returns 0 if allowed, else seconds to wait (``now`` is Redis's)"""
+        return float(self._take(keys=[self.prefix + key], args=[rate, capacity, cost]))
+
+    def enter(self, worker, limit, lease):
+        """Count one more request in flight for ``worker``, unless ``limit`` already are
+        across every live worker; False if full"""
+        return bool(self._enter(keys=self._in_flight_keys, args=[worker, limit, lease]))
+
+    def leave(self, worker, lease):
+        self._leave(keys=self._in_flight_keys, args=[worker, lease])
+
+    def purge(self, idle_for=3600):
+        pass  # keys expire on their own
+
+
+def create_buckets(url, default):
+    """Buckets for ``redis://`` URLs, else ``default`` (the storage backend's)"""
+    if url and url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBuckets.from_url(url)
+    if url:
+        raise ValueError(f"Unsupported rate limit URL: {url}")
+    return default
+
+
+class RateLimiter:
+    """A named token-bucket limit: ``limit`` requests per ``period`` seconds"""
+
+    def __init__(self, buckets, name, limit, period):
+        self.buckets = buckets
+        self.name = name
+        self.capacity = limit
+        self.rate = limit / period
+
+    def hit(self, key):
+        """Returns 0 if the request is allowed, else seconds until it would be"""
+        return self.buckets.take(f'{self.name}:{key}', self.rate, self.capacity)
@@ -0,0 +1,109 @@
+import gzip
+import hashlib
+
+from flask import Response, current_app, request
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+
+class CachedPayload:
+    """One JSON payload serialized once, plus its precompressed variants"""
+
+    def __init__(self, body):
+        self.body = body
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        # encoding -> compressed bytes, only kept when it actually saves space
+        self.encoded = {}
+
+        gzipped = gzip.compress(body, compresslevel=9, mtime=0)
+        if len(gzipped) < len(body):
+            self.encoded['gzip'] = gzipped
+
+        if brotli is not None:
+            compressed = brotli.compress(body, quality=11)
+            if len(compressed) < len(body):
+                self.encoded['br'] = compressed
+
+    def pick_encoding(self, accept_encodings):
+        """Best precompressed encoding the client accepts, or None for identity"""
+        best, best_size = None, len(self.body)
+        for encoding, data in self.encoded.items():
+            if accept_encodings[encoding] and len(data) < best_size:
+                best, best_size = encoding, len(data)
+        return best
+
+
+class ResponseCache:
+    """Serves static JSON payloads from pre-serialized bytes with ETags
+
+    Payloads are registered as zero-argument callables and serialized lazily
+    on first use. After the underlying data is reloaded call ``rebuild`` (or
+    ``invalidate`` to rebuild lazily).
+    """
+
+    def __init__(self, max_age=300):
+        self.max_age = max_age
+        self._providers = {}
+        self._entries = {}
+        # Bumped on every reload so a build from the old data is never stored
+        self._generation = 0
+
+    def register(self, key, provider):
+        self._providers[key] = provider
+        self._entries.pop(key, None)
+
+    def invalidate(self, *keys):
+        """Drop cached entries for the given keys, or all of them"""
+        self._generation += 1
+        if not keys:
+            self._entries.clear()
+            return
+        for key in keys:
+            self._entries.pop(key, None)
+
+    def rebuild(self, *keys):
+        """Serialize fresh entries for the keys (default all), then swap them in
+
+        Requests are served from the old entries until the swap, so a reload
+        never leaves a cold cache behind. Needs an app context.
+        """
+        fresh = {key: self._build(key) for key in (keys or tuple(self._providers))}
+        self._generation += 1
+        self._entries = {**self._entries, **fresh}
+
+    def _build(self, key):
+        payload = self._providers[key]()
+        # Same bytes jsonify would produce, computed once
+        return CachedPayload(current_app.json.response(payload).get_data())
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            generation = self._generation
+            entry = self._build(key)
+            # A concurrent build just produces an identical entry, so no lock
+            if generation == self._generation:
+                self._entries[key] = entry
+        return entry
+
+    def respond(self, key):
+        """Build a response for the current request, honouring If-None-Match"""
+        entry = self.get(key)
+        encoding = entry.pick_encoding(request.accept_encodings)
+        etag = entry.etag if encoding is None else f"{entry.etag}-{encoding}"
+
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            data = entry.body if encoding is None else entry.encoded[encoding]
+            response = Response(data, status=200, mimetype='application/json')
+            if encoding is not None:
+                response.headers['Content-Encoding'] = encoding
+
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = f"public, max-age={self.max_age}"
+        response.vary.add('Accept-Encoding')
+        return response
@@ -0,0 +1,205 @@
+import re
+import threading
+from datetime import datetime, timedelta
+
+from models import epoch_us, local_datetime, us_to_minutes
+
+PICKUP, DELIVERY = 'pickup', 'delivery'
+
+# Turnaround for a service whose ``after`` text can't be read: the old fixed
+# "delivered a day later"
+DEFAULT_TURNAROUND_HOURS = 24
+SAME_DAY_HOURS = 6
+
+_TURNAROUND_RE = re.compile(r'^(\d+)\s*(hour|hr|day)s?$')
+
+
+class SlotError(Exception):
+    """A slot request that can't be met"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class SlotUnavailable(Exception):
+    """Raised by storage when a reservation finds its slot already full"""
+
+    def __init__(self, kind, start):
+        super().__init__(f'{kind} slot {start} is full')
+        self.kind = kind
+        self.start = start
+
+
+def service_turnaround(service):
+    """Hours from pickup to the earliest delivery for a service
+
+    Taken from ``turnaround_hours`` if the content sets it, else read from
+    the ``after`` text ('Same day', '1 day', '3 days', '12 hours').
+    """
+    hours = service.get('turnaround_hours')
+    if hours is not None:
+        return hours
+    text = (service.get('after') or '').strip().lower()
+    if text == 'same day':
+        return SAME_DAY_HOURS
+    match = _TURNAROUND_RE.match(text)
+    if match:
+        return int(match[1]) * (1 if match[2] in ('hour', 'hr') else 24)
+    return DEFAULT_TURNAROUND_HOURS
+
+
+def slot_id(start):
+    """Public id of a slot: its local start time, 'YYYY-MM-DDTHH:MM'"""
+    return us_to_minutes(start).replace(' ', 'T')
+
+
+class SlotBook:
+    """Reserved van places per (kind, slot start), for the in-memory backend
+
+    Each slot is one counter in a dict, so checking or taking a place is
+    O(1). ``reserve`` takes every place it is given or none of them.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._used = {}  # (kind, start) -> places taken
+
+    def usage(self, kind, starts):
+        return {start: self._used.get((kind, start), 0) for start in starts}
+
+    def reserve(self, reservations):
+        """Take one place in each (kind, start, capacity); raises SlotUnavailable"""
+        with self._lock:
+            for kind, start, capacity in reservations:
+                if self._used.get((kind, start), 0) >= capacity:
+                    raise SlotUnavailable(kind, start)
+            for kind, start, _ in reservations:
+                self._used[(kind, start)] = self._used.get((kind, start), 0) + 1
+
+    def release(self, reservations):
+        with self._lock:
+            for kind, start, _ in reservations:
+                used = self._used.get((kind, start), 0) - 1
+                if used > 0:
+                    self._used[(kind, start)] = used
+                else:
+                    self._used.pop((kind, start), None)
+
+    def counts(self):
+        """[(kind, start, places taken)] for every slot in use"""
+        with self._lock:
+            return [(kind, start, used) for (kind, start), used in self._used.items()]
+
+    def restore(self, counts):
+        with self._lock:
+            self._used = {(kind, start): used for kind, start, used in counts}
+
+    def purge(self, before):
+        """Forget slots that started before ``before`` (epoch microseconds)"""
+        with self._lock:
+            for key in [key for key in self._used if key[1] < before]:
+                del self._used[key]
+
+
+class Scheduler:
+    """Pickup and delivery windows on a fixed daily grid, with van capacity
+
+    Every day from ``day_start`` to ``day_end`` (local hours) is cut into
+    ``slot_minutes`` windows. Each window takes at most ``capacity[kind]``
+    pickups or deliveries. Pickups are offered from ``lead_minutes`` after
+    now for ``horizon_days``. Deliveries are offered from the end of the
+    pickup window plus the slowest service's turnaround. Places are taken
+    by the storage backend in the same transaction as the order.
+    """
+
+    def __init__(self, storage, slot_minutes=120, day_start=8, day_end=20, horizon_days=7,
+                 pickup_capacity=10, delivery_capacity=10, lead_minutes=120):
+        if not 0 <= day_start < day_end <= 24 or slot_minutes <= 0 or (day_end - day_start) * 60 < slot_minutes:
+            raise ValueError('Slot grid must fit at least one slot between day_start and day_end')
+        self.storage = storage
+        self.slot_minutes = slot_minutes
+        self.day_start = day_start
+        self.day_end = day_end
+        self.horizon_days = horizon_days
+        self.capacity = {PICKUP: pickup_capacity, DELIVERY: delivery_capacity}
+        self.lead = timedelta(minutes=lead_minutes)
+        # Minutes after midnight at which each window opens
+        self._offsets = tuple(range(day_start * 60, day_end * 60 - slot_minutes + 1, slot_minutes))
+
+    # =============== GRID ===============
+
+    def starts(self, earliest, until):
+        """Window starts (epoch microseconds) from earliest up to until (naive local datetimes)"""
+        day = earliest.replace(hour=0, minute=0, second=0, microsecond=0)
+        while day < until:
+            for offset in self._offsets:
+                start = day + timedelta(minutes=offset)
+                if earliest <= start < until:
+                    yield epoch_us(start)
+            day += timedelta(days=1)
+
+    def parse(self, value):
+        """Epoch microseconds for a slot id on the grid; raises ValueError"""
+        start = datetime.fromisoformat(value)
+        if (start.second or start.microsecond or start.tzinfo is not None
+                or start.hour * 60 + start.minute not in self._offsets):
+            raise ValueError(value)
+        return epoch_us(start)
+
+    def end(self, start):
+        return start + self.slot_minutes * 60_000_000
+
+    def pickup_window(self, now):
+        earliest = now + self.lead
+        return earliest, earliest + timedelta(days=self.horizon_days)
+
+    def delivery_window(self, pickup, turnaround_hours):
+        earliest = local_datetime(self.end(pickup)) + timedelta(hours=turnaround_hours)
+        return earliest, earliest + timedelta(days=self.horizon_days)
+
+    # =============== AVAILABILITY ===============
+
+    def available(self, kind, earliest, until):
+        """[(start, places left)] for the open windows in the range"""
+        starts = list(self.starts(earliest, until))
+        usage = self.storage.slot_usage(kind, starts)
+        capacity = self.capacity[kind]
+        return [(start, capacity - usage.get(start, 0)) for start in starts
+                if usage.get(start, 0) < capacity]
+
+    def describe(self, start, remaining):
+        return {'id': slot_id(start), 'start': us_to_minutes(start),
+                'end': us_to_minutes(self.end(start)), 'remaining': remaining}
+
+    def _pick(self, kind, requested, earliest, until):
+        """The requested window if it is on offer, else the first open one"""
+        if requested is None:
+            open_slots = self.available(kind, earliest, until)
+            if not open_slots:
+                raise SlotError(f'No {kind} slots available', 409)
+            return open_slots[0][0]
+
+        try:
+            start = self.parse(requested)
+        except (TypeError, ValueError):
+            raise SlotError(f'Invalid {kind} slot')
+        if not epoch_us(earliest) <= start < epoch_us(until):
+            raise SlotError(f'The {kind} slot is not available')
+        return start
+
+    def plan(self, turnaround_hours, pickup=None, delivery=None, now=None):
+        """(pickup start, delivery start) for an order; raises SlotError
+
+        Windows the customer didn't choose are filled with the earliest
+        open ones. Whether a chosen window still has room is only known
+        when storage takes the place, which raises SlotUnavailable.
+        """
+        pickup_start = self._pick(PICKUP, pickup, *self.pickup_window(now or datetime.now()))
+        delivery_start = self._pick(DELIVERY, delivery, *self.delivery_window(pickup_start, turnaround_hours))
+        return pickup_start, delivery_start
+
+    def reservations(self, pickup_start, delivery_start):
+        return [(PICKUP, pickup_start, self.capacity[PICKUP]),
+                (DELIVERY, delivery_start, self.capacity[DELIVERY])]
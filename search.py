@@ -0,0 +1,231 @@
+import re
+import threading
+from bisect import bisect_left, insort
+
+# Words are runs of letters/digits; Devanagari vowel signs count as letters
+TOKEN_RE = re.compile(r'[\wऀ-ॿ]+')
+
+# Field weights: an item's own label counts most, shared service copy least
+LABEL, SERVICE_NAME, SERVICE_TEXT = 3.0, 2.0, 1.0
+# Score multipliers by how a query word matched an indexed word
+EXACT, PREFIX, FUZZY = 1.0, 0.7, 0.5
+
+MIN_PREFIX_LEN = 2
+MIN_FUZZY_LEN = 4
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def _deletes(term):
+    """Every way to drop one character from term (its one-edit neighbourhood)"""
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+
+def _within_one_edit(a, b):
+    """True if a and b differ by one insert, delete, substitution or swap"""
+    if a == b:
+        return True
+    la, lb = len(a), len(b)
+    if abs(la - lb) > 1:
+        return False
+    if la > lb:
+        a, b, la, lb = b, a, lb, la
+    i = 0
+    while i < la and a[i] == b[i]:
+        i += 1
+    if la == lb:
+        return a[i + 1:] == b[i + 1:] or (
+            i + 1 < la and a[i] == b[i + 1] and a[i + 1] == b[i] and a[i + 2:] == b[i + 2:])
+    return a[i:] == b[i + 1:]
+
+
+def catalog_documents(services, english_services=None):
+    """One search document per item (option), carrying its service's text too
+
+    With ``english_services`` (the same catalog untranslated) the English
+    words are indexed as well, so English queries work in every language.
+    """
+    english = {service['id']: service for service in english_services or ()}
+    for service in services:
+        sources = [service]
+        if service['id'] in english and english[service['id']] is not service:
+            sources.append(english[service['id']])
+
+        service_fields = []
+        for source in sources:
+            service_fields.append((source['name'], SERVICE_NAME))
+            for field in ('description', 'tagline'):
+                if source.get(field):
+                    service_fields.append((source[field], SERVICE_TEXT))
+            for perk in source.get('perks', ()):
+                service_fields.append((perk['text'] if isinstance(perk, dict) else perk, SERVICE_TEXT))
+
+        english_options = {option['id']: option for option in english.get(service['id'], {}).get('options', ())}
+        for option in service['options']:
+            fields = [(option['label'], LABEL)] + service_fields
+            if option['id'] in english_options and english_options[option['id']] is not option:
+                fields.append((english_options[option['id']]['label'], LABEL))
+            yield {
+                'id': option['id'],
+                'label': option['label'],
+                'price': option['price'],
+                'emoji': option['emoji'],
+                'service_id': service['id'],
+                'service_name': service['name'],
+                'category': service['category'],
+                'fields': tuple(fields),
+            }
+
+
+class SearchIndex:
+    """Inverted index over catalog items with prefix and one-typo matching
+
+    Documents can be added and removed one at a time, so ``sync`` only
+    re-indexes the items that changed between two catalog versions.
+    """
+
+    def __init__(self, documents=()):
+        self._lock = threading.Lock()
+        self._docs = {}      # doc id -> document
+        self._order = {}     # doc id -> position in the catalog, for stable browsing
+        self._postings = {}  # term -> {doc id: best field weight}
+        self._terms = []     # sorted postings keys, for prefix ranges
+        self._deletes = {}   # one-char deletion of a term -> terms
+        self.sync(documents)
+
+    def __len__(self):
+        return len(self._docs)
+
+    # =============== INDEXING ===============
+
+    @staticmethod
+    def _doc_terms(doc):
+        terms = {}
+        for text, weight in doc['fields']:
+            for term in tokenize(text):
+                if weight > terms.get(term, 0):
+                    terms[term] = weight
+        return terms
+
+    def _add(self, doc):
+        self._docs[doc['id']] = doc
+        for term, weight in self._doc_terms(doc).items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                insort(self._terms, term)
+                if len(term) >= MIN_FUZZY_LEN - 1:
+                    for variant in _deletes(term) | {term}:
+                        self._deletes.setdefault(variant, set()).add(term)
+            postings[doc['id']] = weight
+
+    def _remove(self, doc_id):
+        doc = self._docs.pop(doc_id)
+        for term in self._doc_terms(doc):
+            postings = self._postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+                del self._terms[bisect_left(self._terms, term)]
+                if len(term) >= MIN_FUZZY_LEN - 1:
+                    for variant in _deletes(term) | {term}:
+                        terms = self._deletes[variant]
+                        terms.discard(term)
+                        if not terms:
+                            del self._deletes[variant]
+
+    def sync(self, documents):
+        """Make the index hold exactly these documents; returns (added, removed) counts"""
+        documents = list(documents)
+        wanted = {doc['id']: doc for doc in documents}
+        with self._lock:
+            removed = [doc_id for doc_id, doc in self._docs.items() if wanted.get(doc_id) != doc]
+            for doc_id in removed:
+                self._remove(doc_id)
+            added = [doc for doc_id, doc in wanted.items() if doc_id not in self._docs]
+            for doc in added:
+                self._add(doc)
+            self._order = {doc['id']: i for i, doc in enumerate(documents)}
+        return len(added), len(removed)
+
+    # =============== QUERIES ===============
+
+    def _matches(self, word, allow_prefix):
+        """{indexed term: multiplier} for one query word"""
+        found = {}
+        if word in self._postings:
+            found[word] = EXACT
+
+        if allow_prefix and len(word) >= MIN_PREFIX_LEN:
+            i = bisect_left(self._terms, word)
+            while i < len(self._terms) and self._terms[i].startswith(word):
+                found.setdefault(self._terms[i], PREFIX)
+                i += 1
+
+        # Typos are only considered for words that match nothing as typed
+        if not found and len(word) >= MIN_FUZZY_LEN:
+            candidates = set()
+            for variant in _deletes(word) | {word}:
+                candidates |= self._deletes.get(variant, set())
+            for term in candidates:
+                if _within_one_edit(word, term):
+                    found[term] = FUZZY
+        return found
+
+    def _word_scores(self, word, allow_prefix):
+        """{doc id: best score} for one query word"""
+        scores = {}
+        for term, multiplier in self._matches(word, allow_prefix).items():
+            for doc_id, weight in self._postings[term].items():
+                score = weight * multiplier
+                if score > scores.get(doc_id, 0):
+                    scores[doc_id] = score
+        return scores
+
+    def search(self, query='', category=None, min_price=None, max_price=None, limit=20, offset=0):
+        """Ranked items matching every query word and the filters
+
+        Every word may match exactly, as a prefix (the last word only) or,
+        failing both, with one typo. An empty
+        query lists the filtered items in catalog order. Returns
+        (hits, total) where hits are the ``limit`` results after ``offset``.
+        """
+        words = tokenize(query)
+        with self._lock:
+            if words:
+                scores = None
+                for i, word in enumerate(words):
+                    # Only the last word is still being typed, the others are whole words
+                    word_scores = self._word_scores(word, allow_prefix=(i == len(words) - 1))
+                    if scores is None:
+                        scores = word_scores
+                    else:
+                        scores = {doc_id: score + word_scores[doc_id]
+                                  for doc_id, score in scores.items() if doc_id in word_scores}
+                    if not scores:
+                        break
+            else:
+                scores = dict.fromkeys(self._docs, 0.0)
+
+            hits = []
+            for doc_id, score in scores.items():
+                doc = self._docs[doc_id]
+                if category is not None and doc['category'] != category:
+                    continue
+                if min_price is not None and doc['price'] < min_price:
+                    continue
+                if max_price is not None and doc['price'] > max_price:
+                    continue
+                hits.append((-score, self._order.get(doc_id, 0), doc))
+
+        hits.sort(key=lambda hit: hit[:2])
+        page = hits[offset:offset + limit]
+        return [self._hit(doc, -neg_score) for neg_score, _, doc in page], len(hits)
+
+    @staticmethod
+    def _hit(doc, score):
+        hit = {key: value for key, value in doc.items() if key != 'fields'}
+        hit['score'] = round(score, 3)
+        return hit
@@ -0,0 +1,57 @@
+import { useEffect, useRef } from "react";
+import api from "../api";
+
+const RECONNECT_MS = 3000;
+
+// Live order changes from /api/orders/stream (server-sent events).
+// handlers: { created(event), status(event), resync() }
+export default function useOrderEvents(handlers) {
+  const handlersRef = useRef(handlers);
+  handlersRef.current = handlers;
+
+  useEffect(() => {
+    const authData = localStorage.getItem("auth");
+    const token = authData ? JSON.parse(authData).token : null;
+    if (!token || typeof EventSource === "undefined") return;
+
+    let source = null;
+    let timer = null;
+    let stopped = false;
+
+    // EventSource can't send headers, so each connection gets a short-lived,
+    // stream-only ticket for the query string instead of the access token.
+    // Tickets expire, so a dropped stream reconnects with a fresh one rather
+    // than letting EventSource retry the old URL.
+    const connect = async () => {
+      let ticket;
+      try {
+        const { data } = await api.post("/orders/stream/ticket");
+        ticket = data.ticket;
+      } catch {
+        if (!stopped) timer = setTimeout(connect, RECONNECT_MS);
+        return;
+      }
+      if (stopped) return;
+
+      source = new EventSource(
+        `${api.defaults.baseURL}/orders/stream?ticket=${encodeURIComponent(ticket)}`
+      );
+      for (const type of ["created", "status", "resync"]) {
+        source.addEventListener(type, (e) => {
+          handlersRef.current[type]?.(JSON.parse(e.data));
+        });
+      }
+      source.onerror = () => {
+        source.close();
+        if (!stopped) timer = setTimeout(connect, RECONNECT_MS);
+      };
+    };
+
+    connect();
+    return () => {
+      stopped = true;
+      clearTimeout(timer);
+      source?.close();
+    };
+  }, []);
+}
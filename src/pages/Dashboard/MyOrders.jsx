@@ -1,27 +1,39 @@
 import React, { useEffect, useState } from "react";
 import api from "../../api";
 import toast, { Toaster } from "react-hot-toast";
+import useOrderEvents from "../../hooks/useOrderEvents";
 
 export default function MyOrders() {
   const [orders, setOrders] = useState([]);
   const [loading, setLoading] = useState(true);
 
+  const fetchOrders = async () => {
+    try {
+      setLoading(true);
+      const res = await api.get("/orders/my"); // ✅ backend endpoint
+      setOrders(res.data || []);
+    } catch (err) {
+      console.error(err);
+      toast.error("Failed to load orders");
+    } finally {
+      setLoading(false);
+    }
+  };
+
   useEffect(() => {
-    const fetchOrders = async () => {
-      try {
-        setLoading(true);
-        const res = await api.get("/orders/my"); // ✅ backend endpoint
-        setOrders(res.data || []);
-      } catch (err) {
-        console.error(err);
-        toast.error("Failed to load orders");
-      } finally {
-        setLoading(false);
-      }
-    };
     fetchOrders();
   }, []);
 
+  // Status changes are pushed by the server instead of re-fetching the list
+  useOrderEvents({
+    created: () => fetchOrders(),
+    status: (e) =>
+      setOrders((prev) =>
+        prev.map((o) => (o._id === e.order_id ? { ...o, status: e.status } : o))
+      ),
+    resync: () => fetchOrders(),
+  });
+
   if (loading)
     return (
       <div className="text-center text-gray-500 dark:text-gray-400 py-10">
@@ -1,25 +1,37 @@
 import React, { useState, useEffect } from "react";
 import api from "../../api";
 import toast from "react-hot-toast";
+import useOrderEvents from "../../hooks/useOrderEvents";
 
 export default function TrackOrder() {
   const [orders, setOrders] = useState([]);
   const [selectedOrder, setSelectedOrder] = useState(null);
 
+  const fetchOrders = async () => {
+    try {
+      const res = await api.get("/orders/my");
+      setOrders(res.data);
+    } catch (err) {
+      console.error(err);
+      toast.error("Failed to fetch orders");
+    }
+  };
+
   useEffect(() => {
-    const fetchOrders = async () => {
-      try {
-        const res = await api.get("/orders/my");
-        setOrders(res.data);
-      } catch (err) {
-        console.error(err);
-        toast.error("Failed to fetch orders");
-      }
-    };
     fetchOrders();
   }, []);
 
-  const orderStatus = selectedOrder?.status;
+  useOrderEvents({
+    created: () => fetchOrders(),
+    status: (e) =>
+      setOrders((prev) =>
+        prev.map((o) => (o._id === e.order_id ? { ...o, status: e.status } : o))
+      ),
+    resync: () => fetchOrders(),
+  });
+
+  // Follow live updates to the selected order
+  const orderStatus = orders.find((o) => o._id === selectedOrder?._id)?.status;
 
   return (
     <div>
@@ -23,11 +23,12 @@ export default function Services() {
   const categories = useSelector(selectCategories);
   const activeCategory = useSelector(selectActiveCategory);
   const status = useSelector(selectServicesStatus);
+  const language = useSelector((state) => state.language.language || "en");
 
-  // Fetch services from backend on mount
+  // Fetch services from backend on mount and when the language changes
   useEffect(() => {
-    dispatch(fetchServices());
-  }, [dispatch]);
+    dispatch(fetchServices(language));
+  }, [dispatch, language]);
 
   // Loading / Error handling
   if (status === "loading") {
@@ -1,9 +1,9 @@
 import { createSlice, createAsyncThunk } from "@reduxjs/toolkit";
 import api from "../api";
 
-// Fetch services from backend
-export const fetchServices = createAsyncThunk("services/fetch", async () => {
-  const res = await api.get("/services/");
+// Fetch services from backend, already translated into `lang`
+export const fetchServices = createAsyncThunk("services/fetch", async (lang) => {
+  const res = await api.get("/services/", { params: lang ? { lang } : undefined });
   return res.data;
 });
 
@@ -0,0 +1,1128 @@
+import atexit
+import math
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from analytics import OrderStats, day_start, oldest_day, order_rows, recompute, status_rows
+from cart import Cart, CartChanged, CartTable, same_cart
+from contact import CONTACT_DEDUPE_WINDOW
+from idempotency import IdempotencyCache
+from models import ContactMessage, Order, User, dumps, iso_to_us, loads
+from order_store import OrderStore
+from otp_store import ShardedOTPStore
+from periodic import PeriodicTask
+from ratelimit import MemoryBuckets, refill, retry_after
+from scheduling import SlotBook, SlotUnavailable
+from wal import WriteAheadLog, load_snapshot, write_snapshot
+
+
+# Slot counters are kept a day past their start, then dropped
+SLOT_RETENTION = 86400
+# memory:// only keeps this many of the newest contact messages (see ContactIntake's archive)
+CONTACT_MEMORY_LIMIT = 10000
+
+
+def _epoch_filters(filters):
+    """OrderStore compares epoch microseconds, callers pass ISO since/until"""
+    return {name: iso_to_us(value) if name in ('since', 'until') and value is not None else value
+            for name, value in filters.items()}
+
+
+# =============== IN-MEMORY BACKEND ===============
+
+class MemoryStorage:
+    """Process-local storage, the same behaviour as the old module-level dicts
+
+    Each gunicorn worker gets its own copy and everything is lost on restart.
+    Safe to share between a worker's threads: carts and OTPs are sharded by
+    key with a lock per shard, and orders and slots change under one lock.
+    """
+
+    # Calls never wait on I/O, so async callers can run them inline
+    blocking = False
+    # Nothing survives a restart
+    durable = False
+
+    def __init__(self, contact_limit=CONTACT_MEMORY_LIMIT):
+        self.users = {}
+        self.carts = CartTable(on_change=self._cart_changed)
+        self.orders = OrderStore()
+        self.otps = ShardedOTPStore()
+        self.buckets = MemoryBuckets()
+        self.idempotency = IdempotencyCache()
+        self.slots = SlotBook()
+        self.order_stats = OrderStats()
+        self.contact_messages = {}  # id -> ContactMessage, oldest first
+        self.contact_limit = contact_limit  # None keeps every message
+        self._contact_seen = {}     # fingerprint -> created of its latest stored copy
+        self._undigested = deque()  # ids of messages not yet sent in a digest, oldest first
+        self._contact_lock = threading.Lock()
+        # OrderStore's indexes aren't safe to mutate from several threads at once
+        self._orders_lock = threading.RLock()
+
+    # Users
+    def get_user(self, user_id):
+        return self.users.get(user_id)
+
+    def save_user(self, user):
+        self.users[user.id] = user
+
+    # Carts
+    def get_cart(self, user_id):
+        return self.carts.get(user_id)
+
+    def save_cart(self, user_id, cart):
+        self.carts.set(user_id, cart)
+
+    def update_cart(self, user_id, mutate, create=True):
+        """Read-modify-write a cart atomically; see ``CartTable.update``"""
+        return self.carts.update(user_id, mutate, create)
+
+    def _cart_changed(self, user_id, cart):
+        """Called after every cart write, with the cart's shard lock held"""
+
+    def _order_placed(self, order, reservations):
+        """Called by place_order with the orders lock and the user's cart shard lock held"""
+
+    # Orders
+    def add_order(self, order):
+        """Raises ValueError if the order id is already taken"""
+        with self._orders_lock:
+            self.orders.add(order)
+            self.order_stats.add(order)
+        return order
+
+    def add_orders(self, orders):
+        with self._orders_lock:
+            for order in orders:
+                self.orders.add(order)
+                self.order_stats.add(order)
+
+    def place_order(self, order, reservations=(), cart=None):
+        """Take the order's slot places, add it and empty its user's cart as one step
+
+        ``reservations`` are (kind, slot start, capacity); raises
+        SlotUnavailable if one is full, ValueError on a duplicate id. When
+        the order was priced from the stored ``cart``, raises CartChanged
+        if that cart was edited since, rather than empty it unordered.
+        """
+        with self._orders_lock, self.carts.holding(order.user_id):
+            if cart is not None and not same_cart(self.carts.get(order.user_id), cart):
+                raise CartChanged()
+            self.slots.reserve(reservations)
+            try:
+                self.orders.add(order)
+            except ValueError:
+                self.slots.release(reservations)
+                raise
+            self.order_stats.add(order)
+            # The order's own record covers the emptied cart
+            self.carts.put(order.user_id, Cart())
+            self._order_placed(order, reservations)
+        return order
+
+    def get_order(self, order_id):
+        return self.orders.get(order_id)
+
+    def set_order_status(self, order_id, status):
+        with self._orders_lock:
+            order = self.orders.get(order_id)
+            if order is None:
+                return None
+            old_status = order.status
+            self.orders.set_status(order_id, status)
+            self.order_stats.move(order, old_status)
+        return order
+
+    def page_orders(self, limit=None, after=None):
+        with self._orders_lock:
+            return self.orders.page_all(limit, after)
+
+    def page_user_orders(self, user_id, limit=None, after=None):
+        with self._orders_lock:
+            return self.orders.page_for_user(user_id, limit, after)
+
+    def iter_orders(self, batch_size=500, **filters):
+        """Orders matching the filters (status, user_id, since, until), oldest first
+
+        The lock is only held for one batch at a time, so a long export
+        doesn't stall checkouts.
+        """
+        filters = _epoch_filters(filters)
+        after = None
+        while True:
+            with self._orders_lock:
+                orders, after = self.orders.scan(after=after, limit=batch_size, **filters)
+            yield from orders
+            if after is None:
+                return
+
+    def set_orders_status(self, new_status, order_ids=None, **filters):
+        """Set the status of every order in order_ids and/or matching the filters
+
+        Returns the updated orders; ids that don't exist or don't pass the
+        filters are left alone.
+        """
+        filters = _epoch_filters(filters)
+        with self._orders_lock:
+            if order_ids is not None:
+                orders = [order for order in map(self.orders.get, dict.fromkeys(order_ids))
+                          if order is not None and self.orders.matches(order, **filters)]
+            else:
+                orders, _ = self.orders.scan(**filters)
+            for order in orders:
+                old_status, order.status = order.status, new_status
+                self.order_stats.move(order, old_status)
+        return orders
+
+    # Order analytics
+    def query_order_stats(self, first_day, last_day):
+        """Per-day counters between two day ordinals; see ``analytics.OrderStats.query``"""
+        with self._orders_lock:
+            return self.order_stats.query(first_day, last_day)
+
+    def rebuild_order_stats(self):
+        """Recount the analytics counters from every order; returns the orders counted"""
+        since = day_start(oldest_day(self.order_stats.retention_days))
+        with self._orders_lock:
+            orders, _ = self.orders.scan(since=since)
+            self.order_stats.replace(recompute(orders))
+        return len(orders)
+
+    # Delivery slots
+    def slot_usage(self, kind, starts):
+        """{slot start: places taken} for the given slot starts"""
+        return self.slots.usage(kind, starts)
+
+    # Contact messages
+    def add_contact_messages(self, messages, window=CONTACT_DEDUPE_WINDOW):
+        """Store messages, skipping repeats of one stored in the last ``window`` seconds
+
+        Returns the messages actually stored.
+        """
+        stored = []
+        with self._contact_lock:
+            for message in messages:
+                seen = self._contact_seen.get(message.fingerprint)
+                if seen is not None and message.created - seen < window * 1_000_000:
+                    continue
+                self._contact_seen[message.fingerprint] = message.created
+                self.contact_messages[message.id] = message
+                self._undigested.append(message.id)
+                stored.append(message)
+            if self.contact_limit is not None:
+                while len(self.contact_messages) > self.contact_limit:
+                    # Both are oldest first, so an undigested oldest message heads the queue
+                    oldest = next(iter(self.contact_messages))
+                    del self.contact_messages[oldest]
+                    if self._undigested and self._undigested[0] == oldest:
+                        self._undigested.popleft()
+        return stored
+
+    def claim_contact_digest(self, limit=500):
+        """Up to ``limit`` messages not yet in a digest, oldest first, now marked as sent"""
+        with self._contact_lock:
+            messages = [self.contact_messages[self._undigested.popleft()]
+                        for _ in range(min(limit, len(self._undigested)))]
+        return messages
+
+    def iter_contact_messages(self):
+        """Stored contact messages, oldest first"""
+        with self._contact_lock:
+            messages = list(self.contact_messages.values())
+        yield from messages
+
+    # Idempotency keys
+    def claim_idempotency_key(self, key, fingerprint):
+        """None if the key is newly claimed, else its record (body None while pending)"""
+        return self.idempotency.claim(key, fingerprint)
+
+    def complete_idempotency_key(self, key, status_code, body):
+        self.idempotency.complete(key, status_code, body)
+
+    def release_idempotency_key(self, key):
+        self.idempotency.release(key)
+
+    # OTPs
+    def get_otp(self, key):
+        """The live OTP record for a key; expired records read as None"""
+        return self.otps.get(key)
+
+    def set_otp(self, key, record):
+        """Store ``{'otp': ..., 'expires': epoch seconds}`` for a key"""
+        self.otps.set(key, record)
+
+    def delete_otp(self, key):
+        self.otps.delete(key)
+
+    def purge_expired(self):
+        self.otps.purge()
+        self.idempotency.purge()
+        self.slots.purge(int((time.time() - SLOT_RETENTION) * 1_000_000))
+        with self._orders_lock:
+            self.order_stats.purge()
+        cutoff = int((time.time() - CONTACT_DEDUPE_WINDOW) * 1_000_000)
+        with self._contact_lock:
+            for fingerprint in [f for f, created in self._contact_seen.items() if created < cutoff]:
+                del self._contact_seen[fingerprint]
+
+
+# =============== DURABLE MEMORY BACKEND ===============
+
+class DurableMemoryStorage(MemoryStorage):
+    """MemoryStorage whose users, carts, orders, slot bookings and contact messages survive restarts
+
+    Every change is applied in memory and appended to a write-ahead log
+    under one lock (a cart's shard lock for cart edits), so the log order
+    is the order the changes happened in.
+    Logins, orders and status changes wait until their record is on disk
+    before returning; cart edits don't, so a crash can lose the last few
+    hundred milliseconds of cart taps. Every ``snapshot_interval`` seconds
+    (or ``snapshot_records`` records) the whole state is written out as a
+    snapshot and the log it covers is deleted. Startup loads the newest
+    snapshot and replays the log after it. OTPs, rate limits and
+    idempotency keys stay in memory only: they are short-lived anyway.
+    Analytics counters are recounted from the orders on startup.
+
+    The log belongs to one process, so run a single worker (add threads
+    for concurrency).
+    """
+
+    SNAPSHOT_VERSION = 1
+
+    # Orders and logins wait for an fsync
+    blocking = True
+    durable = True
+
+    def __init__(self, directory, fsync=True, snapshot_interval=300, snapshot_records=100_000):
+        # Every contact message is kept: snapshots are built from memory
+        super().__init__(contact_limit=None)
+        self.directory = directory
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_records = snapshot_records
+        self.wal = WriteAheadLog(directory, fsync=fsync)
+        # Held while a change is applied and logged, and while a snapshot is taken
+        self._log_lock = threading.RLock()
+        self._snapshot_lock = threading.Lock()
+        self._snapshot_lsn = 0
+        self._snapshot_time = time.monotonic()
+        self._snapshotter = PeriodicTask(self.snapshot_if_due, interval=min(snapshot_interval, 5),
+                                        name='wal-snapshotter', label='Snapshot')
+        self.recover()
+        atexit.register(self.wal.flush)
+
+    # =============== RECOVERY ===============
+
+    def recover(self):
+        """Load the newest snapshot and replay the log after it; returns the records replayed"""
+        lsn, state = load_snapshot(self.directory)
+        if state is not None:
+            self._load_state(state)
+        self._snapshot_lsn = lsn
+
+        replayed = 0
+        for _, payload in self.wal.replay(after_lsn=lsn):
+            self._apply(loads(payload))
+            replayed += 1
+        # Analytics counters aren't logged; they follow from the orders
+        self.rebuild_order_stats()
+        return replayed
+
+    def _apply(self, record):
+        kind = record[0]
+        if kind == 'cart':
+            self.carts.load([(record[1], Cart.from_row(record[2]))])
+        elif kind == 'place':
+            order = Order.from_row(record[1])
+            self.slots.reserve([(slot, start, math.inf) for slot, start in record[2]])
+            self.orders.add(order)
+            self.carts.load([(order.user_id, Cart())])
+        elif kind == 'status':
+            for order_id in record[2]:
+                self.orders.set_status(order_id, record[1])
+        elif kind == 'user':
+            user = User.from_row(record[1])
+            self.users[user.id] = user
+        elif kind == 'orders':
+            for row in record[1]:
+                self.orders.add(Order.from_row(row))
+        elif kind == 'contact':
+            for row in record[1]:
+                message = ContactMessage.from_row(row)
+                self.contact_messages[message.id] = message
+                self._contact_seen[message.fingerprint] = message.created
+                self._undigested.append(message.id)
+        elif kind == 'digested':
+            digested = set(record[1])
+            self._undigested = deque(message_id for message_id in self._undigested if message_id not in digested)
+
+    def _state(self):
+        return {
+            'version': self.SNAPSHOT_VERSION,
+            'users': [user.to_row() for user in self.users.values()],
+            'carts': [(user_id, cart.to_row()) for user_id, cart in self.carts.items()],
+            'orders': [order.to_row() for order in self.orders],
+            'slots': self.slots.counts(),
+            'contact_messages': [message.to_row() for message in self.contact_messages.values()],
+            'undigested': list(self._undigested),
+        }
+
+    def _load_state(self, state):
+        if state.get('version') != self.SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {state.get('version')}")
+        for row in state['users']:
+            user = User.from_row(row)
+            self.users[user.id] = user
+        self.carts.load((user_id, Cart.from_row(rows)) for user_id, rows in state['carts'])
+        for row in state['orders']:
+            self.orders.add(Order.from_row(row))
+        self.slots.restore(state['slots'])
+        for row in state.get('contact_messages', ()):
+            message = ContactMessage.from_row(row)
+            self.contact_messages[message.id] = message
+            self._contact_seen[message.fingerprint] = max(message.created,
+                                                          self._contact_seen.get(message.fingerprint, 0))
+        self._undigested = deque(state.get('undigested', ()))
+
+    # =============== SNAPSHOTS ===============
+
+    def snapshot(self):
+        """Write the whole state as a snapshot and drop the log it covers; returns its size"""
+        with self._snapshot_lock:
+            with self._log_lock:
+                # Everything but cart edits is applied and logged under
+                # _log_lock, so that part of the state is exactly the log up
+                # to the rotation. Cart edits carry on, one shard lock at a
+                # time: a cart copied after an edit logged past the rotation
+                # is set to the same value again when the log is replayed.
+                lsn = self.wal.rotate()
+                state = self._state()
+            size = write_snapshot(self.directory, lsn, state)
+            self.wal.prune(lsn)
+            self._snapshot_lsn = lsn
+            self._snapshot_time = time.monotonic()
+        return size
+
+    def close(self):
+        self.wal.close()
+
+    def snapshot_if_due(self):
+        pending = self.wal.last_lsn - self._snapshot_lsn
+        if pending >= self.snapshot_records or (
+                pending and time.monotonic() - self._snapshot_time >= self.snapshot_interval):
+            self.snapshot()
+
+    def _log(self, record):
+        """Append a record; call with _log_lock held, wait on the LSN after releasing it"""
+        self._snapshotter.ensure_started()
+        return self.wal.append(dumps(record).encode())
+
+    # =============== WRITES ===============
+
+    def save_user(self, user):
+        with self._log_lock:
+            super().save_user(user)
+            lsn = self._log(('user', user.to_row()))
+        self.wal.wait(lsn)
+
+    def _cart_changed(self, user_id, cart):
+        # Logged under the cart's shard lock rather than _log_lock, so cart
+        # taps for different users don't queue behind each other
+        self._log(('cart', user_id, cart.to_row()))
+
+    def add_order(self, order):
+        with self._log_lock:
+            super().add_order(order)
+            lsn = self._log(('orders', [order.to_row()]))
+        self.wal.wait(lsn)
+        return order
+
+    def add_orders(self, orders):
+        orders = list(orders)
+        with self._log_lock:
+            try:
+                super().add_orders(orders)
+            finally:
+                # A duplicate id stops the batch part way; log what went in
+                added = [order.to_row() for order in orders if self.orders.get(order.id) is order]
+                lsn = self._log(('orders', added)) if added else None
+        if lsn is not None:
+            self.wal.wait(lsn)
+
+    def place_order(self, order, reservations=(), cart=None):
+        with self._log_lock:
+            super().place_order(order, reservations, cart)
+            # At or past the place record; only cart records can follow it
+            lsn = self.wal.last_lsn
+        self.wal.wait(lsn)
+        return order
+
+    def _order_placed(self, order, reservations):
+        # Logged before the cart's shard lock is released, so an edit to the
+        # emptied cart can't be logged ahead of the order that emptied it
+        self._log(('place', order.to_row(), [(kind, start) for kind, start, _ in reservations]))
+
+    def set_order_status(self, order_id, status):
+        with self._log_lock:
+            order = super().set_order_status(order_id, status)
+            if order is None:
+                return None
+            lsn = self._log(('status', status, [order_id]))
+        self.wal.wait(lsn)
+        return order
+
+    def add_contact_messages(self, messages, window=CONTACT_DEDUPE_WINDOW):
+        with self._log_lock:
+            stored = super().add_contact_messages(messages, window)
+            if not stored:
+                return stored
+            lsn = self._log(('contact', [message.to_row() for message in stored]))
+        self.wal.wait(lsn)
+        return stored
+
+    def claim_contact_digest(self, limit=500):
+        with self._log_lock:
+            messages = super().claim_contact_digest(limit)
+            if not messages:
+                return messages
+            lsn = self._log(('digested', [message.id for message in messages]))
+        self.wal.wait(lsn)
+        return messages
+
+    def set_orders_status(self, new_status, order_ids=None, **filters):
+        with self._log_lock:
+            orders = super().set_orders_status(new_status, order_ids, **filters)
+            if not orders:
+                return orders
+            lsn = self._log(('status', new_status, [order.id for order in orders]))
+        self.wal.wait(lsn)
+        return orders
+
+
+# =============== SQL BACKEND ===============
+
+class ConnectionPool:
+    """A fixed-size pool of DB-API connections, created on demand
+
+    Connections opened before a fork (say by a gunicorn master running with
+    --preload) belong to the parent: a child starts from an empty pool and
+    leaves the inherited ones alone, never using or closing them.
+    """
+
+    def __init__(self, connect, size=8, timeout=10):
+        self._connect = connect
+        self._size = size
+        self._timeout = timeout
+        self._inherited = []
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _reset(self):
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _after_fork(self):
+        self._inherited.append(self._idle)
+        self._reset()
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created < self._size:
+                self._created += 1
+                create = True
+            else:
+                create = False
+
+        if create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._idle.get(timeout=self._timeout)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for one transaction, committing on success"""
+        conn = self._acquire()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+# created is epoch microseconds, like models.Order, so ordering and date
+# filters don't shift with DST or the server's time zone
+ORDERS_COLUMNS = """
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created INTEGER NOT NULL,
+    data TEXT NOT NULL
+"""
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS carts (
+    user_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS orders ({ORDERS_COLUMNS});
+CREATE INDEX IF NOT EXISTS orders_user_created ON orders (user_id, created, id);
+CREATE INDEX IF NOT EXISTS orders_status_created ON orders (status, created, id);
+CREATE INDEX IF NOT EXISTS orders_created ON orders (created, id);
+CREATE TABLE IF NOT EXISTS otps (
+    key TEXT PRIMARY KEY,
+    expires REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS otps_expires ON otps (expires);
+CREATE TABLE IF NOT EXISTS rate_limits (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rate_limits_updated ON rate_limits (updated);
+CREATE TABLE IF NOT EXISTS admission_in_flight (
+    worker TEXT PRIMARY KEY,
+    in_flight INTEGER NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    created REAL NOT NULL,
+    status_code INTEGER,
+    body TEXT
+);
+CREATE INDEX IF NOT EXISTS idempotency_keys_created ON idempotency_keys (created);
+CREATE TABLE IF NOT EXISTS slot_reservations (
+    kind TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    used INTEGER NOT NULL,
+    PRIMARY KEY (kind, start)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS contact_messages (
+    id TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    created INTEGER NOT NULL,
+    digested INTEGER,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS contact_messages_fingerprint ON contact_messages (fingerprint, created);
+CREATE INDEX IF NOT EXISTS contact_messages_undigested ON contact_messages (digested, created);
+CREATE INDEX IF NOT EXISTS contact_messages_created ON contact_messages (created, id);
+CREATE TABLE IF NOT EXISTS order_stats (
+    day INTEGER NOT NULL,
+    dimension TEXT NOT NULL,
+    key TEXT NOT NULL,
+    orders INTEGER NOT NULL,
+    items INTEGER NOT NULL,
+    revenue INTEGER NOT NULL,
+    PRIMARY KEY (day, dimension, key)
+) WITHOUT ROWID;
+"""
+
+
+class SQLBuckets:
+    """Token buckets in a shared table, so limits hold across workers
+
+    The in-flight count for admission control is one row per worker. A
+    row stops counting ``lease`` seconds after its worker last touched it,
+    so a killed worker's requests don't hold slots forever.
+    """
+
+    blocking = True
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def take(self, key, rate, capacity, cost=1, now=None):
+        """Take ``cost`` tokens; returns 0 if allowed, else seconds to wait"""
+        now = time.time() if now is None else now
+        with self.pool.connection() as conn:
+            # Take the write lock up front so concurrent workers serialize
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT tokens, updated FROM rate_limits WHERE key = ?',
+                               (key,)).fetchone()
+            tokens = refill(*row, now, rate, capacity) if row else capacity
+
+            wait = 0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = retry_after(tokens, cost, rate)
+
+            conn.execute('INSERT OR REPLACE INTO rate_limits (key, tokens, updated) '
+                         'VALUES (?, ?, ?)', (key, tokens, now))
+        return wait
+
+    def enter(self, worker, limit, lease):
+        """Count one more request in flight for ``worker``, unless ``limit`` already are
+        across every live worker; False if full"""
+        now = time.time()
+        with self.pool.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            total = conn.execute('SELECT COALESCE(SUM(in_flight), 0) FROM admission_in_flight '
+                                 'WHERE expires > ?', (now,)).fetchone()[0]
+            if total >= limit:
+                return False
+            # A lapsed row starts over: its old count no longer counted anyway
+            conn.execute('INSERT INTO admission_in_flight (worker, in_flight, expires) VALUES (?, 1, ?) '
+                         'ON CONFLICT (worker) DO UPDATE SET expires = excluded.expires, '
+                         'in_flight = CASE WHEN expires > ? THEN in_flight + 1 ELSE 1 END',
+                         (worker, now + lease, now))
+        return True
+
+    def leave(self, worker, lease):
+        with self.pool.connection() as conn:
+            conn.execute('UPDATE admission_in_flight SET in_flight = MAX(0, in_flight - 1), expires = ? '
+                         'WHERE worker = ?', (time.time() + lease, worker))
+
+    def purge(self, idle_for=3600):
+        """Drop buckets untouched for ``idle_for`` seconds (long since refilled)"""
+        with self.pool.connection() as conn:
+            conn.execute('DELETE FROM rate_limits WHERE updated < ?',
+                         (time.time() - idle_for,))
+            conn.execute('DELETE FROM admission_in_flight WHERE expires < ?', (time.time(),))
+
+
+class SQLStorage:
+    """SQLite-backed storage shared by every worker pointing at the same file
+
+    All queries are parameterized, so sqlite3's per-connection statement
+    cache reuses the prepared statements across requests.
+    """
+
+    blocking = True
+    durable = True
+
+    def __init__(self, path, pool_size=8, idempotency_ttl=86400):
+        self.path = path
+        self.idempotency_ttl = idempotency_ttl
+        self.pool = ConnectionPool(self._connect, size=pool_size)
+        self._migrate_orders()
+        with self.pool.connection() as conn:
+            conn.executescript(SCHEMA)
+        self.buckets = SQLBuckets(self.pool)
+        self._backfill_order_stats()
+
+    def _migrate_orders(self):
+        # Databases from before orders were keyed on epoch microseconds keep
+        # a local-time created_at string; rebuild the table around created
+        with self.pool.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(orders)')}
+            if 'created_at' not in columns:
+                return
+            conn.execute(f'CREATE TABLE orders_migrated ({ORDERS_COLUMNS})')
+            conn.executemany('INSERT INTO orders_migrated (id, user_id, status, created, data) '
+                             'VALUES (?, ?, ?, ?, ?)',
+                             ((order_id, user_id, status, iso_to_us(created_at), data)
+                              for order_id, user_id, status, created_at, data in
+                              conn.execute('SELECT id, user_id, status, created_at, data FROM orders')))
+            conn.execute('DROP TABLE orders')
+            conn.execute('ALTER TABLE orders_migrated RENAME TO orders')
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False,
+                               cached_statements=256)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _get_json(self, sql, params):
+        with self.pool.connection() as conn:
+            row = conn.execute(sql, params).fetchone()
+        return loads(row[0]) if row else None
+
+    # Users
+    def get_user(self, user_id):
+        data = self._get_json('SELECT data FROM users WHERE id = ?', (user_id,))
+        return User.from_dict(data) if data is not None else None
+
+    def save_user(self, user):
+        with self.pool.connection() as conn:
+            conn.execute('INSERT OR REPLACE INTO users (id, data) VALUES (?, ?)',
+                         (user.id, dumps(user)))
+
+    # Carts
+    def get_cart(self, user_id):
+        data = self._get_json('SELECT data FROM carts WHERE user_id = ?', (user_id,))
+        return Cart.from_dict(data) if data is not None else None
+
+    def save_cart(self, user_id, cart):
+        with self.pool.connection() as conn:
+            conn.execute('INSERT OR REPLACE INTO carts (user_id, data) VALUES (?, ?)',
+                         (user_id, dumps(cart.to_dict())))
+
+    def update_cart(self, user_id, mutate, create=True):
+        """Read-modify-write a cart in one write transaction, so workers can't lose each other's edits"""
+        with self.pool.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT data FROM carts WHERE user_id = ?', (user_id,)).fetchone()
+            cart = Cart.from_dict(loads(row[0])) if row else (Cart() if create else None)
+            outcome = mutate(cart)
+            if outcome is None and cart is not None:
+                conn.execute('INSERT OR REPLACE INTO carts (user_id, data) VALUES (?, ?)',
+                             (user_id, dumps(cart.to_dict())))
+        return cart, outcome
+
+    # Orders
+    @staticmethod
+    def _order_row(order):
+        return (order.id, order.user_id, order.status, order.created, dumps(order))
+
+    def add_order(self, order):
+        """Raises ValueError if the order id is already taken"""
+        try:
+            with self.pool.connection() as conn:
+                conn.execute('INSERT INTO orders (id, user_id, status, created, data) '
+                             'VALUES (?, ?, ?, ?, ?)', self._order_row(order))
+                self._count_orders(conn, order_rows(order))
+        except sqlite3.IntegrityError:
+            raise ValueError(f"Duplicate order id {order.id}")
+        return order
+
+    def add_orders(self, orders):
+        """Bulk insert in a single transaction"""
+        orders = list(orders)
+        with self.pool.connection() as conn:
+            conn.executemany('INSERT INTO orders (id, user_id, status, created, data) '
+                             'VALUES (?, ?, ?, ?, ?)', map(self._order_row, orders))
+            self._count_orders(conn, [row for order in orders for row in order_rows(order)])
+
+    def place_order(self, order, reservations=(), cart=None):
+        """Take the order's slot places, insert it and empty its user's cart in one transaction
+
+        ``reservations`` are (kind, slot start, capacity); raises
+        SlotUnavailable if one is full, ValueError on a duplicate id, and
+        CartChanged if ``cart`` was priced and the stored cart has changed since.
+        """
+        try:
+            with self.pool.connection() as conn:
+                if cart is not None:
+                    conn.execute('BEGIN IMMEDIATE')
+                    row = conn.execute('SELECT data FROM carts WHERE user_id = ?',
+                                       (order.user_id,)).fetchone()
+                    if not same_cart(Cart.from_dict(loads(row[0])) if row else None, cart):
+                        raise CartChanged()
+                for kind, start, capacity in reservations:
+                    conn.execute('INSERT OR IGNORE INTO slot_reservations (kind, start, used) '
+                                 'VALUES (?, ?, 0)', (kind, start))
+                    # The conditional update holds the write lock, so two
+                    # workers can never both take the last place
+                    taken = conn.execute('UPDATE slot_reservations SET used = used + 1 '
+                                         'WHERE kind = ? AND start = ? AND used < ?',
+                                         (kind, start, capacity)).rowcount
+                    if not taken:
+                        raise SlotUnavailable(kind, start)
+                conn.execute('INSERT INTO orders (id, user_id, status, created, data) '
+                             'VALUES (?, ?, ?, ?, ?)', self._order_row(order))
+                conn.execute('INSERT OR REPLACE INTO carts (user_id, data) VALUES (?, ?)',
+                             (order.user_id, dumps(Cart().to_dict())))
+                self._count_orders(conn, order_rows(order))
+        except sqlite3.IntegrityError:
+            raise ValueError(f"Duplicate order id {order.id}")
+        return order
+
+    def get_order(self, order_id):
+        data = self._get_json('SELECT data FROM orders WHERE id = ?', (order_id,))
+        return Order.from_dict(data) if data is not None else None
+
+    def set_order_status(self, order_id, status):
+        with self.pool.connection() as conn:
+            # The old status is read in the same write transaction, for the analytics counters
+            conn.execute('BEGIN IMMEDIATE')
+            old = conn.execute('SELECT status FROM orders WHERE id = ?', (order_id,)).fetchone()
+            if old is None:
+                return None
+            row = conn.execute(
+                "UPDATE orders SET status = ?, data = json_set(data, '$.status', ?) "
+                "WHERE id = ? RETURNING data", (status, status, order_id)).fetchone()
+            order = Order.from_dict(loads(row[0]))
+            self._count_orders(conn, status_rows(order, old[0]))
+        return order
+
+    def _page(self, user_id, limit, after):
+        clauses, params = [], []
+        if user_id is not None:
+            clauses.append('user_id = ?')
+            params.append(user_id)
+
+        with self.pool.connection() as conn:
+            if after is not None:
+                row = conn.execute('SELECT user_id, created FROM orders WHERE id = ?',
+                                   (after,)).fetchone()
+                if row is None or (user_id is not None and row[0] != user_id):
+                    raise KeyError(after)
+                clauses.append('(created, id) > (?, ?)')
+                params.extend((row[1], after))
+
+            where = f"WHERE {' AND '.join(clauses)} " if clauses else ''
+            # Fetch one extra row to know whether there is a next page
+            params.append(-1 if limit is None else limit + 1)
+            rows = conn.execute(f'SELECT data FROM orders {where}'
+                                'ORDER BY created, id LIMIT ?', params).fetchall()
+
+        next_cursor = None
+        page = [Order.from_dict(loads(row[0])) for row in rows[:limit]]
+        if limit is not None and len(rows) > limit:
+            next_cursor = page[-1].id
+        return page, next_cursor
+
+    def page_orders(self, limit=None, after=None):
+        return self._page(None, limit, after)
+
+    def page_user_orders(self, user_id, limit=None, after=None):
+        return self._page(user_id, limit, after)
+
+    @staticmethod
+    def _order_filters(status=None, user_id=None, since=None, until=None):
+        """WHERE clauses and parameters for the filters; since/until are ISO strings"""
+        clauses, params = [], []
+        since, until = (iso_to_us(value) if value is not None else None for value in (since, until))
+        for clause, value in (('status = ?', status), ('user_id = ?', user_id),
+                              ('created >= ?', since), ('created < ?', until)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        return clauses, params
+
+    def iter_orders(self, batch_size=500, **filters):
+        """Orders matching the filters (status, user_id, since, until), oldest first
+
+        Reads by keyset in batches, returning the connection to the pool
+        between batches, so a slow consumer never pins one.
+        """
+        clauses, params = self._order_filters(**filters)
+        after = None
+        while True:
+            batch_clauses, batch_params = list(clauses), list(params)
+            if after is not None:
+                batch_clauses.append('(created, id) > (?, ?)')
+                batch_params.extend(after)
+            where = f"WHERE {' AND '.join(batch_clauses)} " if batch_clauses else ''
+            with self.pool.connection() as conn:
+                rows = conn.execute(f'SELECT created, id, data FROM orders {where}'
+                                    'ORDER BY created, id LIMIT ?',
+                                    (*batch_params, batch_size)).fetchall()
+            for row in rows:
+                yield Order.from_dict(loads(row[2]))
+            if len(rows) < batch_size:
+                return
+            after = rows[-1][:2]
+
+    def set_orders_status(self, new_status, order_ids=None, **filters):
+        """Set the status of every order in order_ids and/or matching the filters
+
+        Runs as one transaction and returns the updated orders, oldest first.
+        """
+        clauses, params = self._order_filters(**filters)
+        if order_ids is None:
+            batches = [(f"WHERE {' AND '.join(clauses)} " if clauses else '', params)]
+        else:
+            order_ids = list(dict.fromkeys(order_ids))
+            batches = []
+            for i in range(0, len(order_ids), 500):
+                chunk = order_ids[i:i + 500]
+                where = ' AND '.join(clauses + [f"id IN ({', '.join('?' * len(chunk))})"])
+                batches.append((f'WHERE {where} ', [*params, *chunk]))
+
+        sql = "UPDATE orders SET status = ?, data = json_set(data, '$.status', ?) "
+        rows, old_statuses = [], {}
+        with self.pool.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            for where, batch_params in batches:
+                old_statuses.update(conn.execute(f'SELECT id, status FROM orders {where}', batch_params))
+                rows += conn.execute(f'{sql}{where}RETURNING data',
+                                     (new_status, new_status, *batch_params)).fetchall()
+            orders = [Order.from_dict(loads(row[0])) for row in rows]
+            self._count_orders(conn, [row for order in orders
+                                      for row in status_rows(order, old_statuses[order.id])])
+        orders.sort(key=lambda order: (order.created, order.id))
+        return orders
+
+    # Order analytics
+    @staticmethod
+    def _count_orders(conn, rows):
+        """Add counter changes from analytics.order_rows/status_rows, inside the caller's transaction"""
+        oldest = oldest_day()
+        rows = [row for row in rows if row[0] >= oldest]
+        if rows:
+            conn.executemany('INSERT INTO order_stats (day, dimension, key, orders, items, revenue) '
+                             'VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (day, dimension, key) DO UPDATE '
+                             'SET orders = orders + excluded.orders, items = items + excluded.items, '
+                             'revenue = revenue + excluded.revenue', rows)
+
+    def query_order_stats(self, first_day, last_day):
+        """Per-day counters between two day ordinals, as (day, dimension, key, orders, items, revenue)"""
+        with self.pool.connection() as conn:
+            return conn.execute('SELECT day, dimension, key, orders, items, revenue FROM order_stats '
+                                'WHERE day BETWEEN ? AND ?', (first_day, last_day)).fetchall()
+
+    def _recount(self, conn):
+        orders = [Order.from_dict(loads(row[0])) for row in
+                  conn.execute('SELECT data FROM orders WHERE created >= ?', (day_start(oldest_day()),))]
+        conn.execute('DELETE FROM order_stats')
+        self._count_orders(conn, recompute(orders))
+        return len(orders)
+
+    def rebuild_order_stats(self):
+        """Recount the analytics counters from the orders in one write transaction
+
+        Checkouts wait for it to finish; returns the orders counted.
+        """
+        with self.pool.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            return self._recount(conn)
+
+    def _backfill_order_stats(self):
+        # Databases from before the counters existed get them on first start
+        with self.pool.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            if (conn.execute('SELECT 1 FROM order_stats LIMIT 1').fetchone() is None
+                    and conn.execute('SELECT 1 FROM orders LIMIT 1').fetchone() is not None):
+                self._recount(conn)
+
+    # Delivery slots
+    def slot_usage(self, kind, starts):
+        """{slot start: places taken} for the given slot starts"""
+        if not starts:
+            return {}
+        with self.pool.connection() as conn:
+            rows = conn.execute('SELECT start, used FROM slot_reservations '
+                                'WHERE kind = ? AND start BETWEEN ? AND ?',
+                                (kind, min(starts), max(starts))).fetchall()
+        return dict(rows)
+
+    # Contact messages
+    def add_contact_messages(self, messages, window=CONTACT_DEDUPE_WINDOW):
+        stored = []
+        with self.pool.connection() as conn:
+            # One writer at a time, so two workers can't both store the same repeat
+            conn.execute('BEGIN IMMEDIATE')
+            for message in messages:
+                cursor = conn.execute(
+                    'INSERT INTO contact_messages (id, fingerprint, created, data) '
+                    'SELECT ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM contact_messages '
+                    'WHERE fingerprint = ? AND created > ?)',
+                    (message.id, message.fingerprint, message.created, dumps(message.to_row()),
+                     message.fingerprint, message.created - window * 1_000_000))
+                if cursor.rowcount:
+                    stored.append(message)
+        return stored
+
+    def claim_contact_digest(self, limit=500):
+        with self.pool.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute('SELECT id, data FROM contact_messages WHERE digested IS NULL '
+                                'ORDER BY created LIMIT ?', (limit,)).fetchall()
+            conn.executemany('UPDATE contact_messages SET digested = ? WHERE id = ?',
+                             [(int(time.time() * 1_000_000), row[0]) for row in rows])
+        return [ContactMessage.from_row(loads(row[1])) for row in rows]
+
+    def iter_contact_messages(self, batch_size=500):
+        """Stored contact messages, oldest first, read by keyset in batches"""
+        after = (-1, '')
+        while True:
+            with self.pool.connection() as conn:
+                rows = conn.execute('SELECT created, id, data FROM contact_messages '
+                                    'WHERE (created, id) > (?, ?) ORDER BY created, id LIMIT ?',
+                                    (*after, batch_size)).fetchall()
+            for row in rows:
+                yield ContactMessage.from_row(loads(row[2]))
+            if len(rows) < batch_size:
+                return
+            after = rows[-1][:2]
+
+    # Idempotency keys
+    def claim_idempotency_key(self, key, fingerprint):
+        """None if the key is newly claimed, else its record (body None while pending)"""
+        now = time.time()
+        with self.pool.connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM idempotency_keys WHERE key = ? AND created <= ?',
+                         (key, now - self.idempotency_ttl))
+            claimed = conn.execute(
+                'INSERT OR IGNORE INTO idempotency_keys (key, fingerprint, created) VALUES (?, ?, ?)',
+                (key, fingerprint, now)).rowcount
+            if claimed:
+                return None
+            row = conn.execute('SELECT fingerprint, created, status_code, body '
+                               'FROM idempotency_keys WHERE key = ?', (key,)).fetchone()
+        return {'fingerprint': row[0], 'created': row[1], 'status_code': row[2],
+                'body': loads(row[3]) if row[3] is not None else None}
+
+    def complete_idempotency_key(self, key, status_code, body):
+        with self.pool.connection() as conn:
+            conn.execute('UPDATE idempotency_keys SET status_code = ?, body = ? WHERE key = ?',
+                         (status_code, dumps(body), key))
+
+    def release_idempotency_key(self, key):
+        with self.pool.connection() as conn:
+            conn.execute('DELETE FROM idempotency_keys WHERE key = ?', (key,))
+
+    # OTPs
+    def get_otp(self, key):
+        """The live OTP record for a key; expired records read as None"""
+        return self._get_json('SELECT data FROM otps WHERE key = ? AND expires > ?',
+                              (key, time.time()))
+
+    def set_otp(self, key, record):
+        with self.pool.connection() as conn:
+            conn.execute('INSERT OR REPLACE INTO otps (key, expires, data) VALUES (?, ?, ?)',
+                         (key, record['expires'], dumps(record)))
+
+    def delete_otp(self, key):
+        with self.pool.connection() as conn:
+            conn.execute('DELETE FROM otps WHERE key = ?', (key,))
+
+    def purge_expired(self):
+        with self.pool.connection() as conn:
+            conn.execute('DELETE FROM otps WHERE expires <= ?', (time.time(),))
+            conn.execute('DELETE FROM idempotency_keys WHERE created <= ?',
+                         (time.time() - self.idempotency_ttl,))
+            conn.execute('DELETE FROM slot_reservations WHERE start < ?',
+                         (int((time.time() - SLOT_RETENTION) * 1_000_000),))
+            conn.execute('DELETE FROM order_stats WHERE day < ?', (oldest_day(),))
+        self.buckets.purge()
+
+
+def create_storage(url, wal_fsync=True, snapshot_interval=300):
+    """Build a backend from a URL: ``memory://``, ``memory+wal:///path/to/dir`` or ``sqlite:///path/to.db``
+
+    ``wal_fsync`` and ``snapshot_interval`` only apply to ``memory+wal://``.
+    """
+    if not url or url == 'memory://':
+        return MemoryStorage()
+    if url.startswith('memory+wal:///'):
+        return DurableMemoryStorage(url[len('memory+wal:///'):], fsync=wal_fsync,
+                                    snapshot_interval=snapshot_interval)
+    if url.startswith('sqlite:///'):
+        return SQLStorage(url[len('sqlite:///'):])
+    raise ValueError(f"Unsupported storage URL: {url}")
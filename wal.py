@@ -0,0 +1,290 @@
+import os
+import pickle
+import struct
+import threading
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # no advisory locks on Windows; one process per directory is on the operator
+    fcntl = None
+
+# Every record is framed as <payload length><crc32 of payload><payload>
+FRAME = struct.Struct('<II')
+SNAPSHOT_MAGIC = b'LNDSNAP1'
+
+
+def _segment_name(first_lsn):
+    return f'wal-{first_lsn:020d}.log'
+
+
+def _snapshot_name(lsn):
+    return f'snapshot-{lsn:020d}.bin'
+
+
+def _files(directory, prefix, suffix):
+    """[(number, path)] for the numbered files in the directory, in order"""
+    found = []
+    for name in os.listdir(directory):
+        if name.startswith(prefix) and name.endswith(suffix):
+            try:
+                found.append((int(name[len(prefix):-len(suffix)]), os.path.join(directory, name)))
+            except ValueError:
+                continue
+    return sorted(found)
+
+
+def _fsync_dir(directory):
+    if hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+class WriteAheadLog:
+    """Append-only, group-committed log of opaque records
+
+    Records are numbered by a log sequence number (LSN) and written to
+    segment files named after their first LSN. ``append`` only queues a
+    record; one writer thread writes everything queued since its last
+    write in a single call and fsyncs once for the whole batch, so many
+    concurrent writers share one disk flush. ``wait`` blocks until a
+    record is on disk. Only one process may use a directory at a time.
+    """
+
+    def __init__(self, directory, fsync=True):
+        self.directory = directory
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock_file = open(os.path.join(directory, 'LOCK'), 'a')
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise RuntimeError(f'{directory} is in use by another process; the in-memory '
+                                   'backend with a WAL needs a single worker')
+        self._owner = os.getpid()
+
+        self._cond = threading.Condition()
+        self._pending = []  # frames, and ('rotate', first_lsn) markers
+        self._next_lsn = 1
+        self._durable_lsn = 0
+        self._error = None
+        self._file = None
+        self._segment = 1  # first LSN of the segment being appended to
+        self._writer_started = False
+        self._closed = False
+        self.stats = {'records': 0, 'batches': 0, 'bytes': 0}
+
+    # =============== RECOVERY ===============
+
+    def replay(self, after_lsn=0):
+        """Yield (lsn, payload) for every intact record after after_lsn, oldest first
+
+        A torn or corrupt record ends the log: it and anything after it in
+        that segment are cut off, since they were never acknowledged.
+        Consume it fully, once, before the first ``append``.
+        """
+        lsn = after_lsn
+        segments = _files(self.directory, 'wal-', '.log')
+        for i, (first_lsn, path) in enumerate(segments):
+            lsn = first_lsn - 1
+            good = 0
+            with open(path, 'rb') as f:
+                data = f.read()
+            while good + FRAME.size <= len(data):
+                size, crc = FRAME.unpack_from(data, good)
+                end = good + FRAME.size + size
+                payload = data[good + FRAME.size:end]
+                if end > len(data) or zlib.crc32(payload) != crc:
+                    break
+                lsn += 1
+                good = end
+                if lsn > after_lsn:
+                    yield lsn, payload
+
+            if good < len(data):
+                print(f"WAL: dropping {len(data) - good} bytes of torn log at the end of {path}")
+                with open(path, 'r+b') as f:
+                    f.truncate(good)
+                # Later segments can't follow a gap, so they go too
+                for _, later in segments[i + 1:]:
+                    os.remove(later)
+                del segments[i + 1:]
+                break
+
+        if lsn < after_lsn:  # the snapshot covers more than the log holds
+            lsn = after_lsn
+            self._segment = lsn + 1
+        else:
+            self._segment = segments[-1][0] if segments else lsn + 1
+        self._durable_lsn = lsn
+        self._next_lsn = lsn + 1
+
+    # =============== WRITING ===============
+
+    def append(self, payload):
+        """Queue a record; returns its LSN (pass it to ``wait`` for durability)"""
+        if os.getpid() != self._owner:
+            raise RuntimeError('The WAL was opened before a fork; the in-memory backend with a '
+                               'WAL needs a single worker')
+        frame = FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+        with self._cond:
+            if not self._writer_started:
+                self._start_writer()
+            lsn = self._next_lsn
+            self._next_lsn += 1
+            self._pending.append(frame)
+            self._cond.notify_all()
+        return lsn
+
+    def wait(self, lsn):
+        """Block until the record is on disk; raises if the writer failed"""
+        with self._cond:
+            while self._durable_lsn < lsn and self._error is None:
+                self._cond.wait()
+            if self._error is not None:
+                raise RuntimeError(f'WAL writer failed: {self._error}')
+
+    def flush(self):
+        """Wait for everything appended so far (a no-op in a forked child, which has no writer)"""
+        if os.getpid() != self._owner:
+            return
+        with self._cond:
+            last = self._next_lsn - 1
+        if last > self._durable_lsn:
+            self.wait(last)
+
+    def close(self):
+        """Flush, stop the writer and release the directory"""
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._file is not None:
+            self._file.close()
+        self._lock_file.close()
+
+    @property
+    def last_lsn(self):
+        return self._next_lsn - 1
+
+    def rotate(self):
+        """Start a new segment with the next record; returns the last LSN of the old one"""
+        with self._cond:
+            if not self._writer_started:
+                self._start_writer()
+            last = self._next_lsn - 1
+            marker = ('rotate', self._next_lsn)
+            self._pending.append(marker)
+            self._cond.notify_all()
+            while self._segment != marker[1] and self._error is None:
+                self._cond.wait()
+        return last
+
+    def prune(self, upto_lsn):
+        """Delete segments holding only records up to upto_lsn"""
+        segments = _files(self.directory, 'wal-', '.log')
+        for (first_lsn, path), (next_first, _) in zip(segments, segments[1:]):
+            if next_first - 1 <= upto_lsn:
+                os.remove(path)
+
+    def _start_writer(self):
+        self._writer_started = True
+        threading.Thread(target=self._run, name='wal-writer', daemon=True).start()
+
+    def _open_segment(self, first_lsn):
+        if self._file is not None:
+            self._file.close()
+        self._file = open(os.path.join(self.directory, _segment_name(first_lsn)), 'ab')
+        _fsync_dir(self.directory)
+        with self._cond:
+            self._segment = first_lsn
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                batch, self._pending = self._pending, []
+                last = self._next_lsn - 1
+
+            try:
+                frames = []
+                for item in batch:
+                    if isinstance(item, tuple):
+                        self._write(frames)
+                        frames = []
+                        self._open_segment(item[1])
+                    else:
+                        frames.append(item)
+                self._write(frames)
+            except Exception as e:
+                print(f"WAL write error: {e}")
+                with self._cond:
+                    self._error = e
+                    self._cond.notify_all()
+                return
+
+            with self._cond:
+                self._durable_lsn = last
+                self._cond.notify_all()
+
+    def _write(self, frames):
+        if not frames:
+            return
+        if self._file is None:
+            self._open_segment(self._segment)
+        data = b''.join(frames)
+        self._file.write(data)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self.stats['records'] += len(frames)
+        self.stats['batches'] += 1
+        self.stats['bytes'] += len(data)
+
+
+# =============== SNAPSHOTS ===============
+
+def write_snapshot(directory, lsn, state):
+    """Atomically write state as covering every record up to lsn; returns its size"""
+    payload = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+    path = os.path.join(directory, _snapshot_name(lsn))
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(SNAPSHOT_MAGIC + FRAME.pack(len(payload), zlib.crc32(payload)))
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _fsync_dir(directory)
+
+    for older, older_path in _files(directory, 'snapshot-', '.bin'):
+        if older < lsn:
+            os.remove(older_path)
+    return len(payload) + len(SNAPSHOT_MAGIC) + FRAME.size
+
+
+def load_snapshot(directory):
+    """(lsn, state) of the newest snapshot, or (0, None) if there is none"""
+    snapshots = _files(directory, 'snapshot-', '.bin')
+    if not snapshots:
+        return 0, None
+    lsn, path = snapshots[-1]
+    with open(path, 'rb') as f:
+        data = f.read()
+    header = len(SNAPSHOT_MAGIC) + FRAME.size
+    if not data.startswith(SNAPSHOT_MAGIC):
+        raise ValueError(f'{path} is not a snapshot')
+    size, crc = FRAME.unpack_from(data, len(SNAPSHOT_MAGIC))
+    payload = data[header:header + size]
+    if len(payload) != size or zlib.crc32(payload) != crc:
+        raise ValueError(f'{path} is corrupt')
+    return lsn, pickle.loads(payload)